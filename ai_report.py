@@ -0,0 +1,187 @@
+"""AI 綜合判讀報告：依訊號判讀結果組 prompt，在背景執行緒產生文字，不卡住頁面。
+
+- 結果依 (股票, 最後一根 K 棒, 訊號狀態, 策略均線) 快取在整個 process；
+  同樣的狀態不論幾個使用者、重跑幾次都只產生一次，產生中的請求也會合併。
+- 每小時的生成次數有上限 (STOCK_APP_AI_BUDGET)，用完、模型失敗、沒有設定模型或無法初始化時改用規則判讀的文字。
+- 模型：Gemini (google-generativeai，需要 GEMINI_API_KEY / GOOGLE_API_KEY) 或離線測試用的 stub (需明確指定)。
+
+環境變數：
+    STOCK_APP_AI_MODEL=stub         stub / gemini / none (預設：有 API key 用 gemini，否則不使用模型，直接顯示規則判讀)
+    STOCK_APP_AI_BUDGET=60          每小時最多生成幾次
+    STOCK_APP_AI_STUB_DELAY=1.0     stub 模型模擬的生成時間 (秒)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import core
+import perf
+import signals
+
+READY, PENDING, FALLBACK, RULES = "ready", "pending", "fallback", "rules"   # RULES：沒有設定模型，規則判讀就是正式結果
+
+GEMINI_MODEL = "gemini-1.5-flash"
+GENERATE_TIMEOUT = 30
+BUDGET = int(os.environ.get("STOCK_APP_AI_BUDGET", "60"))
+BUDGET_WINDOW = 3600
+REPORT_TTL = 6 * 3600          # 同一根 K 棒、同樣狀態的報告沿用多久
+FALLBACK_TTL = 60              # 額度用完 / 失敗時，規則文字先用這麼久再重試
+CACHE_SIZE = 256
+POLL_SECONDS = 2               # 頁面檢查報告是否完成的間隔
+STATE_FIELDS = ("trend", "volume", "macd", "rsi")
+
+logger = logging.getLogger(__name__)
+
+
+def build_prompt(ticker, states, fast, slow):
+    return (
+        f"你是台灣券商的資深技術分析師。請用繁體中文、3 到 4 句話，為 {ticker} 寫一段給散戶看的綜合判讀。\n"
+        f"- 趨勢：{states['trend']} (收盤價與 MA{fast} {states['ma_fast']:.2f} / MA{slow} {states['ma_slow']:.2f} 的排列)\n"
+        f"- 量能：{states['volume']} ({states['volume_ratio']:.1f} 倍均量)\n"
+        f"- MACD：{states['macd']} (MACD {states['macd_value']:.2f}，柱狀體 {states['hist']:+.2f})\n"
+        f"- RSI：{states['rsi']} ({states['rsi_value']:.1f})\n"
+        "只根據以上數據說明多空態勢與需要留意的風險，不要給出買賣建議或目標價。"
+    )
+
+
+# --- 模型 ---
+class StubModel:
+    """離線測試用：等待 delay 秒後依訊號狀態組出固定格式的文字。"""
+    name = "stub"
+
+    def __init__(self, delay=None):
+        self.delay = float(os.environ.get("STOCK_APP_AI_STUB_DELAY", "1.0")) if delay is None else delay
+
+    def generate(self, prompt, states):
+        if self.delay > 0: time.sleep(self.delay)
+        parts = [signals.TREND_DISPLAY[states["trend"]][0], signals.VOLUME_DISPLAY[states["volume"]][0],
+                 signals.MACD_DISPLAY[states["macd"]][0], signals.RSI_DISPLAY[states["rsi"]][0]]
+        return f"[stub] 趨勢{parts[0]}，量能{parts[1]}，MACD {parts[2]}，RSI {states['rsi_value']:.1f} {parts[3]}。"
+
+
+class GeminiModel:
+    name = "gemini"
+
+    def __init__(self, model=GEMINI_MODEL, api_key=None, timeout=GENERATE_TIMEOUT):
+        import google.generativeai as genai   # 只有實際使用 Gemini 時才需要這個套件
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY"))
+        self._model = genai.GenerativeModel(model)
+        self.timeout = timeout
+
+    def generate(self, prompt, states):
+        response = self._model.generate_content(prompt, request_options={"timeout": self.timeout})
+        return response.text.strip()
+
+
+def model_from_env():
+    """依環境變數建立模型；回傳 None 表示不使用模型 (ReportService 直接回傳規則判讀)。"""
+    has_key = bool(os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY"))
+    kind = os.environ.get("STOCK_APP_AI_MODEL", "gemini" if has_key else "none")
+    if kind == "none": return None
+    if kind == "stub": return StubModel()
+    if kind == "gemini": return GeminiModel()
+    raise ValueError(f"未知的 STOCK_APP_AI_MODEL: {kind}")
+
+
+# --- 快取與背景生成 ---
+class ReportService:
+    def __init__(self, model, budget=BUDGET, window=BUDGET_WINDOW, ttl=REPORT_TTL, workers=2):
+        self.model, self.budget, self.window, self.ttl = model, budget, window, ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()         # key -> (到期時間, 狀態, 文字)
+        self._pending = {}                  # key -> Future
+        self._spent = deque()               # 最近 window 秒內每次生成的時間
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-report")
+        self.generated = 0
+        self.failures = 0
+        self.init_failed = False            # 有設定模型但初始化失敗 (算是錯誤，頁面會顯示提示)
+
+    @staticmethod
+    def key(ticker, last_bar, states, fast, slow):
+        return (ticker, str(last_bar), tuple(states[f] for f in STATE_FIELDS), fast, slow)
+
+    def budget_left(self):
+        with self._lock: return self._budget_left(time.monotonic())
+
+    def _budget_left(self, now):
+        while self._spent and now - self._spent[0] > self.window: self._spent.popleft()
+        return self.budget - len(self._spent)
+
+    def get(self, ticker, last_bar, states, fast, slow):
+        """(狀態, 文字)：READY / FALLBACK / RULES 時文字可直接顯示；PENDING 表示背景生成中，稍後再查。
+
+        FALLBACK 表示模型失敗、無法初始化或額度用完；RULES 表示沒有設定模型，不是錯誤。
+        """
+        if self.model is None: return (FALLBACK if self.init_failed else RULES), core.summary_text(ticker, states)
+        key = self.key(ticker, last_bar, states, fast, slow)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(key)
+                perf.cache_lookup("ai_report", True)
+                return entry[1], entry[2]
+            perf.cache_lookup("ai_report", False)
+            if key in self._pending: return PENDING, None
+            if self._budget_left(now) <= 0:
+                text = core.summary_text(ticker, states)
+                self._store(key, FALLBACK, text, now + FALLBACK_TTL)
+                return FALLBACK, text
+            self._spent.append(now)
+            prompt = build_prompt(ticker, states, fast, slow)
+            self._pending[key] = self._executor.submit(self._generate, key, ticker, prompt, dict(states))
+        return PENDING, None
+
+    def _generate(self, key, ticker, prompt, states):
+        try:
+            with perf.stage("ai.generate"): text = self.model.generate(prompt, states)
+            status, expires = READY, time.monotonic() + self.ttl
+            with self._lock: self.generated += 1
+        except Exception:
+            logger.exception("%s AI 報告產生失敗", ticker)
+            text, status, expires = core.summary_text(ticker, states), FALLBACK, time.monotonic() + FALLBACK_TTL
+            with self._lock: self.failures += 1
+        with self._lock:
+            self._store(key, status, text, expires)
+            self._pending.pop(key, None)
+
+    def _store(self, key, status, text, expires):
+        self._cache[key] = (expires, status, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > CACHE_SIZE: self._cache.popitem(last=False)
+
+    def in_flight(self):
+        with self._lock: return len(self._pending)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def service():
+    """整個 process 共用的 ReportService (第一次使用時才建立模型)。"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            try: model, failed = model_from_env(), False
+            except Exception:
+                logger.exception("AI 模型初始化失敗，改用規則判讀")
+                model, failed = None, True
+            _service = ReportService(model)
+            _service.init_failed = failed
+        return _service
+
+
+def set_service(svc):
+    """替換模型 / 額度設定 (benchmark / 測試用)。"""
+    global _service
+    with _service_lock: _service = svc
+
+
+perf.register_gauge("ai_reports_generated", lambda: service().generated)
+perf.register_gauge("ai_report_failures", lambda: service().failures)
+perf.register_gauge("ai_reports_in_flight", lambda: service().in_flight())
+perf.register_gauge("ai_budget_left", lambda: service().budget_left())
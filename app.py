@@ -1,11 +1,24 @@
 import streamlit as st
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from ta.trend import SMAIndicator, MACD
-from ta.momentum import RSIIndicator
-import pytz
-from datetime import datetime, time, timedelta
+import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+import ai_report
+import backtest
+import chart_prep
+import core
+import indicators
+import live
+import market_cache
+import ohlcv_store
+import perf
+import resample
+import screener
+import sessions
+import signals
 
 # --- 1. 網頁設定 ---
 st.set_page_config(page_title="AI 智能操盤戰情室 (VIP 終極版)", layout="wide", initial_sidebar_state="collapsed")
@@ -26,6 +39,10 @@ VOL_SHRINK = "#FFC300"
 VOL_MA_LINE = "#000000" 
 COLOR_VWAP = "#FF9800"  
 
+# 各週期圖表月數滑桿的上限 (實際上限不超過資料涵蓋的月數)
+CHART_MAX_MONTHS = {"1d": 12, "1wk": 36, "1mo": 120}
+LONG_HISTORY_YEARS = 10   # 週 K / 月 K 由 10 年日線合成 (與回測共用本機資料庫)
+
 # --- 2. CSS 美化 ---
 st.markdown(f"""
     <style>
@@ -77,21 +94,28 @@ st.markdown(f"""
     """, unsafe_allow_html=True)
 
 # --- 3. 數據抓取函數 ---
+DEFAULT_EXCHANGE_RATE = 32.5
+logger = logging.getLogger(__name__)
+perf.serve()   # 有設定 STOCK_APP_METRICS_PORT 才會開啟 metrics 端點
+
 def fetch_stock_data_now(ticker):
-    stock = yf.Ticker(ticker)
-    df = stock.history(period="2y")
-    df_intra = stock.history(period="1d", interval="5m", prepost=True)
-    info = stock.info
-    quote_type = info.get('quoteType', 'EQUITY')
-    return df, df_intra, info, quote_type
-
-def fetch_exchange_rate_now():
+    # 四個請求同時送出，回傳 Future；頁面依資料到達的先後逐段顯示
+    return market_cache.fetch_all_async(ticker)
+
+def resolve_job(jobs, name, default):
+    """等待某個抓取結果；逾時或失敗時記錄原因並回傳預設值，不讓單一慢請求卡住整頁。"""
     try:
-        fx = yf.Ticker("USDTWD=X")
-        hist = fx.history(period="1d")
-        if not hist.empty: return hist['Close'].iloc[-1]
-        return 32.5
-    except: return 32.5
+        with perf.stage(f"wait.{name}"): return jobs[name].result(timeout=market_cache.FETCH_TIMEOUTS[name])
+    except FutureTimeoutError:
+        logger.warning("%s 抓取逾時 (%ss)", name, market_cache.FETCH_TIMEOUTS[name])
+    except Exception:
+        logger.exception("%s 抓取失敗", name)
+    return default
+
+def fetch_exchange_rate_now(jobs):
+    hist = resolve_job(jobs, "fx", None)
+    if hist is not None and not hist.empty: return float(hist['Close'].iloc[-1])   # 快取是 float32，金額計算前轉回 float
+    return DEFAULT_EXCHANGE_RATE
 
 # --- 4. 定義局部刷新元件 ---
 @st.fragment
@@ -203,13 +227,284 @@ def render_inventory_tab(current_close_price, quote_type):
     with c_res1: st.markdown(f"""<div class="calc-result"><div class="calc-res-title">加碼後總股數</div><div class="calc-res-val">{total_shares:.0f} 股</div></div>""", unsafe_allow_html=True)
     with c_res2: st.markdown(f"""<div class="calc-result"><div class="calc-res-title">預估總損益 (含費)</div><div class="calc-res-val {pl_class}">${unrealized_pl:.2f}</div></div>""", unsafe_allow_html=True)
 
+@st.fragment
+def render_screener_tab():
+    st.markdown("#### 🔍 批量掃描 (Watchlist)")
+    watchlist = st.text_area("股票清單 (以逗號、空白或換行分隔)", screener.DEFAULT_WATCHLIST, key="screener_watchlist")
+    sc1, sc2 = st.columns(2)
+    with sc1: scr_fast = st.number_input("趨勢快線 (Fast)", value=5, min_value=1, key="screener_fast")
+    with sc2: scr_slow = st.number_input("趨勢慢線 (Slow)", value=20, min_value=1, key="screener_slow")
+
+    if st.button("🚀 開始掃描", key="screener_run"):
+        tickers = screener.parse_watchlist(watchlist)
+        with st.spinner(f"正在掃描 {len(tickers)} 檔股票..."):
+            st.session_state.screener_result = screener.scan(tickers, scr_fast, scr_slow)
+
+    if "screener_result" in st.session_state:
+        table, missing = st.session_state.screener_result
+        if missing: st.warning(f"查無資料：{', '.join(missing)}")
+        if not table.empty:
+            st.caption(f"共 {len(table)} 檔，點擊欄位標題即可排序")
+            st.dataframe(table, hide_index=True, use_container_width=True, column_config={
+                "收盤": st.column_config.NumberColumn(format="%.2f"), "漲跌%": st.column_config.NumberColumn(format="%.2f%%"),
+                f"MA{scr_fast}": st.column_config.NumberColumn(format="%.2f"), f"MA{scr_slow}": st.column_config.NumberColumn(format="%.2f"),
+                "量比": st.column_config.NumberColumn(format="%.1f"), "MACD 柱": st.column_config.NumberColumn(format="%.2f"),
+                "RSI": st.column_config.NumberColumn(format="%.1f"),
+            })
+
+@st.fragment
+def render_backtest_tab(ticker, strat_fast, strat_slow):
+    st.markdown("#### 🧪 均線策略回測")
+    st.caption("規則與「趨勢訊號」卡片相同：收盤 > MA快 > MA慢 時持有，收盤判讀、隔日起算報酬，單邊成本 0.1%")
+    b1, b2, b3 = st.columns(3)
+    with b1: bt_years = st.selectbox("回測年數", [2, 5, 10], index=2, key="bt_years")
+    with b2: bt_fast_max = st.number_input("快線最大值", value=50, min_value=2, max_value=100, key="bt_fast_max")
+    with b3: bt_slow_max = st.number_input("慢線最大值", value=250, min_value=10, max_value=300, step=5, key="bt_slow_max")
+    g1, g2, g3 = st.columns(3)
+    with g1: use_rsi = st.checkbox("RSI 濾網 (不追高)", key="bt_use_rsi")
+    with g2: use_macd = st.checkbox("MACD 濾網 (柱狀體同向)", key="bt_use_macd")
+    with g3: allow_short = st.checkbox("空頭時放空", key="bt_allow_short")
+
+    if st.button("▶️ 執行回測", key="bt_run"):
+        fast_windows, slow_windows = list(range(1, bt_fast_max + 1)), list(range(5, bt_slow_max + 1, 5))
+        with st.spinner(f"正在回測 {len(fast_windows) * len(slow_windows)} 組參數..."):
+            df_bt = market_cache.get_history(ticker, bt_years)
+            key = ("backtest", ticker, df_bt.index[-1], len(df_bt), bt_fast_max, bt_slow_max, use_rsi, use_macd, allow_short)
+            market_cache.CACHE.get_or_fetch(key, market_cache.HISTORY_TTL, lambda: backtest.sweep(df_bt, fast_windows, slow_windows, use_rsi, use_macd, allow_short))
+            current = backtest.sweep(df_bt, [strat_fast], [strat_slow], use_rsi, use_macd, allow_short, parallel=False)
+            # session 只記快取 key 與少量摘要，整張參數網格留在共用快取
+            st.session_state.bt_result = dict(ticker=ticker, key=key, current=current, bh=backtest.buy_and_hold(df_bt), start=df_bt.index[0], end=df_bt.index[-1])
+
+    res = st.session_state.get("bt_result")
+    if res is None or res["ticker"] != ticker: return
+    grids = market_cache.CACHE.peek(res["key"])
+    if grids is None:
+        st.info("回測結果已被清出快取，請重新執行回測")
+        return
+
+    st.caption(f"區間：{res['start']:%Y-%m-%d} ~ {res['end']:%Y-%m-%d}")
+    cur, bh = {k: v.iloc[0, 0] for k, v in res["current"].items()}, res["bh"]
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric(f"目前策略 MA{strat_fast}/MA{strat_slow} 總報酬", f"{cur['total_return']:.1%}", f"{cur['total_return'] - bh['total_return']:+.1%} vs 買進持有")
+    m2.metric("最大回撤", f"{cur['max_drawdown']:.1%}", f"買進持有 {bh['max_drawdown']:.1%}", delta_color="off")
+    m3.metric("勝率", "N/A" if np.isnan(cur['hit_rate']) else f"{cur['hit_rate']:.0%}", f"{cur['trades']:.0f} 筆交易", delta_color="off")
+    m4.metric("持倉時間", f"{cur['exposure']:.0%}")
+
+    metric_label = st.radio("熱力圖指標", ["總報酬", "最大回撤", "勝率"], horizontal=True, key="bt_metric")
+    grid = grids[{"總報酬": "total_return", "最大回撤": "max_drawdown", "勝率": "hit_rate"}[metric_label]]
+    fig_heat = go.Figure(go.Heatmap(z=grid.to_numpy() * 100, x=grid.columns, y=grid.index, colorscale="RdYlGn", colorbar=dict(ticksuffix="%"), hovertemplate="MA%{y} / MA%{x}: %{z:.1f}%<extra></extra>"))
+    fig_heat.add_trace(go.Scatter(x=[strat_slow], y=[strat_fast], mode="markers", marker=dict(symbol="x", size=12, color="black"), hoverinfo="skip"))
+    fig_heat.update_layout(height=450, margin=dict(l=10, r=10, t=10, b=10), xaxis_title="慢線 (Slow)", yaxis_title="快線 (Fast)", template="plotly_white", showlegend=False)
+    st.plotly_chart(fig_heat, use_container_width=True)
+
+    top = pd.DataFrame({k: v.stack() for k, v in grids.items()}).sort_values("total_return", ascending=False).head(10)
+    top.index = [f"MA{f} / MA{s}" for f, s in top.index]
+    st.markdown("##### 🏆 總報酬前 10 名")
+    st.dataframe(top.rename(columns={"total_return": "總報酬", "cagr": "年化報酬", "max_drawdown": "最大回撤", "hit_rate": "勝率", "trades": "交易次數", "exposure": "持倉時間"}).style.format("{:.1%}").format("{:.0f}", subset=["交易次數"]), use_container_width=True)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def build_chart_figures(ticker, timeframe, last_bar, fingerprint, chart_months, _df):
+    # 快取 key 為 (股票, 週期, 最後一根 K 棒, 資料指紋, 月數)；_df 以底線開頭，Streamlit 不會拿它做 hash
+    # 指紋 = (根數, 第一根時間, 收盤價總和)：歷史被還原權息或長度改變時最後一根 K 棒可能不變，靠它避免畫出舊圖
+    # chart_months 為 None 時畫出全部 K 棒 (分 K)
+    df = _df
+    if chart_months is None: df_chart = df
+    else:
+        cutoff = df.index[-1] - pd.DateOffset(months=chart_months)
+        df_chart = df[df.index >= cutoff].copy()
+    with perf.stage("figure.rangebreaks"): range_breaks = chart_prep.rangebreaks(df.index, start=df_chart.index[0], end=df_chart.index[-1])
+
+    with perf.stage("figure.price"):
+        fig_price = go.Figure()
+        fig_price.add_trace(go.Candlestick(x=df_chart.index, open=df_chart['Open'], high=df_chart['High'], low=df_chart['Low'], close=df_chart['Close'], increasing_line_color=COLOR_UP, decreasing_line_color=COLOR_DOWN))
+        for m, c in zip([5, 20, 60], ['#D500F9', '#FF6D00', '#00C853']): fig_price.add_trace(go.Scatter(x=df_chart.index, y=df_chart[f'MA_{m}'], line=dict(color=c, width=1), name=f'MA{m}'))
+        fig_price.update_layout(height=400, margin=dict(l=10,r=10,t=10,b=50), xaxis_rangeslider_visible=False, showlegend=False, template="plotly_white")
+        fig_price.update_xaxes(rangebreaks=range_breaks)
+
+    with perf.stage("figure.volume"):
+        colors = chart_prep.volume_colors(df_chart['Volume'], df_chart['Vol_MA'], VOL_EXPLODE, VOL_NORMAL, VOL_SHRINK)
+        fig_vol = go.Figure(data=[go.Bar(x=df_chart.index, y=df_chart['Volume'], marker_color=colors), go.Scatter(x=df_chart.index, y=df_chart['Vol_MA'], line=dict(color='black', width=1))])
+        fig_vol.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), showlegend=False, template="plotly_white")
+        fig_vol.update_xaxes(rangebreaks=range_breaks)
+
+    with perf.stage("figure.rsi"):
+        fig_rsi = go.Figure(go.Scatter(x=df_chart.index, y=df_chart['RSI'], line=dict(color='#9C27B0')))
+        fig_rsi.add_hline(y=70, line_dash="dash", line_color='red'); fig_rsi.add_hline(y=30, line_dash="dash", line_color='green')
+        fig_rsi.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), template="plotly_white"); fig_rsi.update_xaxes(rangebreaks=range_breaks)
+
+    # [修復 Hist 繪圖]
+    with perf.stage("figure.macd"):
+        hist_data = df_chart['Hist'].fillna(0)
+        fig_macd = go.Figure([go.Scatter(x=df_chart.index, y=df_chart['MACD'], line=dict(color='#2196F3')), go.Scatter(x=df_chart.index, y=df_chart['Signal'], line=dict(color='#FF5722')), go.Bar(x=df_chart.index, y=hist_data, marker_color=chart_prep.macd_colors(hist_data, MACD_BULL_GROW, MACD_BEAR_GROW))])
+        fig_macd.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), showlegend=False, template="plotly_white"); fig_macd.update_xaxes(rangebreaks=range_breaks)
+    return fig_price, fig_vol, fig_rsi, fig_macd
+
+@st.fragment
+def render_chart_section(ticker, df):
+    # 拖動月數滑桿只重跑這個區塊；同樣的月數直接取用快取的圖表
+    st.markdown("#### 📉 技術分析")
+    timeframe = resample.TIMEFRAMES[st.radio("K 線週期", list(resample.TIMEFRAMES), horizontal=True, key="chart_timeframe")]
+
+    # 其他週期都由日線 / 5 分 K 在本機合成；週 K / 月 K 改用 10 年日線，2 年只有約 24 根月 K，指標算不出來
+    if timeframe != "1d":
+        if resample.is_intraday(timeframe): base = market_cache.get_intraday(ticker)
+        else:
+            try:
+                with st.spinner("載入長期日線..."): base = market_cache.get_history(ticker, LONG_HISTORY_YEARS)
+            except Exception:
+                logger.exception("%s 長期日線抓取失敗，改用 2 年日線", ticker)
+                base = df
+        with perf.stage("resample"): bars = resample.resample(ticker, base, timeframe)
+        if len(bars) < 2:
+            st.info("此週期資料不足")
+            return
+        with perf.stage(f"indicators.{timeframe}"): df = bars.join(indicators.compute_indicators(ticker, bars, indicators.MA_WINDOWS, timeframe=timeframe))
+
+    chart_months = None
+    if not resample.is_intraday(timeframe):
+        st.write("##### 📅 選擇歷史走勢長度 (月)")
+        available = (df.index[-1] - df.index[0]).days // 30 + 1
+        max_months = max(2, min(CHART_MAX_MONTHS[timeframe], available))
+        chart_months = st.slider(" ", 1, max_months, min(6, max_months), label_visibility="collapsed", key=f"chart_months_{timeframe}")
+    last_bar = (df.index[-1], float(df['Close'].iloc[-1]), float(df['Volume'].iloc[-1]))
+    fingerprint = (len(df), df.index[0], ohlcv_store.close_checksum(df))
+    with perf.stage("figure.cached_lookup"): fig_price, fig_vol, fig_rsi, fig_macd = build_chart_figures(ticker, timeframe, last_bar, fingerprint, chart_months, df)
+
+    st.markdown("<div class='chart-title'>📈 股價走勢 & 均線</div>", unsafe_allow_html=True)
+    with perf.stage("render.price"): st.plotly_chart(fig_price, use_container_width=True)
+
+    st.markdown("<div class='chart-title'>📊 成交量</div>", unsafe_allow_html=True)
+    with perf.stage("render.volume"): st.plotly_chart(fig_vol, use_container_width=True)
+
+    st.markdown("<div class='chart-title'>⚡ RSI & MACD</div>", unsafe_allow_html=True)
+    c_rsi, c_macd = st.columns(2)
+    with c_rsi, perf.stage("render.rsi"): st.plotly_chart(fig_rsi, use_container_width=True)
+    with c_macd, perf.stage("render.macd"): st.plotly_chart(fig_macd, use_container_width=True)
+
+def session_timeline_html(session):
+    """走勢圖下方的時段刻度：位置依實際時段邊界換算，時間以台灣時間顯示。"""
+    start, end = session["pre_open"], session["post_close"]
+    span = (end - start).total_seconds()
+    marks = [("pre_open", "盤前", "#555"), ("open", "🔔 開盤", "#000"), ("close", "🌙 收盤", "#000"), ("post_close", "結算", "#555")]
+    if session["pre_open"] == session["open"]: marks.pop(0)
+    if session["post_close"] == session["close"]: marks.pop()
+    items = []
+    for col, label, color in marks:
+        pct = (session[col] - start).total_seconds() / span * 100
+        if pct <= 0: pos = "left: 0%; text-align: left;"
+        elif pct >= 100: pos = "right: 0%; text-align: right;"
+        else: pos = f"left: {pct:.3f}%; transform: translateX(-50%); text-align: center;"
+        shown = session[col].tz_convert(sessions.DISPLAY_TZ)
+        items.append(f'''<div style="position: absolute; {pos}"><span>{label}</span><br><b style="color:{color}">{shown:%H:%M}</b></div>''')
+    return f'''<div style="position: relative; height: 35px; margin-top: 5px; border-top: 1px dashed #eee; font-size: 0.65rem; color: #999; width: 100%;">{"".join(items)}</div>'''
+
+def render_price_card(ticker, df, df_intra, info, key=None):
+    # 只需要日線與盤中資料；info 尚未到達時以日線收盤價代替 (判讀規則在 core)
+    previous_close, regular_price = core.quote(df, info)
+    # --- 準備資料 & 時區處理 ---
+    if not df_intra.empty:
+        df_intra = df_intra.set_axis(pd.to_datetime(df_intra.index))
+        exchange = sessions.exchange_for(ticker)
+
+        with perf.stage("intraday.session_mask"):
+            try: df_intra_tz = df_intra.tz_convert(exchange.tz)
+            except TypeError: df_intra_tz = df_intra   # 無時區資訊的 index
+
+            # 計算 H/L (僅正規交易時間)；走勢圖的正規時段填色共用同一份時段標記
+            df_regular = df_intra_tz[sessions.regular_mask(ticker, df_intra_tz.index)]
+            session = sessions.session_for(ticker, df_intra_tz.index[-1].date())
+            day_range = core.day_range(ticker, df_intra_tz, previous_close)
+        day_high, day_low = day_range["high"], day_range["low"]
+
+    # 判斷盤前/盤後價格
+    ext = core.extended_price(info, df_intra, regular_price)
+
+    reg_change = regular_price - previous_close
+    reg_pct = (reg_change / previous_close) * 100
+    reg_class = "txt-up-vip" if reg_change > 0 else "txt-down-vip"
+
+    fig_spark = go.Figure()
+    if not df_intra.empty:
+        with perf.stage("figure.spark"):
+            # 繪製走勢圖 (只畫正規時間的填充，其餘虛線)
+            fig_spark.add_trace(go.Scatter(x=df_intra_tz.index, y=df_intra_tz['Close'], mode='lines', line=dict(color='#bdc3c7', width=1.5, dash='dot'), hoverinfo='skip'))
+
+            if not df_regular.empty:
+                day_open_reg = df_regular['Open'].iloc[0]
+                day_close_reg = df_regular['Close'].iloc[-1]
+                spark_color = COLOR_UP if day_close_reg >= day_open_reg else COLOR_DOWN
+                fill_color = "rgba(5, 154, 129, 0.15)" if day_close_reg >= day_open_reg else "rgba(242, 54, 69, 0.15)"
+                fig_spark.add_trace(go.Scatter(x=df_regular.index, y=df_regular['Close'], mode='lines', line=dict(color=spark_color, width=2), fill='tozeroy', fillcolor=fill_color))
+
+            # 時間軸固定為該交易所當天的盤前開始到盤後結束 (含日光節約與半日市)
+            xaxis = dict(visible=False)
+            if session is not None: xaxis["range"] = [session["pre_open"], session["post_close"]]
+            fig_spark.update_layout(xaxis=xaxis)
+
+            y_min, y_max = day_low * 0.999, day_high * 1.001
+            fig_spark.update_layout(height=80, margin=dict(l=0, r=40, t=5, b=5), yaxis=dict(visible=False, range=[y_min, y_max]), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', showlegend=False, dragmode=False)
+
+        # 價格與 H/L 顯示
+        price_html = f"""<div class="metric-card"><div class="metric-title">最新股價</div><div class="metric-value {reg_class}">{regular_price:.2f}</div><div class="metric-sub {reg_class}">{('+' if reg_change > 0 else '')}{reg_change:.2f} ({reg_pct:.2f}%)</div>"""
+        if ext is not None:
+            ext_price, ext_label = ext
+            ext_change = ext_price - regular_price
+            ext_pct = (ext_change / regular_price) * 100
+            ext_class = "txt-up-vip" if ext_change > 0 else "txt-down-vip"
+            price_html += f"""<div class="ext-price-box"><span class="ext-label">{ext_label}</span><span class="{ext_class}">{ext_price:.2f} ({('+' if ext_pct > 0 else '')}{ext_pct:.2f}%)</span></div>"""
+
+        day_high_pct, day_low_pct = day_range["high_pct"], day_range["low_pct"]
+        h_class = "txt-up-vip" if day_high_pct >= 0 else "txt-down-vip"
+        l_class = "txt-up-vip" if day_low_pct >= 0 else "txt-down-vip"
+
+        price_html += f"""<div class="spark-scale"><div class="{h_class}">H: {day_high_pct:+.1f}%</div><div style="margin-top:25px;" class="{l_class}">L: {day_low_pct:+.1f}%</div></div></div>"""
+        st.markdown(price_html, unsafe_allow_html=True)
+        with perf.stage("render.spark"): st.plotly_chart(fig_spark, use_container_width=True, config={'displayModeBar': False, 'staticPlot': True}, key=key)
+
+        # 海外市場才顯示各時段對應的台灣時間
+        if session is not None and exchange.tz != sessions.DISPLAY_TZ:
+            st.markdown(session_timeline_html(session), unsafe_allow_html=True)
+    else:
+        st.info("暫無即時數據")
+
+@st.fragment(run_every=live.REFRESH_SECONDS)
+def render_live_price_card(ticker, df, df_intra, info):
+    # 即時模式：只重畫價格卡片；資料來自該股票共用的 poller 緩衝區，不重跑整頁
+    poller = live.subscribe(ticker, df, df_intra)
+    intraday, daily, latest, _ = poller.snapshot()
+    if intraday.empty: intraday, daily = df_intra, df
+    # info 裡的價格是載入當下的，改用盤中資料彙總出的進行中日 K
+    live_info = {k: v for k, v in info.items() if k not in ("preMarketPrice", "postMarketPrice")}
+    if latest is not None: live_info["currentPrice"] = float(daily["Close"].iloc[-1])
+    render_price_card(ticker, daily, intraday, live_info, key="spark_live")
+    if latest is not None and poller.updated_at:
+        st.caption(f"📡 即時 {datetime.fromtimestamp(poller.updated_at):%H:%M:%S} · RSI {latest['RSI']:.1f} · MACD 柱 {latest['Hist']:+.2f}")
+
+def ai_report_card(text, note=""):
+    st.markdown(f"""<div class="ai-summary-card"><div class="ai-title">🤖 AI 綜合判讀報告</div><div class="ai-content">{text}</div></div>""", unsafe_allow_html=True)
+    if note: st.caption(note)
+
+def render_ai_report(ticker, last_bar, states, fast, slow):
+    # 報告在背景產生；還沒好就先放佔位卡片，由下面的 fragment 定時檢查
+    status, text = ai_report.service().get(ticker, last_bar, states, fast, slow)
+    if status == ai_report.PENDING: render_ai_report_pending(ticker, last_bar, states, fast, slow)
+    else: ai_report_card(text, "⚠️ AI 暫時無法使用，以下為規則判讀" if status == ai_report.FALLBACK else "")
+
+@st.fragment(run_every=ai_report.POLL_SECONDS)
+def render_ai_report_pending(ticker, last_bar, states, fast, slow):
+    status, _ = ai_report.service().get(ticker, last_bar, states, fast, slow)
+    if status != ai_report.PENDING: st.rerun()   # 完成後重跑一次整頁，換成不再輪詢的版本
+    ai_report_card("⏳ AI 報告產生中，完成後會自動顯示…")
+
 # --- 5. 側邊欄 ---
 with st.sidebar:
     st.header("⚙️ 參數設定")
     ticker_input = st.text_input("股票代號", "TSLA", key="sidebar_ticker").upper()
     if st.button("🔄 更新報價 (Refresh)"):
+        market_cache.invalidate_intraday(ticker_input)
         if 'stored_ticker' in st.session_state: del st.session_state['stored_ticker']
         st.rerun()
+    live_mode = st.checkbox(f"📡 即時模式 (每 {live.REFRESH_SECONDS} 秒更新報價)", key="sidebar_live")
     st.markdown("---")
     st.subheader("🧠 策略邏輯")
     strategy_mode = st.radio("判讀模式", ["🤖 自動判別 (Auto)", "🛠️ 手動設定 (Manual)"], key="sidebar_strat_mode")
@@ -218,156 +513,68 @@ with st.sidebar:
         strat_fast = st.number_input("策略快線 (Fast)", value=5, key="sidebar_fast")
         strat_slow = st.number_input("策略慢線 (Slow)", value=20, key="sidebar_slow")
         strat_desc = "自訂策略"
+    st.markdown("---")
+    show_perf = st.checkbox("⏱️ 效能除錯面板", key="sidebar_perf")
+    if show_perf: perf.start_run()
 
 # --- 6. 主程式 ---
 if ticker_input:
     try:
-        if 'stored_ticker' not in st.session_state or st.session_state.stored_ticker != ticker_input:
-            with st.spinner(f"正在抓取 {ticker_input} 數據..."):
-                df, df_intra, info, quote_type = fetch_stock_data_now(ticker_input)
-                exchange_rate = fetch_exchange_rate_now()
-                st.session_state.update(stored_ticker=ticker_input, data_df=df, data_df_intra=df_intra, data_info=info, data_quote_type=quote_type, data_exchange_rate=exchange_rate)
-                for k in ["buy_price_input", "cost_price_input", "target_sell_input", "inv_curr_avg", "inv_new_price"]:
-                    if k in st.session_state: del st.session_state[k]
-
-        df, df_intra, info = st.session_state.data_df, st.session_state.data_df_intra, st.session_state.data_info
-        quote_type, exchange_rate = st.session_state.data_quote_type, st.session_state.data_exchange_rate
-
-        if not df.empty and len(df) > 200:
-            if strategy_mode == "🤖 自動判別 (Auto)":
-                strat_fast, strat_slow = (10, 20) if info.get('marketCap', 0) > 200_000_000_000 else (5, 10)
-                strat_desc = "🐘 巨頭穩健" if info.get('marketCap', 0) > 200_000_000_000 else "🚀 小型飆股"
-            
-            ma_list = [5, 10, 20, 30, 60, 120, 200]
-            for d in ma_list: df[f'MA_{d}'] = SMAIndicator(df['Close'], window=d).sma_indicator()
-            
-            last = df.iloc[-1]
-            strat_fast_val, strat_slow_val = SMAIndicator(df['Close'], window=strat_fast).sma_indicator().iloc[-1], SMAIndicator(df['Close'], window=strat_slow).sma_indicator().iloc[-1]
-            
-            df['RSI'] = RSIIndicator(df['Close'], window=14).rsi()
-            macd = MACD(df['Close'])
-            df['MACD'], df['Signal'], df['Hist'] = macd.macd(), macd.macd_signal(), macd.macd_diff()
-            # [修復 Hist 錯誤] 
-            df['Hist'] = df['Hist'].fillna(0)
-            
-            df['Vol_MA'] = SMAIndicator(df['Volume'], window=20).sma_indicator()
-            current_close_price = last['Close']
-
-            tab_analysis, tab_calc, tab_inv = st.tabs(["📊 技術分析", "🧮 交易計算", "📦 庫存管理"])
+        if st.session_state.get('stored_ticker') != ticker_input:
+            st.session_state.stored_ticker = ticker_input
+            for k in ["buy_price_input", "cost_price_input", "target_sell_input", "inv_curr_avg", "inv_new_price"]:
+                if k in st.session_state: del st.session_state[k]
 
-            with tab_analysis:
-                # --- 準備資料 & 時區處理 ---
-                if not df_intra.empty:
-                    df_intra.index = pd.to_datetime(df_intra.index)
-                    if ".TW" in ticker_input:
-                        tz_str = 'Asia/Taipei'
-                        open_time, close_time = time(9, 0), time(13, 30)
-                    else:
-                        tz_str = 'America/New_York'
-                        open_time, close_time = time(9, 30), time(16, 0)
-                    
-                    try: df_intra_tz = df_intra.tz_convert(tz_str)
-                    except: df_intra_tz = df_intra
-
-                    # 計算 H/L (僅正規交易時間)
-                    mask_reg_hl = (df_intra_tz.index.time >= open_time) & (df_intra_tz.index.time <= close_time)
-                    df_reg_hl = df_intra_tz[mask_reg_hl]
-                    day_high = df_reg_hl['High'].max() if not df_reg_hl.empty else df_intra_tz['High'].max()
-                    day_low = df_reg_hl['Low'].min() if not df_reg_hl.empty else df_intra_tz['Low'].min()
-
-                previous_close = info.get('previousClose', df.iloc[-2]['Close'])
-                regular_price = info.get('currentPrice', info.get('regularMarketPrice', last['Close']))
-                
-                # 判斷盤前/盤後價格
-                is_extended, ext_price, ext_label = False, 0, ""
-                live_price = df_intra['Close'].iloc[-1] if not df_intra.empty else 0
-                
-                if info.get('preMarketPrice'):
-                     ext_price, is_extended, ext_label = info['preMarketPrice'], True, "盤前"
-                elif info.get('postMarketPrice'):
-                     ext_price, is_extended, ext_label = info['postMarketPrice'], True, "盤後"
-                elif abs(live_price - regular_price) / regular_price > 0.001:
-                     ext_price, is_extended, ext_label = live_price, True, "盤後/試撮"
-
-                reg_change = regular_price - previous_close
-                reg_pct = (reg_change / previous_close) * 100
-                reg_class = "txt-up-vip" if reg_change > 0 else "txt-down-vip"
-
-                st.markdown(f"### 📱 {info.get('longName', ticker_input)} ({ticker_input})")
-                st.caption(f"目前策略：{strat_desc}")
+        # session 不保留行情副本：每次 rerun 都向共用快取要資料 (命中時 Future 立即完成)
+        jobs = fetch_stock_data_now(ticker_input)
+        with st.spinner(f"正在抓取 {ticker_input} 數據..."), perf.stage("wait.history"):
+            df = jobs['history'].result(timeout=market_cache.FETCH_TIMEOUTS['history'])
+
+        if not df.empty and len(df) > core.MIN_BARS:
+            ma_list = list(indicators.MA_WINDOWS)
+            # 指標結果為共用快取，用 join 產生本次 rerun 的新表，不再就地改寫 session 裡的 df
+            with perf.stage("indicators"): df = df.join(indicators.compute_indicators(ticker_input, df, ma_list))
+            current_close_price = float(df['Close'].iloc[-1])
 
+            tab_analysis, tab_calc, tab_inv, tab_screen, tab_bt = st.tabs(["📊 技術分析", "🧮 交易計算", "📦 庫存管理", "🔍 批量掃描", "🧪 策略回測"])
+
+            with tab_analysis:
+                # 先排好版面位置，日線到了就先畫圖表，info 到了再補上需要基本面的區塊
+                header_box = st.container()
                 c1, c2, c3, c4 = st.columns(4)
-                with c1:
-                    fig_spark = go.Figure()
-                    if not df_intra.empty:
-                        # 繪製走勢圖 (只畫正規時間的填充，其餘虛線)
-                        fig_spark.add_trace(go.Scatter(x=df_intra_tz.index, y=df_intra_tz['Close'], mode='lines', line=dict(color='#bdc3c7', width=1.5, dash='dot'), hoverinfo='skip'))
-                        
-                        mask = (df_intra_tz.index.time >= open_time) & (df_intra_tz.index.time <= close_time)
-                        df_regular = df_intra_tz[mask]
-                        if not df_regular.empty:
-                            day_open_reg = df_regular['Open'].iloc[0]
-                            day_close_reg = df_regular['Close'].iloc[-1]
-                            spark_color = COLOR_UP if day_close_reg >= day_open_reg else COLOR_DOWN
-                            fill_color = "rgba(5, 154, 129, 0.15)" if day_close_reg >= day_open_reg else "rgba(242, 54, 69, 0.15)"
-                            fig_spark.add_trace(go.Scatter(x=df_regular.index, y=df_regular['Close'], mode='lines', line=dict(color=spark_color, width=2), fill='tozeroy', fillcolor=fill_color))
-
-                        # --- [核心修正: 鎖定美股冬令時間軸] ---
-                        if ".TW" not in ticker_input:
-                            current_date = df_intra_tz.index[0].date()
-                            tz_ny = pytz.timezone('America/New_York')
-                            
-                            # 強制鎖定美東時間 04:00 - 20:00 (對應台灣 17:00 - 09:00 冬令)
-                            dt_start = tz_ny.localize(datetime.combine(current_date, time(4, 0)))
-                            dt_end = tz_ny.localize(datetime.combine(current_date, time(20, 0)))
-                            
-                            fig_spark.update_layout(xaxis=dict(range=[dt_start, dt_end], visible=False))
-                        else:
-                             fig_spark.update_layout(xaxis=dict(visible=False))
-
-                        y_min, y_max = day_low * 0.999, day_high * 1.001
-                        fig_spark.update_layout(height=80, margin=dict(l=0, r=40, t=5, b=5), yaxis=dict(visible=False, range=[y_min, y_max]), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', showlegend=False, dragmode=False)
-
-                        # 價格與 H/L 顯示
-                        price_html = f"""<div class="metric-card"><div class="metric-title">最新股價</div><div class="metric-value {reg_class}">{regular_price:.2f}</div><div class="metric-sub {reg_class}">{('+' if reg_change > 0 else '')}{reg_change:.2f} ({reg_pct:.2f}%)</div>"""
-                        if is_extended:
-                            ext_change = ext_price - regular_price
-                            ext_pct = (ext_change / regular_price) * 100
-                            ext_class = "txt-up-vip" if ext_change > 0 else "txt-down-vip"
-                            price_html += f"""<div class="ext-price-box"><span class="ext-label">{ext_label}</span><span class="{ext_class}">{ext_price:.2f} ({('+' if ext_pct > 0 else '')}{ext_pct:.2f}%)</span></div>"""
-                        
-                        day_high_pct = ((day_high - previous_close) / previous_close) * 100
-                        day_low_pct = ((day_low - previous_close) / previous_close) * 100
-                        h_class = "txt-up-vip" if day_high_pct >= 0 else "txt-down-vip"
-                        l_class = "txt-up-vip" if day_low_pct >= 0 else "txt-down-vip"
-                        
-                        price_html += f"""<div class="spark-scale"><div class="{h_class}">H: {day_high_pct:+.1f}%</div><div style="margin-top:25px;" class="{l_class}">L: {day_low_pct:+.1f}%</div></div></div>"""
-                        st.markdown(price_html, unsafe_allow_html=True)
-                        st.plotly_chart(fig_spark, use_container_width=True, config={'displayModeBar': False, 'staticPlot': True})
-                        
-                        # --- [核心修正: 完美對齊的時間軸] ---
-                        if ".TW" not in ticker_input:
-                            timeline_html = f"""
-                            <div style="position: relative; height: 35px; margin-top: 5px; border-top: 1px dashed #eee; font-size: 0.65rem; color: #999; width: 100%;">
-                                <div style="position: absolute; left: 0%; transform: translateX(0%); text-align: left;">
-                                    <span>盤前</span><br><b style="color:#555">17:00</b>
-                                </div>
-                                <div style="position: absolute; left: 34.375%; transform: translateX(-50%); text-align: center;">
-                                    <span>🔔 開盤</span><br><b style="color:#000">22:30</b>
-                                </div>
-                                <div style="position: absolute; left: 75%; transform: translateX(-50%); text-align: center;">
-                                    <span>🌙 收盤</span><br><b style="color:#000">05:00</b>
-                                </div>
-                                <div style="position: absolute; right: 0%; transform: translateX(0%); text-align: right;">
-                                    <span>結算</span><br><b style="color:#555">09:00</b>
-                                </div>
-                            </div>
-                            """
-                            st.markdown(timeline_html, unsafe_allow_html=True)
-                    else:
-                        st.info("暫無即時數據")
-
-                # 其餘基本面數據
+                price_slot = c1.empty()
+                st.markdown("#### 🤖 策略訊號解讀")
+                signals_box = st.container()
+
+                # --- 其餘圖表部分 ---
+                st.markdown("#### 📏 關鍵均線監控")
+                ma_html = "".join([f'<div class="ma-box"><div class="ma-label">MA {m["window"]}</div><div class="ma-val {"txt-up-vip" if m["rising"] else "txt-down-vip"}">{m["value"]:.2f} {"▲" if m["rising"] else "▼"}</div></div>' for m in core.ma_table(df, ma_list)])
+                st.markdown(f'<div class="ma-container">{ma_html}</div>', unsafe_allow_html=True)
+
+                render_chart_section(ticker_input, df)
+
+                ai_box = st.container()
+
+                # info 還沒到就先用日線收盤價畫價格卡，info 到了再重畫一次
+                df_intra = resolve_job(jobs, 'intraday', pd.DataFrame())
+                info_early = resolve_job(jobs, 'info', {}) if jobs['info'].done() else None
+                with price_slot.container(): render_price_card(ticker_input, df, df_intra, info_early or {}, key="spark_early")
+
+            info = resolve_job(jobs, 'info', {})
+            quote_type = info.get('quoteType', 'EQUITY')
+            if strategy_mode == "🤖 自動判別 (Auto)": strat_fast, strat_slow, strat_desc = core.auto_strategy(info)
+            states = core.signal_states(df, strat_fast, strat_slow)
+
+            with tab_analysis:
+                if live_mode:
+                    with price_slot.container(): render_live_price_card(ticker_input, df, df_intra, info)
+                elif info_early is None:
+                    with price_slot.container(): render_price_card(ticker_input, df, df_intra, info, key="spark")
+
+                with header_box:
+                    st.markdown(f"### 📱 {info.get('longName', ticker_input)} ({ticker_input})")
+                    st.caption(f"目前策略：{strat_desc}")
+
                 with c2: st.markdown(f"""<div class="metric-card"><div class="metric-title">本益比 (P/E)</div><div class="metric-value">{info.get('trailingPE', 'N/A')}</div><div class="metric-sub">估值參考</div></div>""", unsafe_allow_html=True)
                 with c3: st.markdown(f"""<div class="metric-card"><div class="metric-title">EPS</div><div class="metric-value">{info.get('trailingEps', 'N/A')}</div><div class="metric-sub">獲利能力</div></div>""", unsafe_allow_html=True)
                 with c4:
@@ -375,77 +582,48 @@ if ticker_input:
                     m_str = f"{mcap/1000000000:.1f}B" if mcap > 1000000000 else f"{mcap/1000000:.1f}M"
                     st.markdown(f"""<div class="metric-card"><div class="metric-title">市值</div><div class="metric-value">{m_str}</div><div class="metric-sub">{info.get('sector','N/A')}</div></div>""", unsafe_allow_html=True)
 
-                st.markdown("#### 🤖 策略訊號解讀")
-                k1, k2, k3, k4 = st.columns(4)
-                
-                # [修復 Hist 讀取] 
-                hist_val = last.get('Hist', 0)
-                
-                trend_status, trend_msg, trend_bg = "盤整", "💤 睡覺行情 (盤整)", "bg-gray"
-                if last['Close'] > strat_fast_val > strat_slow_val: trend_status, trend_msg, trend_bg = "多頭", "🚀 火力全開！(多頭)", "bg-up"
-                elif last['Close'] < strat_fast_val < strat_slow_val: trend_status, trend_msg, trend_bg = "空頭", "🐻 熊出沒注意 (空頭)", "bg-down"
-                with k1: st.markdown(f"""<div class="metric-card"><div class="metric-title">趨勢訊號</div><div class="metric-value" style="font-size:1.3rem;">{trend_msg}</div><div><span class="status-badge {trend_bg}">MA{strat_fast} vs MA{strat_slow}</span></div></div>""", unsafe_allow_html=True)
-                
-                vol_r = last['Volume'] / df['Vol_MA'].iloc[-1] if df['Vol_MA'].iloc[-1] > 0 else 0
-                v_msg, v_bg = "❄️ 冷冷清清", "bg-gray"
-                if vol_r > 2.0: v_msg, v_bg = "🔥 資金派對 (爆量)", "bg-down"
-                elif vol_r > 1.0: v_msg, v_bg = "💧 人氣回溫", "bg-blue"
-                with k2: st.markdown(f"""<div class="metric-card"><div class="metric-title">量能判讀</div><div class="metric-value" style="font-size:1.3rem;">{v_msg}</div><div><span class="status-badge {v_bg}">{vol_r:.1f} 倍均量</span></div></div>""", unsafe_allow_html=True)
-
-                m_msg, m_bg = ("🐂 牛軍集結", "bg-up") if hist_val > 0 else ("📉 空軍壓境", "bg-down")
-                with k3: st.markdown(f"""<div class="metric-card"><div class="metric-title">MACD 趨勢</div><div class="metric-value" style="font-size:1.3rem;">{m_msg}</div><div><span class="status-badge {m_bg}">{last.get('MACD', 0):.2f}</span></div></div>""", unsafe_allow_html=True)
-
-                r_val = last['RSI']
-                r_msg, r_bg = "⚖️ 多空拔河", "bg-gray"
-                if r_val > 70: r_msg, r_bg = "🔥 太燙了！(過熱)", "bg-down"
-                elif r_val < 30: r_msg, r_bg = "🧊 跌過頭囉 (超賣)", "bg-up"
-                with k4: st.markdown(f"""<div class="metric-card"><div class="metric-title">RSI 強弱</div><div class="metric-value" style="font-size:1.3rem;">{r_msg}</div><div><span class="status-badge {r_bg}">{r_val:.1f}</span></div></div>""", unsafe_allow_html=True)
+                with signals_box:
+                    k1, k2, k3, k4 = st.columns(4)
 
-                # --- 其餘圖表部分 ---
-                st.markdown("#### 📏 關鍵均線監控")
-                ma_html = "".join([f'<div class="ma-box"><div class="ma-label">MA {d}</div><div class="ma-val {"txt-up-vip" if last[f"MA_{d}"] > df.iloc[-2][f"MA_{d}"] else "txt-down-vip"}">{last[f"MA_{d}"]:.2f} {"▲" if last[f"MA_{d}"] > df.iloc[-2][f"MA_{d}"] else "▼"}</div></div>' for d in ma_list])
-                st.markdown(f'<div class="ma-container">{ma_html}</div>', unsafe_allow_html=True)
-                
-                st.markdown("#### 📉 技術分析")
-                st.write("##### 📅 選擇歷史走勢長度 (月)")
-                chart_months = st.slider(" ", 1, 12, 6, label_visibility="collapsed")
-                
-                cutoff = df.index[-1] - pd.DateOffset(months=chart_months)
-                df_chart = df[df.index >= cutoff].copy()
-                range_breaks = [dict(values=pd.date_range(start=df_chart.index[0], end=df_chart.index[-1]).difference(df_chart.index).strftime("%Y-%m-%d").tolist())]
-
-                st.markdown("<div class='chart-title'>📈 股價走勢 & 均線</div>", unsafe_allow_html=True)
-                fig_price = go.Figure()
-                fig_price.add_trace(go.Candlestick(x=df_chart.index, open=df_chart['Open'], high=df_chart['High'], low=df_chart['Low'], close=df_chart['Close'], increasing_line_color=COLOR_UP, decreasing_line_color=COLOR_DOWN))
-                for m, c in zip([5, 20, 60], ['#D500F9', '#FF6D00', '#00C853']): fig_price.add_trace(go.Scatter(x=df_chart.index, y=df_chart[f'MA_{m}'], line=dict(color=c, width=1), name=f'MA{m}'))
-                fig_price.update_layout(height=400, margin=dict(l=10,r=10,t=10,b=50), xaxis_rangeslider_visible=False, showlegend=False, template="plotly_white")
-                fig_price.update_xaxes(rangebreaks=range_breaks)
-                st.plotly_chart(fig_price, use_container_width=True)
-
-                st.markdown("<div class='chart-title'>📊 成交量</div>", unsafe_allow_html=True)
-                colors = [VOL_EXPLODE if (r['Volume']/(r['Vol_MA'] if r['Vol_MA']>0 else 1))>=2 else VOL_NORMAL if (r['Volume']/(r['Vol_MA'] if r['Vol_MA']>0 else 1))>=1 else VOL_SHRINK for _, r in df_chart.iterrows()]
-                fig_vol = go.Figure(data=[go.Bar(x=df_chart.index, y=df_chart['Volume'], marker_color=colors), go.Scatter(x=df_chart.index, y=df_chart['Vol_MA'], line=dict(color='black', width=1))])
-                fig_vol.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), showlegend=False, template="plotly_white")
-                fig_vol.update_xaxes(rangebreaks=range_breaks)
-                st.plotly_chart(fig_vol, use_container_width=True)
-
-                st.markdown("<div class='chart-title'>⚡ RSI & MACD</div>", unsafe_allow_html=True)
-                c_rsi, c_macd = st.columns(2)
-                with c_rsi:
-                    fig_rsi = go.Figure(go.Scatter(x=df_chart.index, y=df_chart['RSI'], line=dict(color='#9C27B0')))
-                    fig_rsi.add_hline(y=70, line_dash="dash", line_color='red'); fig_rsi.add_hline(y=30, line_dash="dash", line_color='green')
-                    fig_rsi.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), template="plotly_white"); fig_rsi.update_xaxes(rangebreaks=range_breaks)
-                    st.plotly_chart(fig_rsi, use_container_width=True)
-                with c_macd:
-                    # [修復 Hist 繪圖]
-                    hist_data = df_chart['Hist'].fillna(0)
-                    fig_macd = go.Figure([go.Scatter(x=df_chart.index, y=df_chart['MACD'], line=dict(color='#2196F3')), go.Scatter(x=df_chart.index, y=df_chart['Signal'], line=dict(color='#FF5722')), go.Bar(x=df_chart.index, y=hist_data, marker_color=[(MACD_BULL_GROW if h>0 else MACD_BEAR_GROW) for h in hist_data])])
-                    fig_macd.update_layout(height=200, margin=dict(l=10,r=10,t=10,b=10), showlegend=False, template="plotly_white"); fig_macd.update_xaxes(rangebreaks=range_breaks)
-                    st.plotly_chart(fig_macd, use_container_width=True)
-
-                st.markdown(f"""<div class="ai-summary-card"><div class="ai-title">🤖 AI 綜合判讀報告</div><div class="ai-content">目前 {ticker_input} 呈現{trend_status}排列，RSI 數值 {r_val:.1f} ({r_msg})。請留意上方壓力與支撐。</div></div>""", unsafe_allow_html=True)
+                    trend_msg, trend_bg = signals.TREND_DISPLAY[states["trend"]]
+                    with k1: st.markdown(f"""<div class="metric-card"><div class="metric-title">趨勢訊號</div><div class="metric-value" style="font-size:1.3rem;">{trend_msg}</div><div><span class="status-badge {trend_bg}">MA{strat_fast} vs MA{strat_slow}</span></div></div>""", unsafe_allow_html=True)
+
+                    vol_r = states["volume_ratio"]
+                    v_msg, v_bg = signals.VOLUME_DISPLAY[states["volume"]]
+                    with k2: st.markdown(f"""<div class="metric-card"><div class="metric-title">量能判讀</div><div class="metric-value" style="font-size:1.3rem;">{v_msg}</div><div><span class="status-badge {v_bg}">{vol_r:.1f} 倍均量</span></div></div>""", unsafe_allow_html=True)
+
+                    m_msg, m_bg = signals.MACD_DISPLAY[states["macd"]]
+                    with k3: st.markdown(f"""<div class="metric-card"><div class="metric-title">MACD 趨勢</div><div class="metric-value" style="font-size:1.3rem;">{m_msg}</div><div><span class="status-badge {m_bg}">{states["macd_value"]:.2f}</span></div></div>""", unsafe_allow_html=True)
+
+                    r_val = states["rsi_value"]
+                    r_msg, r_bg = signals.RSI_DISPLAY[states["rsi"]]
+                    with k4: st.markdown(f"""<div class="metric-card"><div class="metric-title">RSI 強弱</div><div class="metric-value" style="font-size:1.3rem;">{r_msg}</div><div><span class="status-badge {r_bg}">{r_val:.1f}</span></div></div>""", unsafe_allow_html=True)
+
+                with ai_box: render_ai_report(ticker_input, df.index[-1], states, strat_fast, strat_slow)
 
+            exchange_rate = fetch_exchange_rate_now(jobs)
             with tab_calc: render_calculator_tab(current_close_price, exchange_rate, quote_type)
             with tab_inv: render_inventory_tab(current_close_price, quote_type)
+            with tab_screen: render_screener_tab()
+            with tab_bt: render_backtest_tab(ticker_input, strat_fast, strat_slow)
         else: st.error("資料不足")
-    except Exception as e: st.error(f"系統忙碌中: {e}")
\ No newline at end of file
+    except Exception as e: st.error(f"系統忙碌中: {e}")
+
+# --- 7. 效能除錯面板 ---
+if show_perf:
+    run = perf.end_run()
+    with st.sidebar.expander("⏱️ 本次 rerun 各階段耗時", expanded=True):
+        if run:
+            per_stage = pd.DataFrame(run, columns=["階段", "秒"]).groupby("階段", sort=False)["秒"].agg(["count", "sum"])
+            st.dataframe((per_stage["sum"] * 1000).round(1).rename("ms").to_frame().assign(次數=per_stage["count"]), use_container_width=True)
+        else: st.caption("本次 rerun 沒有記錄到任何階段")
+        st.caption("上游排程 / 快取狀態")
+        st.dataframe(pd.Series(perf.gauges(), name="值").to_frame(), use_container_width=True)
+        if perf.ENABLED:
+            snap = perf.snapshot()
+            st.markdown("**累計 (整個 process)**")
+            if snap["stages"]: st.dataframe(pd.DataFrame(snap["stages"]).T[["count", "p50", "p95", "p99"]].mul([1, 1000, 1000, 1000]).round(1), use_container_width=True)
+            if snap["caches"]: st.dataframe(pd.DataFrame(snap["caches"]).T, use_container_width=True)
+            st.download_button("下載 JSON", perf.to_json(), "metrics.json", "application/json", key="perf_json")
+            st.download_button("下載 Prometheus", perf.to_prometheus(), "metrics.prom", "text/plain", key="perf_prom")
+        else: st.caption("設定環境變數 STOCK_APP_PERF=1 可累計 p50/p95/p99 與快取命中率")
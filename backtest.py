@@ -0,0 +1,126 @@
+"""均線趨勢策略回測 (與「趨勢訊號」卡片相同的規則)。
+
+- 多頭 Close > MA快 > MA慢 時持有多單；可選擇在空頭 Close < MA快 < MA慢 時放空。
+- 可選擇加上 RSI (不追高 / 不殺低) 與 MACD 柱狀體方向的濾網。
+- 收盤判讀、隔日起算報酬，沒有逐根 K 棒的 Python 迴圈：整組快慢線參數一次用陣列算完，
+  大型參數網格再依快線切塊丟給 thread pool (NumPy 的陣列運算會釋放 GIL)。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import signals
+
+TRADING_DAYS = 252
+DEFAULT_COST = 0.001          # 每次進出場單邊成本 (與一般股票手續費 0.1% 相同)
+PARALLEL_MIN_PAIRS = 400      # 參數組合少於這個數量就不值得平行
+CHUNK_PAIRS = 200             # 每塊最多幾組參數，控制 (參數組數 x K 棒數) 暫存陣列的記憶體
+WORKERS = os.cpu_count() or 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # 不用 process pool：Streamlit 把 app.py 裝成 __main__，spawn 出來的子行程會把整個 app 重跑一次
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="backtest")
+        return _pool
+
+
+def positions(close, ma_fast, ma_slow, rsi=None, hist=None, allow_short=False):
+    """部位 (1 多 / 0 空手 / -1 空)；ma_fast / ma_slow 可以是 (參數組數, K 棒數) 的二維陣列。"""
+    long_ = (close > ma_fast) & (ma_fast > ma_slow)
+    short = (close < ma_fast) & (ma_fast < ma_slow)
+    if rsi is not None:
+        long_ &= ~(rsi > signals.RSI_HOT)
+        short &= ~(rsi < signals.RSI_COLD)
+    if hist is not None:
+        long_ &= hist > 0
+        short &= hist < 0
+    pos = long_.astype(np.int8)
+    if allow_short: pos -= short.astype(np.int8)
+    return pos
+
+
+def evaluate(close, pos, cost=DEFAULT_COST):
+    """對每一列部位計算績效；回傳 dict，每個值都是長度為參數組數的陣列。"""
+    pos = np.atleast_2d(pos).astype(float)
+    n_pairs, n = pos.shape
+    ret = np.zeros(n)
+    ret[1:] = close[1:] / close[:-1] - 1
+
+    held = np.zeros_like(pos)
+    held[:, 1:] = pos[:, :-1]                      # 今天收盤決定的部位，賺的是明天的報酬
+    turnover = np.abs(np.diff(pos, axis=1, prepend=0.0))
+    strat = held * ret - turnover * cost
+    log_eq = np.cumsum(np.log1p(np.maximum(strat, -0.999999)), axis=1)
+    equity = np.exp(log_eq)
+
+    total = equity[:, -1] - 1
+    years = max(n / TRADING_DAYS, 1e-9)
+    cagr = np.exp(log_eq[:, -1] / years) - 1
+    drawdown = (equity / np.maximum.accumulate(np.maximum(equity, 1.0), axis=1) - 1).min(axis=1)
+
+    # 逐筆交易：部位改變的位置切段，每段報酬 = 段尾與段首的 log 淨值差
+    padded = np.zeros((n_pairs, n + 2))
+    padded[:, 1:-1] = pos
+    row, k = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    same_row = row[:-1] == row[1:]
+    start, end, row = k[:-1][same_row], k[1:][same_row], row[:-1][same_row]
+    in_trade = padded[row, start + 1] != 0
+    start, end, row = start[in_trade], np.minimum(end[in_trade], n - 1), row[in_trade]
+    trade_ret = log_eq[row, end] - log_eq[row, start]
+    trades = np.bincount(row, minlength=n_pairs)
+    wins = np.bincount(row, weights=trade_ret > 0, minlength=n_pairs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hit_rate = np.where(trades > 0, wins / trades, np.nan)
+
+    return {"total_return": total, "cagr": cagr, "max_drawdown": drawdown, "hit_rate": hit_rate,
+            "trades": trades, "exposure": np.abs(pos).mean(axis=1)}
+
+
+def _sweep_chunk(close, ma_by_window, fast_windows, slow_windows, rsi, hist, allow_short, cost):
+    fast_ma = np.stack([ma_by_window[f] for f in fast_windows])
+    slow_ma = np.stack([ma_by_window[s] for s in slow_windows])
+    # (快線數, 慢線數, K 棒數) 一次判斷，再攤平成 (參數組數, K 棒數)
+    pos = positions(close, fast_ma[:, None, :], slow_ma[None, :, :], rsi, hist, allow_short)
+    stats = evaluate(close, pos.reshape(-1, len(close)), cost)
+    return {k: v.reshape(len(fast_windows), len(slow_windows)) for k, v in stats.items()}
+
+
+def sweep(df, fast_windows, slow_windows, use_rsi=False, use_macd=False, allow_short=False, cost=DEFAULT_COST, parallel=None):
+    """回測整個 (快線 x 慢線) 網格，回傳 {指標名稱: DataFrame(index=快線, columns=慢線)}。
+
+    快線 >= 慢線的組合沒有意義，結果為 NaN。
+    """
+    fast_windows, slow_windows = list(fast_windows), list(slow_windows)
+    close = df["Close"].to_numpy(dtype=float)
+    ma_by_window = indicators.rolling_means(close, sorted(set(fast_windows) | set(slow_windows)))
+    cols = indicators.compute(close, df["Volume"])[0] if (use_rsi or use_macd) else {}
+    args = (cols.get("RSI") if use_rsi else None, cols.get("Hist") if use_macd else None, allow_short, cost)
+
+    n_pairs = len(fast_windows) * len(slow_windows)
+    parallel = n_pairs >= PARALLEL_MIN_PAIRS if parallel is None else parallel
+    rows_per_chunk = max(1, CHUNK_PAIRS // len(slow_windows))
+    chunks = [fast_windows[i:i + rows_per_chunk] for i in range(0, len(fast_windows), rows_per_chunk)]
+    if parallel:
+        pool = _get_pool()
+        futures = [pool.submit(_sweep_chunk, close, ma_by_window, c, slow_windows, *args) for c in chunks]
+        parts = [f.result() for f in futures]
+    else:
+        parts = [_sweep_chunk(close, ma_by_window, c, slow_windows, *args) for c in chunks]
+    stats = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    invalid = np.asarray(fast_windows)[:, None] >= np.asarray(slow_windows)[None, :]
+    return {k: pd.DataFrame(np.where(invalid, np.nan, v.astype(float)), index=fast_windows, columns=slow_windows) for k, v in stats.items()}
+
+
+def buy_and_hold(df):
+    close = df["Close"].to_numpy(dtype=float)
+    return {k: float(v[0]) for k, v in evaluate(close, np.ones((1, len(close))), cost=0.0).items()}
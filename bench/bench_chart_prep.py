@@ -0,0 +1,95 @@
+"""圖表前處理的微基準：逐列 Python (舊) vs 向量化 chart_prep (新)。
+
+執行：python bench/bench_chart_prep.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chart_prep  # noqa: E402
+
+PALETTE_VOL = ("#C70039", "#FF5733", "#FFC300")
+PALETTE_MACD = ("#2db09c", "#ff6666")
+
+
+def make_daily(years, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.bdate_range(end="2026-10-16", periods=252 * years, tz="America/New_York")
+    idx = idx.delete(rng.choice(len(idx), size=9 * years, replace=False))   # 模擬國定假日
+    n = len(idx)
+    vol = rng.integers(1_000_000, 50_000_000, n).astype(float)
+    return pd.DataFrame({"Volume": vol, "Vol_MA": pd.Series(vol).rolling(20).mean().to_numpy(), "Hist": rng.normal(0, 1, n)}, index=idx)
+
+
+def make_intraday(days, seed=1):
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range(end="2026-10-16", periods=days)
+    idx = pd.DatetimeIndex(np.concatenate([pd.date_range(f"{d:%Y-%m-%d} 04:00", f"{d:%Y-%m-%d} 19:55", freq="5min") for d in sessions])).tz_localize("America/New_York")
+    n = len(idx)
+    vol = rng.integers(1_000, 500_000, n).astype(float)
+    return pd.DataFrame({"Volume": vol, "Vol_MA": pd.Series(vol).rolling(20).mean().to_numpy(), "Hist": rng.normal(0, 1, n)}, index=idx)
+
+
+# --- 舊版 (app.py 原本的寫法) ---
+def legacy_volume_colors(df):
+    explode, normal, shrink = PALETTE_VOL
+    return [explode if (r['Volume']/(r['Vol_MA'] if r['Vol_MA']>0 else 1))>=2 else normal if (r['Volume']/(r['Vol_MA'] if r['Vol_MA']>0 else 1))>=1 else shrink for _, r in df.iterrows()]
+
+
+def legacy_macd_colors(df):
+    bull, bear = PALETTE_MACD
+    return [(bull if h>0 else bear) for h in df['Hist'].fillna(0)]
+
+
+def legacy_rangebreaks(df):
+    # 盤中資料套用同樣的作法：建立完整 5 分鐘格點再找出缺少的時間
+    if chart_prep._is_intraday(df.index):
+        return [dict(values=pd.date_range(start=df.index[0], end=df.index[-1], freq="5min").difference(df.index).strftime("%Y-%m-%d %H:%M:%S").tolist())]
+    return [dict(values=pd.date_range(start=df.index[0], end=df.index[-1]).difference(df.index).strftime("%Y-%m-%d").tolist())]
+
+
+# --- 新版 ---
+def new_volume_colors(df):
+    return chart_prep.volume_colors(df['Volume'], df['Vol_MA'], *PALETTE_VOL)
+
+
+def new_macd_colors(df):
+    return chart_prep.macd_colors(df['Hist'].fillna(0), *PALETTE_MACD)
+
+
+def new_rangebreaks(df):
+    chart_prep.clear_gap_cache()   # 量測冷啟動 (沒有快取) 的成本
+    return chart_prep.rangebreaks(df.index)
+
+
+def new_rangebreaks_cached(df):
+    return chart_prep.rangebreaks(df.index, start=df.index[len(df) // 2])
+
+
+def best_ms(fn, df, number=1, repeat=3):
+    return min(timeit.repeat(lambda: fn(df), number=number, repeat=repeat)) / number * 1000
+
+
+def main():
+    frames = {"10 年日線": make_daily(10), "30 天 5 分 K": make_intraday(30)}
+    cases = [
+        ("成交量配色", legacy_volume_colors, new_volume_colors),
+        ("MACD 配色", legacy_macd_colors, new_macd_colors),
+        ("rangebreaks", legacy_rangebreaks, new_rangebreaks),
+        ("rangebreaks (快取)", legacy_rangebreaks, new_rangebreaks_cached),
+    ]
+    print(f"{'資料':<12}{'項目':<18}{'K 棒數':>8}{'舊 (ms)':>12}{'新 (ms)':>12}{'倍數':>8}")
+    for name, df in frames.items():
+        assert list(legacy_volume_colors(df)) == list(new_volume_colors(df))
+        assert list(legacy_macd_colors(df)) == list(new_macd_colors(df))
+        for label, old, new in cases:
+            t_old, t_new = best_ms(old, df), best_ms(new, df)
+            print(f"{name:<12}{label:<18}{len(df):>8}{t_old:>12.2f}{t_new:>12.3f}{t_old / t_new:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
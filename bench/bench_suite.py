@@ -0,0 +1,294 @@
+"""整體效能 benchmark：以 Streamlit AppTest 在無瀏覽器的情況下驅動 app.py，資料來自本機錄製檔 (ReplayProvider)。
+
+量測項目：
+- app.cold_load        全部快取清空後第一次載入一檔股票
+- app.warm_load        快取已熱，另一個 session 開同一檔股票
+- app.full_rerun_slider   拖動圖表月數滑桿後的整頁 rerun
+- app.full_rerun_calc     交易計算輸入變更後的整頁 rerun
+  (AppTest 的元件變更一律重跑整個 script，不會只重跑 fragment；這兩項量的是快取已熱時的整頁 rerun，
+   瀏覽器中只重跑圖表 / 計算機 fragment，實際耗時更短)
+- app.peak_mb_cold / app.peak_mb_session   單一 session 載入時的記憶體峰值 (tracemalloc：Python 物件與 NumPy 陣列，不含 pyarrow)
+- app.sessions_*       N 個 session 依序載入 + 操作 (共用快取) 的吞吐量與延遲
+- core.concurrent_*    N 個執行緒同時產生快照 (headless core) 的吞吐量與延遲
+- micro.*              指標、圖表前處理、週 K 合成在 2 / 10 / 30 年日線上的耗時
+
+結果寫成 JSON，並與基準檔比較，變慢超過容許範圍 (預設 25%，micro.* 為 100%) 就標示為退步 (--check 時以 exit code 1 結束)：
+
+    python bench/bench_suite.py                              # 量測並與 bench/baseline.json 比較
+    python bench/bench_suite.py --check --tolerance 0.3      # CI：有退步就失敗
+    python bench/bench_suite.py --save-baseline              # 把這次結果存成新的基準
+    python bench/bench_suite.py --fixtures fixtures          # 改用 providers.py record 錄下的真實資料
+
+未指定 --fixtures 時使用 bench/synthetic.py 產生的固定合成資料 (第一次執行時產生)。
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+APP = os.path.join(ROOT, "app.py")
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, "fixtures")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUT = os.path.join(BENCH_DIR, "results.json")
+APP_TIMEOUT = 120
+MICRO_YEARS = (2, 10, 30)
+
+# 在 import app 的模組之前設定：資料來源、本機資料庫位置、AI 模型
+os.environ.setdefault("STOCK_APP_PROVIDER", "replay")
+os.environ.setdefault("STOCK_APP_DATA_DIR", tempfile.mkdtemp(prefix="stock-bench-"))
+os.environ["STOCK_APP_AI_MODEL"] = "stub"
+os.environ["STOCK_APP_AI_STUB_DELAY"] = "0"
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+import streamlit as st  # noqa: E402
+
+import ai_report  # noqa: E402
+import chart_prep  # noqa: E402
+import core  # noqa: E402
+import indicators  # noqa: E402
+import market_cache  # noqa: E402
+import ohlcv_store  # noqa: E402
+import providers  # noqa: E402
+import resample  # noqa: E402
+import sessions  # noqa: E402
+import synthetic  # noqa: E402
+
+
+# --- 環境控制 ---
+def reset_caches(fixtures, latency):
+    """回到冷啟動狀態：清空行程內所有快取、換一個空的本機資料庫、重新建立 provider。"""
+    market_cache.CACHE.clear()
+    for cache in (indicators._cache, resample._cache, sessions._label_cache, chart_prep._gap_cache): cache.clear()
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    ohlcv_store.DATA_DIR = tempfile.mkdtemp(prefix="stock-bench-")
+    providers.set_provider(providers.ReplayProvider(root=fixtures, latency=latency))
+    ai_report.set_service(ai_report.ReportService(ai_report.StubModel(delay=0)))
+    gc.collect()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def new_session(ticker):
+    at = AppTest.from_file(APP, default_timeout=APP_TIMEOUT)
+    at.session_state["sidebar_ticker"] = ticker
+    return at
+
+
+def check(at):
+    if at.exception: raise RuntimeError(f"app 發生例外: {at.exception[0].value}")
+    return at
+
+
+# --- App 層級 ---
+def bench_app(tickers, fixtures, latency, repeat):
+    out = {}
+    cold, warm, slider, calc = [], [], [], []
+    for ticker in tickers:
+        for _ in range(repeat):
+            reset_caches(fixtures, latency)
+            at = new_session(ticker)
+            cold.append(timed(lambda: check(at.run())))
+            other = new_session(ticker)
+            warm.append(timed(lambda: check(other.run())))
+            for months in (3, 9, 12):
+                slider.append(timed(lambda: check(at.slider[0].set_value(months).run())))
+            buy = at.number_input(key="buy_price_input")
+            for delta in (1.0, 2.0, 3.0):
+                calc.append(timed(lambda: check(buy.set_value(buy.value + delta).run())))
+    out["app.cold_load"] = cold
+    out["app.warm_load"] = warm
+    out["app.full_rerun_slider"] = slider
+    out["app.full_rerun_calc"] = calc
+    return {name: (statistics.median(v), "s", False) for name, v in out.items()}
+
+
+def bench_memory(ticker, fixtures, latency):
+    def peak(fn):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1] / 2**20
+        finally: tracemalloc.stop()
+
+    reset_caches(fixtures, latency)
+    cold = peak(lambda: check(new_session(ticker).run()))
+    session = peak(lambda: check(new_session(ticker).run()))   # 快取已熱：每多一個 session 的額外成本
+    return {"app.peak_mb_cold": (cold, "MB", False), "app.peak_mb_session": (session, "MB", False)}
+
+
+def bench_sessions(tickers, fixtures, latency, sessions_n):
+    """sessions_n 個 session 輪流開啟 (股票輪流分配) 並拖動一次滑桿，全部保留到最後。
+
+    AppTest 會暫時替換 Streamlit 的全域 Runtime，不能在多個執行緒同時執行，所以這裡是依序執行；
+    量到的是共用快取下每個 session 的成本，以及 N 個 session 同時存在時的記憶體。
+    """
+    reset_caches(fixtures, latency)
+    alive, latencies = [], []
+    start = time.perf_counter()
+    for i in range(sessions_n):
+        at = new_session(tickers[i % len(tickers)])
+        latencies.append(timed(lambda: check(at.run())) + timed(lambda: check(at.slider[0].set_value(3).run())))
+        alive.append(at)
+    wall = time.perf_counter() - start
+    return {"app.sessions_throughput": (sessions_n / wall, "sessions/s", True),
+            "app.sessions_p95": (percentile(latencies, 0.95), "s", False)}
+
+
+def bench_concurrency(tickers, fixtures, latency, sessions_n):
+    """sessions_n 個執行緒同時向 headless core 要快照 (冷快取)：量測共用快取、排程器與指標快取在併發下的表現。"""
+    reset_caches(fixtures, latency)
+    latencies, lock = [], threading.Lock()
+
+    def one(i):
+        elapsed = timed(lambda: core.load_snapshot(tickers[i % len(tickers)]))
+        with lock: latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(sessions_n) as pool: list(pool.map(one, range(sessions_n)))
+    wall = time.perf_counter() - start
+    return {"core.concurrent_throughput": (sessions_n / wall, "snapshots/s", True),
+            "core.concurrent_p95": (percentile(latencies, 0.95), "s", False)}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+# --- 微基準 ---
+def best_ms(fn, setup=None, repeat=7):
+    """最佳一次的耗時 (ms)；有 setup 時每次量測只執行一次 fn，否則自動調整次數讓每次量測至少 50 ms。"""
+    if setup is not None: return min(timeit.repeat(fn, setup=setup, number=1, repeat=repeat * 2)) * 1000
+    timer = timeit.Timer(fn)
+    number = max(1, math.ceil(0.05 / (timer.timeit(1) or 1e-9)))
+    return min(timer.repeat(number=number, repeat=repeat)) / number * 1000
+
+
+def bench_micro(years_list=MICRO_YEARS):
+    out = {}
+    for years in years_list:
+        df = synthetic.make_daily("BENCH", years)
+        cols, _ = indicators.compute(df["Close"], df["Volume"])
+        full = df.join(indicators.compute_indicators("BENCH", df))
+        previous = df.iloc[:-1]
+
+        def cold(clear, fn):
+            def run():
+                clear()   # 清快取的成本可忽略
+                fn()
+            return run
+
+        def before_new_bar():
+            # 快取停在前一根 K 棒，量測的是多一根 K 棒時的 O(1) 推進
+            indicators.clear_cache()
+            indicators.compute_indicators("BENCH", previous)
+
+        cases = {   # 名稱 -> (量測的函式, 每次量測前的準備)
+            "indicators.cold": (cold(indicators.clear_cache, lambda: indicators.compute_indicators("BENCH", df)), None),
+            "indicators.incremental": (lambda: indicators.compute_indicators("BENCH", df), before_new_bar),
+            "chart_prep.rangebreaks_cold": (cold(chart_prep.clear_gap_cache, lambda: chart_prep.rangebreaks(df.index)), None),
+            "chart_prep.rangebreaks_cached": (lambda: chart_prep.rangebreaks(df.index, start=df.index[len(df) // 2]), None),
+            "chart_prep.volume_colors": (lambda: chart_prep.volume_colors(full["Volume"], full["Vol_MA"], "a", "b", "c"), None),
+            "chart_prep.macd_colors": (lambda: chart_prep.macd_colors(cols["Hist"], "a", "b"), None),
+            "resample.weekly": (cold(resample.clear_cache, lambda: resample.resample("BENCH", df, "1wk")), None),
+        }
+        for name, (fn, setup) in cases.items():
+            out[f"micro.{name}.{years}y"] = (best_ms(fn, setup), "ms", False)
+    return out
+
+
+# --- 結果與基準比較 ---
+def to_report(metrics, args):
+    import pandas as pd
+    return {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "numpy": np.__version__,
+                 "pandas": pd.__version__, "streamlit": st.__version__, "fixtures": args.fixtures,
+                 "latency": args.latency, "sessions": args.sessions, "repeat": args.repeat},
+        "metrics": {name: {"value": value, "unit": unit, "higher_is_better": higher}
+                    for name, (value, unit, higher) in sorted(metrics.items())},
+    }
+
+
+def compare(report, baseline, tolerance, micro_tolerance):
+    """回傳退步的項目名稱；並印出與基準的比較表。micro.* 多在 1 ms 以下，抖動大，另用較寬的容許範圍。"""
+    regressions = []
+    base = baseline.get("metrics", {})
+    print(f"{'項目':<44}{'本次':>12}{'基準':>12}{'變化':>9}")
+    for name, m in report["metrics"].items():
+        b = base.get(name)
+        if b is None:
+            print(f"{name:<44}{m['value']:>12.4g}{'-':>12}{'新項目':>9}")
+            continue
+        ratio = m["value"] / b["value"] if b["value"] else float("inf")
+        tol = micro_tolerance if name.startswith("micro.") else tolerance
+        worse = ratio < 1 / (1 + tol) if m["higher_is_better"] else ratio > 1 + tol
+        if worse: regressions.append(name)
+        print(f"{name:<44}{m['value']:>12.4g}{b['value']:>12.4g}{ratio - 1:>+8.0%}{' ⚠️ 退步' if worse else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="股票儀表板效能 benchmark")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="ReplayProvider 錄製檔目錄 (不存在時產生合成資料)")
+    parser.add_argument("--tickers", nargs="+", default=list(synthetic.TICKERS[:4]))
+    parser.add_argument("--latency", type=float, default=0.0, help="模擬上游延遲 (秒)")
+    parser.add_argument("--repeat", type=int, default=2, help="每檔股票冷啟動量測次數")
+    parser.add_argument("--sessions", type=int, default=8, help="模擬的 session / 併發執行緒數")
+    parser.add_argument("--skip-app", action="store_true", help="只跑微基準")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允許比基準慢的比例")
+    parser.add_argument("--micro-tolerance", type=float, default=1.0, help="micro.* 允許比基準慢的比例")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="有退步時以 exit code 1 結束")
+    args = parser.parse_args(argv)
+
+    metrics = bench_micro()   # 先跑微基準，避免受到 app 量測留下的執行緒與記憶體影響
+    if not args.skip_app:
+        synthetic.ensure_fixtures(args.fixtures, tickers=args.tickers)
+        metrics.update(bench_app(args.tickers, args.fixtures, args.latency, args.repeat))
+        metrics.update(bench_memory(args.tickers[0], args.fixtures, args.latency))
+        metrics.update(bench_sessions(args.tickers, args.fixtures, args.latency, args.sessions))
+        metrics.update(bench_concurrency(args.tickers, args.fixtures, args.latency, args.sessions))
+
+    report = to_report(metrics, args)
+    with open(args.out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"已更新基準 {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("沒有基準檔，略過比較 (用 --save-baseline 建立)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance, args.micro_tolerance)
+    if regressions: print(f"⚠️ {len(regressions)} 個項目比基準慢超過容許範圍: {', '.join(regressions)}")
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""benchmark 用的合成行情：固定亂數種子產生日線 / 5 分 K / info，存成 ReplayProvider 的錄製格式。
+
+沒有網路 (或不想讓結果隨行情變動) 時，用這份資料代替 python providers.py record 錄下的真實資料。
+"""
+import os
+import sys
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import providers  # noqa: E402
+import sessions  # noqa: E402
+
+END = "2026-10-16"
+TICKERS = ("TSLA", "AAPL", "MSFT", "NVDA", "2330.TW")
+FX_PAIRS = ("USDTWD=X",)
+
+
+def _rng(ticker, salt=""):
+    return np.random.default_rng(zlib.crc32(f"{ticker}{salt}".encode()))
+
+
+def make_ohlcv(index, rng, start_price=100.0, vol=0.02, volume=(1_000_000, 50_000_000)):
+    n = len(index)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, vol, n)))
+    open_ = close * (1 + rng.normal(0, vol / 4, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, n)))
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close,
+                         "Volume": rng.integers(*volume, n).astype(float)}, index=index)
+
+
+def make_daily(ticker, years, end=END):
+    """years 年的日線，交易日依該交易所的行事曆 (扣掉週末與假日)。"""
+    ex = sessions.exchange_for(ticker)
+    days = pd.bdate_range(end=end, periods=int(252 * years * 1.04))
+    table = sessions.session_table(ticker, days[0], days[-1])
+    index = table.index.tz_localize(ex.tz).rename("Date")[-int(252 * years):]
+    return make_ohlcv(index, _rng(ticker, "daily"), start_price=50 + zlib.crc32(ticker.encode()) % 400)
+
+
+def make_intraday(ticker, day=END):
+    """day 當天盤前到盤後的 5 分 K。"""
+    row = sessions.session_for(ticker, day)
+    index = pd.date_range(row["pre_open"], row["post_close"], freq="5min", inclusive="left").rename("Datetime")
+    return make_ohlcv(index, _rng(ticker, "intraday"), start_price=100.0, vol=0.002, volume=(1_000, 500_000))
+
+
+class SyntheticProvider:
+    """與 YahooProvider 相同介面的合成資料來源 (只用來錄製 fixture)。"""
+    name = "synthetic"
+
+    def daily(self, ticker, years=None, start=None, timeout=None):
+        df = make_daily(ticker, years or 2)
+        return df if start is None else df[df.index >= pd.Timestamp(start).tz_localize(df.index.tz)]
+
+    def intraday(self, ticker, timeout=None):
+        return make_intraday(ticker)
+
+    def intraday_since(self, ticker, start, timeout=None):
+        df = make_intraday(ticker)
+        return df[df.index >= pd.Timestamp(start)]
+
+    def info(self, ticker, timeout=None):
+        daily = make_daily(ticker, 1)
+        return {"longName": f"{ticker} Synthetic", "quoteType": "EQUITY", "sector": "Technology",
+                "marketCap": float(zlib.crc32(ticker.encode()) % 500) * 1e9, "trailingPE": 25.0, "trailingEps": 4.2,
+                "previousClose": float(daily["Close"].iloc[-2]), "currentPrice": float(daily["Close"].iloc[-1])}
+
+    def fx(self, pair, timeout=None):
+        return self.daily(pair, 1).iloc[-1:]
+
+
+def ensure_fixtures(root, tickers=TICKERS, years=10):
+    """root 底下沒有錄製檔時產生一份；回傳 root。"""
+    if all(os.path.exists(os.path.join(root, providers.ohlcv_store.safe_name(t), "daily.parquet")) for t in tickers):
+        return root
+    providers.record(tickers, root=root, years=years, fx_pairs=FX_PAIRS, inner=SyntheticProvider())
+    return root
@@ -0,0 +1,113 @@
+"""圖表前處理：K 棒配色與 rangebreaks (休市缺口)，全部以向量運算完成。"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+GAP_CACHE_SIZE = 64
+GAP_CACHE_BYTES = 8 * 2 ** 20   # 休市缺口合計上限 (不含 market_cache.MEMORY_BUDGET)
+INTRADAY_MAX_STEP = 12 * 3600 * 10**9   # K 棒間距小於 12 小時視為盤中資料 (日線遇到日光節約也有 23 小時)
+COARSE_MIN_STEP = 4 * 86400 * 10**9     # 間距超過 4 天為週 K / 月 K，不需要 rangebreaks
+
+
+def volume_colors(volume, vol_ma, explode, normal, shrink):
+    """成交量 / 均量 >= 2 爆量、>= 1 正常、其餘量縮；均量無效時以 1 代替 (與原本逐列判斷相同)。"""
+    volume = np.asarray(volume, dtype=float)
+    vol_ma = np.asarray(vol_ma, dtype=float)
+    with np.errstate(invalid="ignore"):
+        ratio = volume / np.where(vol_ma > 0, vol_ma, 1.0)
+    return np.select([ratio >= 2, ratio >= 1], [explode, normal], shrink)
+
+
+def macd_colors(hist, bull, bear):
+    return np.where(np.asarray(hist, dtype=float) > 0, bull, bear)
+
+
+# --- 休市缺口 ---
+_lock = threading.Lock()
+_gap_cache = OrderedDict()   # key -> (缺口, bytes)
+_gap_bytes = 0
+
+
+def _is_intraday(index):
+    return len(index) > 1 and np.diff(index.asi8[:50]).min() < INTRADAY_MAX_STEP
+
+
+def _is_coarse(index):
+    return len(index) > 1 and np.median(np.diff(index.asi8[:50])) > COARSE_MIN_STEP
+
+
+def _day(t):
+    t = pd.Timestamp(t)
+    return (t.tz_localize(None) if t.tz is not None else t).normalize()
+
+
+def _daily_gaps(index):
+    # 整段歷史只算一次：平日卻沒有 K 棒的日期 (國定假日)，週末另外用 pattern 處理
+    days = index.tz_localize(None).normalize() if index.tz is not None else index.normalize()
+    has_weekend_bars = bool((days.dayofweek >= 5).any())   # 加密貨幣等全年無休的商品
+    calendar = pd.date_range(days[0], days[-1]) if has_weekend_bars else pd.bdate_range(days[0], days[-1])
+    return calendar.difference(days), has_weekend_bars
+
+
+def _intraday_gaps(index):
+    # 相鄰兩根 K 棒間距超過一根的長度就是休市 (午休、收盤後、週末)；回傳缺口起點與長度 (ns)
+    ts = index.asi8
+    step = np.diff(ts)
+    bar = np.median(step)
+    gap_pos = np.flatnonzero(step > bar * 1.5)
+    return ts[gap_pos] + int(bar), step[gap_pos] - int(bar)
+
+
+def trading_gaps(index):
+    """依 (第一根, 最後一根, 長度) 快取整段 index 的休市缺口。"""
+    global _gap_bytes
+    key = (index[0], index[-1], len(index), _is_intraday(index))
+    with _lock:
+        if key in _gap_cache:
+            _gap_cache.move_to_end(key)
+            return _gap_cache[key][0]
+    gaps = _intraday_gaps(index) if key[3] else _daily_gaps(index)
+    size = sum(getattr(g, "nbytes", 0) for g in gaps)
+    with _lock:
+        old = _gap_cache.pop(key, None)
+        if old is not None: _gap_bytes -= old[1]
+        _gap_cache[key] = (gaps, size)
+        _gap_bytes += size
+        while len(_gap_cache) > 1 and (len(_gap_cache) > GAP_CACHE_SIZE or _gap_bytes > GAP_CACHE_BYTES):
+            _gap_bytes -= _gap_cache.popitem(last=False)[1][1]
+    return gaps
+
+
+def clear_gap_cache():
+    global _gap_bytes
+    with _lock:
+        _gap_cache.clear()
+        _gap_bytes = 0
+
+
+def rangebreaks(index, start=None, end=None):
+    """回傳 plotly 的 rangebreaks 設定；start/end 指定顯示區間，缺口只取區間內的部分。"""
+    if len(index) < 2 or _is_coarse(index): return []
+    start = index[0] if start is None else start
+    end = index[-1] if end is None else end
+
+    if _is_intraday(index):
+        gap_start, gap_len = trading_gaps(index)
+        lo, hi = np.searchsorted(gap_start, [pd.Timestamp(start).value, pd.Timestamp(end).value])
+        gap_start, gap_len = gap_start[lo:hi], gap_len[lo:hi]
+        # plotly 一組 rangebreak 只有一個 dvalue，所以依缺口長度分組 (通常只有夜盤、週末幾種)
+        tz = index.tz
+        breaks = []
+        for length in np.unique(gap_len):
+            starts = pd.to_datetime(gap_start[gap_len == length], utc=True)
+            starts = starts.tz_convert(tz) if tz is not None else starts.tz_localize(None)
+            breaks.append(dict(values=starts.strftime("%Y-%m-%d %H:%M:%S").tolist(), dvalue=int(length // 10**6)))
+        return breaks
+
+    holidays, has_weekend_bars = trading_gaps(index)
+    lo, hi = holidays.searchsorted(_day(start)), holidays.searchsorted(_day(end), side="right")
+    breaks = [dict(values=holidays[lo:hi].strftime("%Y-%m-%d").tolist())]
+    if not has_weekend_bars: breaks.insert(0, dict(bounds=["sat", "mon"]))
+    return breaks
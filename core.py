@@ -0,0 +1,189 @@
+"""無 UI 的分析核心：把儀表板上的判讀整理成一份結構化快照 (可直接轉成 JSON 的 dict)。
+
+儀表板與批量 CLI 共用同一套規則 (策略均線、訊號、均線方向、當日高低點、盤前盤後價、綜合判讀文字)。
+CLI 以多個 worker process 並行產生快照並輸出 JSON lines，可在開盤前預熱本機日線資料庫，或餵給其他系統：
+
+    python core.py TSLA AAPL 2330.TW --workers 4 --out snapshots.jsonl
+    python core.py --file watchlist.txt > snapshots.jsonl
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import market_cache
+import scheduler
+import screener
+import sessions
+import signals
+
+BIG_CAP = 200_000_000_000      # 市值超過此數視為巨頭，自動策略改用較慢的均線
+MIN_BARS = 200                 # 日線不足這麼多根不做判讀 (與儀表板相同)
+EXT_MIN_DIFF = 0.001           # 盤中最新價與正規收盤價差超過 0.1% 視為盤後 / 試撮價
+
+
+def auto_strategy(info):
+    """依市值自動選擇策略均線：(快線, 慢線, 說明)。"""
+    if info.get("marketCap", 0) > BIG_CAP: return 10, 20, "🐘 巨頭穩健"
+    return 5, 10, "🚀 小型飆股"
+
+
+def quote(df, info):
+    """(昨收, 正規時段價格)；info 缺值時以日線代替。"""
+    previous_close = info.get("previousClose", df["Close"].iloc[-2])
+    regular_price = info.get("currentPrice", info.get("regularMarketPrice", df["Close"].iloc[-1]))
+    return float(previous_close), float(regular_price)
+
+
+def extended_price(info, intraday, regular_price):
+    """盤前 / 盤後價格 (價格, 標籤)；沒有時 (含盤中資料抓取失敗) 回傳 None。"""
+    if info.get("preMarketPrice"): return float(info["preMarketPrice"]), "盤前"
+    if info.get("postMarketPrice"): return float(info["postMarketPrice"]), "盤後"
+    if intraday.empty: return None
+    live_price = float(intraday["Close"].iloc[-1])
+    if abs(live_price - regular_price) / regular_price > EXT_MIN_DIFF: return live_price, "盤後/試撮"
+    return None
+
+
+def day_range(ticker, intraday, previous_close):
+    """當日正規時段的高低點與相對昨收的漲跌幅；沒有正規時段資料時以整段盤中資料代替。"""
+    if intraday.empty: return None
+    regular = intraday[sessions.regular_mask(ticker, intraday.index)]
+    bars = regular if not regular.empty else intraday
+    high, low = float(bars["High"].max()), float(bars["Low"].min())
+    return {"high": high, "low": low, "high_pct": (high - previous_close) / previous_close * 100,
+            "low_pct": (low - previous_close) / previous_close * 100}
+
+
+def ma_table(df, windows=indicators.MA_WINDOWS):
+    """各均線最新值與方向 (與前一根比較)；df 需含 MA_n 欄位。"""
+    last, prev = df.iloc[-1], df.iloc[-2]
+    return [{"window": w, "value": float(last[f"MA_{w}"]), "rising": bool(last[f"MA_{w}"] > prev[f"MA_{w}"])} for w in windows]
+
+
+def signal_states(df, fast, slow):
+    """趨勢 / 量能 / MACD / RSI 判讀；df 需含 compute_indicators 的欄位。"""
+    last = df.iloc[-1]
+    fast_val, slow_val = (float(indicators.sma(df["Close"], w)[-1]) for w in (fast, slow))
+    vol_ratio = float(signals.volume_ratio(last["Volume"], last["Vol_MA"]))
+    hist = float(last.get("Hist", 0))
+    return {"trend": signals.trend_state(last["Close"], fast_val, slow_val), "ma_fast": fast_val, "ma_slow": slow_val,
+            "volume": signals.volume_state(vol_ratio), "volume_ratio": vol_ratio,
+            "macd": signals.macd_state(hist), "macd_value": float(last.get("MACD", 0)), "hist": hist,
+            "rsi": signals.rsi_state(last["RSI"]), "rsi_value": float(last["RSI"])}
+
+
+def summary_text(ticker, states):
+    rsi_msg = signals.RSI_DISPLAY[states["rsi"]][0]
+    return f"目前 {ticker} 呈現{states['trend']}排列，RSI 數值 {states['rsi_value']:.1f} ({rsi_msg})。請留意上方壓力與支撐。"
+
+
+def snapshot(ticker, df, intraday, info, fast=None, slow=None):
+    """單一股票的完整判讀快照；fast / slow 未指定時依市值自動選擇。df 需已 join 指標欄位。"""
+    desc = "自訂策略"
+    if fast is None or slow is None: fast, slow, desc = auto_strategy(info)
+    previous_close, regular_price = quote(df, info)
+    states = signal_states(df, fast, slow)
+    ext = extended_price(info, intraday, regular_price)
+    change = regular_price - previous_close
+    return {
+        "ticker": ticker,
+        "name": info.get("longName", ticker),
+        "as_of": df.index[-1],
+        "strategy": {"fast": fast, "slow": slow, "desc": desc},
+        "price": {"regular": regular_price, "previous_close": previous_close, "change": change,
+                  "change_pct": change / previous_close * 100},
+        "extended": None if ext is None else {"price": ext[0], "label": ext[1], "change_pct": (ext[0] - regular_price) / regular_price * 100},
+        "day_range": day_range(ticker, intraday, previous_close),
+        "signals": states,
+        "ma": ma_table(df),
+        "summary": summary_text(ticker, states),
+    }
+
+
+# --- 資料載入 (經過共用快取) ---
+def _result(future, name, default):
+    try: return future.result(timeout=market_cache.FETCH_TIMEOUTS[name])
+    except Exception: return default
+
+
+def load_snapshot(ticker, fast=None, slow=None):
+    """抓取 (或取用快取的) 日線、盤中與 info 後產生快照；日線不足時丟出 ValueError。"""
+    pool = market_cache.EXECUTOR
+    history = pool.submit(market_cache.get_history, ticker)
+    intraday = pool.submit(market_cache.get_intraday, ticker)
+    info = pool.submit(market_cache.get_info, ticker)
+    df = history.result(timeout=market_cache.FETCH_TIMEOUTS["history"])
+    if df.empty or len(df) <= MIN_BARS: raise ValueError(f"{ticker} 資料不足")
+    df = df.join(indicators.compute_indicators(ticker, df, indicators.MA_WINDOWS))
+    return snapshot(ticker, df, _result(intraday, "intraday", pd.DataFrame()), _result(info, "info", {}), fast, slow)
+
+
+def to_jsonable(value):
+    """numpy 純量轉成 Python 型別、NaN 轉成 None、時間轉成 ISO 字串。"""
+    if isinstance(value, dict): return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)): return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic): value = value.item()
+    if isinstance(value, float) and math.isnan(value): return None
+    if isinstance(value, pd.Timestamp): return value.isoformat()
+    return value
+
+
+# --- 批量 CLI ---
+def _init_worker(workers):
+    # 每個 process 有自己的排程器，平分上游速率限制，總請求速率與單一 process 相同
+    scheduler.SCHEDULER.rate = scheduler.RATE / workers
+    scheduler.SCHEDULER.burst = max(1, scheduler.BURST // workers)
+
+
+def _snapshot_line(ticker, fast, slow):
+    """(是否成功, JSON 字串)；失敗時輸出 {"ticker", "error"}，不中斷整批。"""
+    try: return True, json.dumps(to_jsonable(load_snapshot(ticker, fast, slow)), ensure_ascii=False)
+    except Exception as e: return False, json.dumps({"ticker": ticker, "error": f"{type(e).__name__}: {e}"}, ensure_ascii=False)
+
+
+def run_batch(tickers, out, workers=None, fast=None, slow=None):
+    """以 worker process 並行產生快照，完成一筆就寫一行 JSON 到 out；回傳失敗筆數。"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tickers)))
+    failures = 0
+    # spawn：子 process 只 import 需要的模組，不會繼承父 process 的執行緒與鎖
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(workers,)) as pool:
+        futures = [pool.submit(_snapshot_line, t, fast, slow) for t in tickers]
+        for future in as_completed(futures):
+            ok, line = future.result()
+            failures += not ok
+            out.write(line + "\n")
+            out.flush()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量產生股票判讀快照 (JSON lines)")
+    parser.add_argument("tickers", nargs="*")
+    parser.add_argument("--file", help="watchlist 檔案 (逗號、空白或換行分隔)")
+    parser.add_argument("--workers", type=int, default=None, help="worker process 數 (預設 CPU 核心數)")
+    parser.add_argument("--fast", type=int, default=None, help="策略快線 (與 --slow 一起指定，否則依市值自動選擇)")
+    parser.add_argument("--slow", type=int, default=None)
+    parser.add_argument("--out", default="-", help="輸出檔 (預設 stdout)")
+    args = parser.parse_args(argv)
+
+    text = " ".join(args.tickers)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f: text += " " + f.read()
+    tickers = screener.parse_watchlist(text)
+    if not tickers: parser.error("請指定至少一個股票代號")
+
+    if args.out == "-": return run_batch(tickers, sys.stdout, args.workers, args.fast, args.slow)
+    with open(args.out, "w", encoding="utf-8") as out: return run_batch(tickers, out, args.workers, args.fast, args.slow)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
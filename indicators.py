@@ -0,0 +1,299 @@
+"""技術指標引擎 (取代每次 rerun 都重算的 ta 指標)。
+
+- 所有均線用累積和一次算完 (NumPy)。
+- RSI / MACD 用 Wilder / EMA 遞迴，數值與 ta 套件一致。
+- 結果依 (股票, 最後一根 K 棒, 參數) 快取；多了一根新 K 棒或最後一根被更新時，
+  只用保存的指標狀態推進一步 (O(1))，不必整段重算。
+"""
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+import ohlcv_store
+import perf
+
+MA_WINDOWS = (5, 10, 20, 30, 60, 120, 200)
+RSI_WINDOW = 14
+MACD_FAST, MACD_SLOW, MACD_SIGN = 12, 26, 9
+VOL_MA_WINDOW = 20
+
+CACHE_SIZE = 128
+CACHE_BYTES = 64 * 2 ** 20   # 快取的指標表合計上限 (不含 market_cache.MEMORY_BUDGET)；10 年日線一筆約 0.2 MB
+STORE_DTYPE = np.float32   # 快取的指標表以 float32 存放；遞推狀態仍用 float64
+
+
+def sma(values, window):
+    """簡單移動平均 (累積和)，前 window-1 筆為 NaN，與 ta.SMAIndicator 相同。"""
+    return rolling_means(values, (window,))[window]
+
+
+def rolling_means(values, windows):
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    out = {}
+    for w in windows:
+        if w < 1: raise ValueError(f"均線週期必須 >= 1: {w}")
+        res = np.full(n, np.nan)
+        if n >= w: res[w - 1:] = (csum[w:] - csum[:-w]) / w
+        out[w] = res
+    return out
+
+
+def _ewm(values, alpha):
+    # adjust=False 的 EMA 遞迴 (開頭的 NaN 會被略過)，交給 pandas 的 C 實作
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def _rsi_from_avgs(avg_up, avg_down):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(avg_down == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_up / avg_down))
+
+
+class IndicatorState:
+    """指標的遞迴狀態；push() 加一根新 K 棒、replace_last() 改寫最後一根，皆為 O(1)。"""
+
+    def __init__(self, ma_windows=MA_WINDOWS):
+        self.ma_windows = tuple(ma_windows)
+        self.closes = deque(maxlen=max(self.ma_windows))
+        self.volumes = deque(maxlen=VOL_MA_WINDOW)
+        self.n = 0
+        self.last_close = np.nan
+        self.avg_up = self.avg_down = np.nan
+        self.ema_fast = self.ema_slow = self.signal = np.nan
+        self.macd_n = 0
+        self._prev = None
+
+    def _snapshot(self):
+        snap = {k: v for k, v in self.__dict__.items() if k != "_prev"}
+        snap["closes"], snap["volumes"] = deque(self.closes, self.closes.maxlen), deque(self.volumes, self.volumes.maxlen)
+        return snap
+
+    def _restore(self, snap):
+        self.__dict__.update(snap)
+        self.closes, self.volumes = deque(snap["closes"], snap["closes"].maxlen), deque(snap["volumes"], snap["volumes"].maxlen)
+
+    def copy(self):
+        new = IndicatorState(self.ma_windows)
+        new._restore(self._snapshot())
+        new._prev = self._prev
+        return new
+
+    def push(self, close, volume):
+        self._prev = self._snapshot()
+        return self._advance(float(close), float(volume))
+
+    def replace_last(self, close, volume):
+        if self._prev is None: raise ValueError("沒有可以改寫的 K 棒")
+        self._restore(self._prev)
+        return self.push(close, volume)
+
+    def _advance(self, close, volume):
+        if self.n == 0:
+            up = down = 0.0
+            self.avg_up, self.avg_down = up, down
+            self.ema_fast = self.ema_slow = close
+        else:
+            diff = close - self.last_close
+            up, down = max(diff, 0.0), max(-diff, 0.0)
+            a = 1.0 / RSI_WINDOW
+            self.avg_up = (1 - a) * self.avg_up + a * up
+            self.avg_down = (1 - a) * self.avg_down + a * down
+            self.ema_fast += 2.0 / (MACD_FAST + 1) * (close - self.ema_fast)
+            self.ema_slow += 2.0 / (MACD_SLOW + 1) * (close - self.ema_slow)
+        self.n += 1
+        self.last_close = close
+        self.closes.append(close)
+        self.volumes.append(volume)
+
+        macd = self.ema_fast - self.ema_slow if self.n >= MACD_SLOW else np.nan
+        if self.n >= MACD_SLOW:
+            self.signal = macd if self.macd_n == 0 else self.signal + 2.0 / (MACD_SIGN + 1) * (macd - self.signal)
+            self.macd_n += 1
+        signal = self.signal if self.macd_n >= MACD_SIGN else np.nan
+
+        row = {f"MA_{w}": (sum(list(self.closes)[-w:]) / w if self.n >= w else np.nan) for w in self.ma_windows}
+        row["RSI"] = float(_rsi_from_avgs(self.avg_up, self.avg_down)) if self.n >= RSI_WINDOW else np.nan
+        row["MACD"], row["Signal"] = macd, signal
+        row["Hist"] = 0.0 if np.isnan(macd - signal) else macd - signal
+        row["Vol_MA"] = sum(self.volumes) / VOL_MA_WINDOW if self.n >= VOL_MA_WINDOW else np.nan
+        return row
+
+    @classmethod
+    def from_arrays(cls, close, volume, ma_windows, ema_fast, ema_slow, signal, avg_up, avg_down):
+        """由整段計算的結果還原狀態 (含最後一根之前的快照，供 replace_last 使用)。"""
+        n = len(close)
+
+        def at(i):
+            st = cls(ma_windows)
+            if i < 0: return st
+            st.closes.extend(close[max(0, i + 1 - st.closes.maxlen):i + 1])
+            st.volumes.extend(volume[max(0, i + 1 - VOL_MA_WINDOW):i + 1])
+            st.n, st.last_close = i + 1, float(close[i])
+            st.avg_up, st.avg_down = float(avg_up[i]), float(avg_down[i])
+            st.ema_fast, st.ema_slow = float(ema_fast[i]), float(ema_slow[i])
+            st.macd_n = max(0, i + 2 - MACD_SLOW)
+            st.signal = float(signal[i]) if st.macd_n else np.nan
+            return st
+
+        state = at(n - 1)
+        state._prev = at(n - 2)._snapshot()
+        return state
+
+
+def compute(close, volume, ma_windows=MA_WINDOWS):
+    """整段計算所有指標，回傳 (欄位 dict, IndicatorState)。"""
+    close = np.asarray(close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    ma_windows = tuple(sorted(set(ma_windows)))
+
+    cols = {f"MA_{w}": v for w, v in rolling_means(close, ma_windows).items()}
+
+    diff = np.diff(close, prepend=np.nan)
+    diff[0] = 0.0
+    avg_up = _ewm(np.clip(diff, 0, None), 1.0 / RSI_WINDOW)
+    avg_down = _ewm(np.clip(-diff, 0, None), 1.0 / RSI_WINDOW)
+    rsi = _rsi_from_avgs(avg_up, avg_down)
+    rsi[:RSI_WINDOW - 1] = np.nan
+    cols["RSI"] = rsi
+
+    ema_fast = _ewm(close, 2.0 / (MACD_FAST + 1))
+    ema_slow = _ewm(close, 2.0 / (MACD_SLOW + 1))
+    macd = ema_fast - ema_slow
+    macd[:MACD_SLOW - 1] = np.nan
+    signal = _ewm(macd, 2.0 / (MACD_SIGN + 1))
+    signal_out = signal.copy()
+    signal_out[:MACD_SLOW + MACD_SIGN - 2] = np.nan
+    cols["MACD"], cols["Signal"] = macd, signal_out
+    cols["Hist"] = np.nan_to_num(macd - signal_out, nan=0.0)
+    cols["Vol_MA"] = sma(volume, VOL_MA_WINDOW)
+
+    state = IndicatorState.from_arrays(close, volume, ma_windows, ema_fast, ema_slow, signal, avg_up, avg_down)
+    return cols, state
+
+
+# --- 快取 ---
+_lock = threading.Lock()
+_cache = OrderedDict()   # (ticker, timeframe, params) -> (frame, state, 最後一根 K 棒, 底層陣列, 已收盤 K 棒的 checksum, 全部的 checksum)
+_sizes = {}             # key -> bytes (底層陣列含預留列 + index)
+_nbytes = 0
+
+
+def _bar(df, i):
+    return df.index[i], float(df["Close"].iloc[i]), float(df["Volume"].iloc[i])
+
+
+def _spare(n):
+    return n // 4 + 64   # 預留的空列數，新 K 棒直接寫進去，用完才整塊搬家 (攤還 O(1))
+
+
+def _view(data, index, columns):
+    # copy=False：frame 直接看著底層陣列的前 len(index) 列，不複製
+    return pd.DataFrame(data[:len(index)], index=index, columns=columns, copy=False)
+
+
+def compute_indicators(ticker, df, ma_windows=MA_WINDOWS, timeframe="1d"):
+    """回傳與 df 同 index 的指標 DataFrame (共用、唯讀)；df 可以是任何週期的 K 線，以 timeframe 區分快取。
+
+    同一檔股票最後一根 K 棒沒變就直接回傳快取；多一根時把新列寫進預留的空列 (O(1))，
+    最後一根被修正時複製一份陣列再改寫 (只有一次 memcpy)；已經回傳的 frame 都不會被改動。
+    已收盤的 K 棒以收盤價 checksum 比對，除權息 / 分割還原後的歷史會整段重算。
+    """
+    params = (tuple(sorted(set(ma_windows))), RSI_WINDOW, MACD_FAST, MACD_SLOW, MACD_SIGN, VOL_MA_WINDOW)
+    key = (ticker, timeframe, params)
+
+    result = None
+    last = _bar(df, -1)
+    closed = ohlcv_store.close_checksum(df, -1)
+    with _lock:
+        # 增量更新會寫入共用的底層陣列，整段在鎖內完成
+        cached = _cache.get(key)
+        if cached is not None and len(df) >= 2:
+            frame, state, last_bar, data, closed_sum, all_sum = cached
+            if frame.index[0] != df.index[0]: pass
+            elif len(frame) == len(df) and last_bar == last and closed == closed_sum:
+                result = cached
+            elif len(frame) + 1 == len(df) and closed == all_sum and last_bar == _bar(df, -2):
+                result = _extend(frame, state, data, df, last, closed, replace=False)
+            elif len(frame) == len(df) and frame.index[-1] == df.index[-1] and closed == closed_sum:
+                result = _extend(frame, state, data, df, last, closed, replace=True)
+        if result is not None: _store(key, result)
+
+    perf.cache_lookup("indicators", result is not None)
+    if result is None:
+        cols, state = compute(df["Close"], df["Volume"], params[0])
+        data = np.empty((len(df) + _spare(len(df)), len(cols)), dtype=STORE_DTYPE)
+        data[:len(df)] = np.column_stack(list(cols.values()))
+        result = (_view(data, df.index, list(cols)), state, last, data, closed, ohlcv_store.close_checksum(df))
+        with _lock: _store(key, result)
+    return result[0]
+
+
+def _store(key, result):
+    global _nbytes
+    _cache[key] = result
+    _cache.move_to_end(key)
+    size = result[3].nbytes + result[0].index.nbytes
+    _nbytes += size - _sizes.get(key, 0)
+    _sizes[key] = size
+    while len(_cache) > 1 and (len(_cache) > CACHE_SIZE or _nbytes > CACHE_BYTES):
+        evicted, _ = _cache.popitem(last=False)
+        _nbytes -= _sizes.pop(evicted)
+
+
+def clear_cache():
+    global _nbytes
+    with _lock:
+        _cache.clear()
+        _sizes.clear()
+        _nbytes = 0
+
+
+def _extend(frame, state, data, df, last, closed, replace):
+    # 狀態是共用的，先複製一份再推進，避免影響其他 session 正在讀的快取
+    state = state.copy()
+    _, close, volume = last
+    row = state.replace_last(close, volume) if replace else state.push(close, volume)
+    index = df.index
+    n = len(index)
+    if replace or n > len(data):
+        # 改寫最後一根：先前回傳的 frame 看得到這一列，換一份新陣列再寫
+        grown = np.empty((max(len(data), n + _spare(n)), data.shape[1]), dtype=STORE_DTYPE)
+        grown[:n - 1] = data[:n - 1]
+        data = grown
+    # 新增時只寫第 n-1 列 (預留的空列)，先前回傳的 frame 只看得到前 n-1 列，不受影響
+    data[n - 1] = [row[c] for c in frame.columns]
+    return _view(data, index, frame.columns), state, last, data, closed, ohlcv_store.close_checksum(df)
+
+
+def latest_panel(close, volume, ma_windows=MA_WINDOWS):
+    """整個 watchlist 一次計算：close / volume 為 (日期 x 股票) 的寬表，回傳每檔股票最後一根的指標。
+
+    各股上市日不同，開頭的 NaN 會被略過；中間缺值以前一日收盤補齊。數值與單檔計算相同。
+    """
+    # 批量下載或 concat 出來的寬表是一欄一個 block，先轉成單一 float 陣列，後續運算才真的是向量化
+    close = pd.DataFrame(close.to_numpy(dtype=float), index=close.index, columns=close.columns).ffill()
+    volume = pd.DataFrame(np.where(close.notna(), np.nan_to_num(volume.to_numpy(dtype=float)), np.nan), index=close.index, columns=close.columns)
+    out = {"Close": close.iloc[-1], "Volume": volume.iloc[-1]}
+    for w in sorted(set(ma_windows)):
+        out[f"MA_{w}"] = close.tail(w).mean(skipna=False) if len(close) >= w else close.iloc[-1] * np.nan
+
+    diff = close.diff()
+    up = diff.where(diff > 0, 0.0).where(close.notna())
+    down = (-diff).where(diff < 0, 0.0).where(close.notna())
+    avg_up = up.ewm(alpha=1.0 / RSI_WINDOW, min_periods=RSI_WINDOW, adjust=False).mean().iloc[-1]
+    avg_down = down.ewm(alpha=1.0 / RSI_WINDOW, min_periods=RSI_WINDOW, adjust=False).mean().iloc[-1]
+    rsi = pd.Series(_rsi_from_avgs(avg_up.to_numpy(), avg_down.to_numpy()), index=close.columns)
+    out["RSI"] = rsi.where(avg_down.notna())
+
+    macd = close.ewm(span=MACD_FAST, min_periods=MACD_FAST, adjust=False).mean() - close.ewm(span=MACD_SLOW, min_periods=MACD_SLOW, adjust=False).mean()
+    signal = macd.ewm(span=MACD_SIGN, min_periods=MACD_SIGN, adjust=False).mean()
+    out["MACD"], out["Signal"] = macd.iloc[-1], signal.iloc[-1]
+    out["Hist"] = (macd.iloc[-1] - signal.iloc[-1]).fillna(0.0)
+    out["Vol_MA"] = volume.tail(VOL_MA_WINDOW).mean(skipna=False) if len(volume) >= VOL_MA_WINDOW else volume.iloc[-1] * np.nan
+    return pd.DataFrame(out)
+
+
+perf.register_gauge("indicator_cache_bytes", lambda: _nbytes)
@@ -0,0 +1,153 @@
+"""即時模式：每檔股票一個背景 poller，只補抓新的 5 分 K。
+
+- 同一檔股票不論幾個 session 在看，都共用同一個 poller 與緩衝區。
+- 每次補抓後把今天的正規時段 K 棒彙總成進行中的日 K，指標透過 indicators 的快取做 O(1) 增量更新。
+- 沒有 session 訂閱超過 IDLE_SECONDS 的 poller 會自行結束。
+"""
+import logging
+import threading
+import time
+
+import pandas as pd
+
+import indicators
+import market_cache
+import ohlcv_store
+import perf
+import providers
+import scheduler
+import sessions
+
+POLL_SECONDS = 30         # 向上游補抓新 K 棒的間隔
+REFRESH_SECONDS = 10      # 價格卡片 fragment 的重畫間隔
+IDLE_SECONDS = 5 * 60     # 這段時間沒人訂閱就停止 poller
+
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+LIVE_TIMEFRAME = "1d-live"  # 即時日線 (含進行中的 K 棒) 在指標快取中的週期名稱
+
+logger = logging.getLogger(__name__)
+
+
+def _latest_day(intraday):
+    # 只保留最後一個交易日 (與 period="1d" 相同)，跨日後舊的 K 棒自動淘汰
+    dates = intraday.index.date
+    return intraday[dates == dates[-1]]
+
+
+def session_bar(ticker, intraday):
+    """把最後一個交易日的正規時段 5 分 K 彙總成一根日 K；沒有正規時段資料時回傳 None。"""
+    if intraday.empty: return None
+    reg = intraday[sessions.regular_mask(ticker, intraday.index)]
+    if reg.empty: return None
+    tz = sessions.exchange_for(ticker).tz
+    last = reg.index[-1].tz_convert(tz) if reg.index.tz is not None else reg.index[-1]
+    return {"date": last.date(), "Open": float(reg["Open"].iloc[0]), "High": float(reg["High"].max()),
+            "Low": float(reg["Low"].min()), "Close": float(reg["Close"].iloc[-1]), "Volume": float(reg["Volume"].sum())}
+
+
+def apply_session_bar(daily, bar):
+    """用盤中彙總的 K 棒更新日線最後一根 (同一天) 或接上新的一根 (新交易日)。"""
+    if bar is None or daily.empty: return daily
+    day = pd.Timestamp(bar["date"])
+    if daily.index.tz is not None: day = day.tz_localize(daily.index.tz)
+    last = daily.index[-1]
+    if day < last.normalize(): return daily
+    row = daily.iloc[-1:].copy()
+    if day == last.normalize():
+        row["High"] = max(row["High"].iloc[0], bar["High"])
+        row["Low"] = min(row["Low"].iloc[0], bar["Low"])
+        row["Volume"] = max(row["Volume"].iloc[0], bar["Volume"])
+        row["Close"] = bar["Close"]
+    else:
+        row.index = pd.DatetimeIndex([day], name=daily.index.name)
+        for col in OHLCV: row[col] = bar[col]
+    return ohlcv_store.merge_bars(daily, row)
+
+
+class Poller:
+    """單一股票的背景補抓執行緒與共用緩衝區 (讀取請用 snapshot())。"""
+
+    def __init__(self, ticker, daily):
+        self.ticker = ticker
+        self._lock = threading.Lock()
+        self._base = daily[OHLCV]
+        self._intraday = pd.DataFrame()
+        self._daily = self._base
+        self._latest = None
+        self.version = 0
+        self.updated_at = None
+        self.last_seen = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"live-{ticker}", daemon=True)
+
+    def start(self, intraday=None):
+        if intraday is not None and not intraday.empty: self._publish(_latest_day(intraday))
+        self._thread.start()
+
+    def touch(self, daily=None):
+        self.last_seen = time.monotonic()
+        # 日線快取更新過 (例如隔天重新抓取)，以新的日線為基準
+        if daily is not None and not daily.empty and daily.index[-1] > self._base.index[-1]:
+            with self._lock: self._base = daily[OHLCV]
+            self._publish(self._intraday)
+
+    def snapshot(self):
+        """(盤中 5 分 K, 含進行中日 K 的日線, 最新一根的指標, 版本號)。"""
+        with self._lock: return self._intraday, self._daily, self._latest, self.version
+
+    def _publish(self, intraday):
+        with self._lock: base = self._base
+        daily = apply_session_bar(base, session_bar(self.ticker, intraday))
+        # 含進行中 K 棒的日線與儀表板的日線不同，用獨立的快取 key，兩邊才不會互相觸發整段重算
+        latest = indicators.compute_indicators(self.ticker, daily, indicators.MA_WINDOWS, timeframe=LIVE_TIMEFRAME).iloc[-1]
+        with self._lock:
+            self._intraday, self._daily, self._latest = intraday, daily, latest
+            self.version += 1
+            self.updated_at = time.time()
+
+    def poll_once(self):
+        with self._lock: buffered = self._intraday
+        provider = providers.current()
+        with scheduler.background():
+            if buffered.empty: new = scheduler.call(provider.intraday, self.ticker, timeout=market_cache.FETCH_TIMEOUTS["intraday"])
+            else: new = scheduler.call(provider.intraday_since, self.ticker, buffered.index[-1], timeout=market_cache.FETCH_TIMEOUTS["intraday"])
+        if new is None or new.empty: return False
+        # 最後一根可能還沒收完，連同它一起重抓並覆蓋
+        merged = _latest_day(ohlcv_store.merge_bars(buffered, new))
+        if len(merged) == len(buffered) and merged.iloc[-1].equals(buffered.iloc[-1]): return False
+        self._publish(merged)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(POLL_SECONDS):
+            if time.monotonic() - self.last_seen > IDLE_SECONDS: break
+            try: self.poll_once()
+            except Exception:
+                logger.exception("%s 即時補抓失敗", self.ticker)
+        with _lock:
+            if _pollers.get(self.ticker) is self: del _pollers[self.ticker]
+
+    def stop(self):
+        self._stop.set()
+
+
+_lock = threading.Lock()
+_pollers = {}
+
+
+def subscribe(ticker, daily, intraday=None):
+    """取得 (必要時啟動) 該股票的 poller；每次 fragment 重畫都呼叫一次以維持訂閱。"""
+    with _lock:
+        poller = _pollers.get(ticker)
+        is_new = poller is None
+        if is_new: poller = _pollers[ticker] = Poller(ticker, daily)
+    if is_new: poller.start(intraday)
+    else: poller.touch(daily)
+    return poller
+
+
+def active_pollers():
+    with _lock: return len(_pollers)
+
+
+perf.register_gauge("live_pollers", active_pollers)
@@ -0,0 +1,266 @@
+"""跨 session 共用的行情快取。
+
+Streamlit 每個瀏覽器 session 都會重跑 app.py，但被 import 的模組只會載入一次，
+因此放在這裡的快取是整個 process 共用的：同一檔股票不論多少人同時打開，
+上游 (providers.current()，預設為 Yahoo) 只會被呼叫一次。
+上游請求一律經過 scheduler 限流與重試；重試後仍失敗時，改回傳已過期的舊資料。
+
+行情以精簡格式存放 (只留 OHLCV、float32；info 只留儀表板讀取的欄位)，
+整個快取有共同的記憶體上限，超過時淘汰最久沒用到的項目 (LRU)。
+MEMORY_BUDGET 只涵蓋這個快取；由行情衍生的快取各自有筆數與 bytes 上限，同樣以 LRU 淘汰：
+指標 (indicators.CACHE_BYTES，64 MB)、合成 K 線 (resample.CACHE_BYTES，32 MB)、
+休市缺口 (chart_prep.GAP_CACHE_BYTES，8 MB)、時段標記 (sessions.LABEL_CACHE_BYTES，8 MB)。
+session 只保留對快取物件的參照；取得的表一律視為唯讀，需要修改時先 copy()。
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+import ohlcv_store
+import perf
+import providers
+import scheduler
+
+# --- TTL 設定 (秒) ---
+HISTORY_TTL = 15 * 60     # 2 年日線：只有最後一根會變動 (磁碟端見 ohlcv_store)
+INTRADAY_TTL = 60         # 5 分 K 盤中走勢
+INFO_TTL = 10 * 60        # 基本面 / 報價資訊
+FX_TTL = 30 * 60          # USDTWD 匯率
+
+FX_TICKER = "USDTWD=X"
+
+# --- 單次上游請求的逾時 (秒) ---
+FETCH_TIMEOUTS = {"history": 30, "intraday": 10, "info": 15, "fx": 5}
+
+STALE_KEEP = 24 * 60 * 60   # 過期資料再保留多久，上游失敗時拿來頂替
+STALE_RETRY = 30            # 改用舊資料後，這段時間內不再打上游
+
+MEMORY_BUDGET = int(float(os.environ.get("STOCK_APP_CACHE_MB", "256")) * 2 ** 20)
+PRICE_COLUMNS = ("Open", "High", "Low", "Close", "Volume")
+INFO_FIELDS = ("longName", "quoteType", "sector", "marketCap", "trailingPE", "trailingEps", "previousClose",
+               "currentPrice", "regularMarketPrice", "preMarketPrice", "postMarketPrice")
+
+logger = logging.getLogger(__name__)
+
+
+# --- 精簡格式 ---
+def compact_frame(df):
+    """只留 OHLCV 並轉成 float32 (記憶體減半以上)；指標計算時會再轉回 float64。"""
+    if df is None or df.empty: return df
+    return df[[c for c in PRICE_COLUMNS if c in df.columns]].astype(np.float32)
+
+
+def compact_info(info):
+    """只留儀表板讀取的欄位 (原本的 info 有上百個 key)，並包成唯讀的 mapping。"""
+    info = info or {}
+    return MappingProxyType({k: info[k] for k in INFO_FIELDS if info.get(k) is not None})
+
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame): return int(value.memory_usage(index=True).sum())
+    if isinstance(value, (tuple, list)): return sum(_sizeof(v) for v in value)
+    if isinstance(value, Mapping): return sys.getsizeof(value) + sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class _Flight:
+    """一次進行中的上游請求，讓同 key 的其他請求等待同一個結果。"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class EmptyResponseError(ValueError):
+    """上游沒有丟出錯誤，但回傳的是空資料 (yfinance 常見的失敗方式)。"""
+
+
+def _not_empty(df):
+    return df is not None and not df.empty
+
+
+class TTLCache:
+    """執行緒安全的 TTL 快取，同 key 的並發請求會合併成一次 fetch (single-flight)。
+
+    key 的第一個元素當作資料種類 ("history"、"info"...)，命中率與抓取耗時依種類統計。
+    過期的資料會再保留 STALE_KEEP 秒，fetch 失敗時回傳舊資料而不是錯誤。
+    valid(值) 回傳 False (例如上游以空表代替錯誤) 也視為失敗：有舊資料就用舊資料，
+    沒有時照樣回傳新值，但兩者都只保留 STALE_RETRY 秒就重試。
+    總大小超過 budget (bytes) 時，從最久沒用到的項目開始淘汰。
+    """
+
+    def __init__(self, budget=MEMORY_BUDGET):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (到期時間, 值, bytes)，依最近使用排序
+        self._inflight = {}
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.evictions = 0
+
+    def get_or_fetch(self, key, ttl, fetch, valid=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            hit = entry is not None and entry[0] > time.monotonic()
+            if hit:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            else:
+                flight = self._inflight.get(key)
+                is_leader = flight is None
+                if is_leader:
+                    flight = self._inflight[key] = _Flight()
+                    self.misses += 1
+
+        perf.cache_lookup(key[0], hit or not is_leader)
+        if hit: return entry[1]
+        if not is_leader:
+            flight.event.wait()
+            if flight.error is not None: raise flight.error
+            return flight.value
+
+        try:
+            try:
+                with perf.stage(f"fetch.{key[0]}"): flight.value = fetch()
+                if valid is not None and not valid(flight.value):
+                    if entry is None: ttl = min(ttl, STALE_RETRY)
+                    else: raise EmptyResponseError(f"{key} 上游回傳空資料")
+            except Exception as e:
+                if entry is None: raise
+                logger.warning("%s 上游失敗，改用舊資料: %s", key, e)
+                flight.value, ttl = entry[1], min(ttl, STALE_RETRY)
+                with self._lock: self.stale_served += 1
+            with self._lock:
+                self._purge_expired()
+                self._store(key, time.monotonic() + ttl, flight.value)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+            flight.event.set()
+        return flight.value
+
+    def get_fresh(self, key):
+        """不觸發 fetch；未過期時回傳 (True, 值) 並計為命中，否則回傳 (False, None)。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic(): return False, None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        perf.cache_lookup(key[0], True)
+        return True, entry[1]
+
+    def invalidate(self, key):
+        # 只讓它立刻過期，舊值仍可在上游失敗時頂替
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None: self._entries[key] = (time.monotonic(), *entry[1:])
+
+    def peek(self, key):
+        """不觸發 fetch；回傳快取中的值 (含已過期的舊值)，沒有時回傳 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _store(self, key, expires, value):
+        old = self._entries.pop(key, None)
+        if old is not None: self.nbytes -= old[2]
+        size = _sizeof(value)
+        self._entries[key] = (expires, value, size)
+        self.nbytes += size
+        while self.nbytes > self.budget and len(self._entries) > 1:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for k in [k for k, (exp, _, _) in self._entries.items() if exp + STALE_KEEP <= now]:
+            self.nbytes -= self._entries.pop(k)[2]
+
+
+CACHE = TTLCache()
+perf.register_gauge("cache_stale_served", lambda: CACHE.stale_served)
+perf.register_gauge("cache_bytes", lambda: CACHE.nbytes)
+perf.register_gauge("cache_evictions", lambda: CACHE.evictions)
+
+
+# --- 上游抓取 (皆經過共用快取) ---
+def _load_history(ticker, years):
+    provider = providers.current()
+    return ohlcv_store.load_history(
+        ticker,
+        fetch_full=lambda y: scheduler.call(provider.daily, ticker, years=y, timeout=FETCH_TIMEOUTS["history"]),
+        fetch_since=lambda start: scheduler.call(provider.daily, ticker, start=start, timeout=FETCH_TIMEOUTS["history"]),
+        max_age=HISTORY_TTL,
+        years=years,
+    )
+
+# 快取 key (fetch_all_async 先以同樣的 key 查快取)
+def _history_key(ticker, years=ohlcv_store.HISTORY_YEARS): return ("history", ticker, years)
+def _intraday_key(ticker): return ("intraday", ticker)
+def _info_key(ticker): return ("info", ticker)
+def _fx_key(): return ("fx", FX_TICKER)
+
+def get_history(ticker, years=ohlcv_store.HISTORY_YEARS):
+    return CACHE.get_or_fetch(_history_key(ticker, years), HISTORY_TTL, lambda: compact_frame(_load_history(ticker, years)))
+
+def get_intraday(ticker):
+    return CACHE.get_or_fetch(_intraday_key(ticker), INTRADAY_TTL, lambda: compact_frame(scheduler.call(providers.current().intraday, ticker, timeout=FETCH_TIMEOUTS["intraday"])), valid=_not_empty)
+
+def get_info(ticker):
+    return CACHE.get_or_fetch(_info_key(ticker), INFO_TTL, lambda: compact_info(scheduler.call(providers.current().info, ticker, timeout=FETCH_TIMEOUTS["info"])))
+
+def get_exchange_rate_history():
+    return CACHE.get_or_fetch(_fx_key(), FX_TTL, lambda: compact_frame(scheduler.call(providers.current().fx, FX_TICKER, timeout=FETCH_TIMEOUTS["fx"])), valid=_not_empty)
+
+def invalidate_intraday(ticker):
+    """「更新報價」只清掉短效的盤中資料，2 年日線與 info 仍沿用快取。"""
+    CACHE.invalidate(_intraday_key(ticker))
+
+
+# --- 並行抓取 ---
+EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="market-fetch")
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+def fetch_all_async(ticker):
+    """同時送出日線、盤中、info 與匯率四個請求，回傳 {名稱: Future}。
+
+    快取中未過期的資料直接包成已完成的 Future，只有沒命中的才送進執行緒池，
+    避免快取命中排在慢速上游請求後面。
+    """
+    requests = {
+        "history": (_history_key(ticker), get_history, (ticker,)),
+        "intraday": (_intraday_key(ticker), get_intraday, (ticker,)),
+        "info": (_info_key(ticker), get_info, (ticker,)),
+        "fx": (_fx_key(), get_exchange_rate_history, ()),
+    }
+    jobs = {}
+    for name, (key, fn, args) in requests.items():
+        found, value = CACHE.get_fresh(key)
+        jobs[name] = _done(value) if found else EXECUTOR.submit(perf.propagate(fn), *args)
+    return jobs
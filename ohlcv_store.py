@@ -0,0 +1,149 @@
+"""本機日線 OHLCV 資料庫 (每檔股票一個 Parquet 檔)。
+
+看過的股票會把日線存在磁碟上，之後只向上游補抓最後一根之後的 K 棒；
+最後一根可能是尚未收盤的 K 棒，所以會連同它一起重抓並覆蓋。
+上游的價格是還原權值的，除權息或分割後舊資料會整段變動，偵測到時改成整段重抓。
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.environ.get("STOCK_APP_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".market_data"))
+HISTORY_YEARS = 2
+FRESH_SECONDS = 15 * 60   # 檔案在這段時間內更新過，就完全不連網
+ADJUST_TOLERANCE = 1e-4   # 重疊的已收盤 K 棒收盤價差超過此比例，視為價格被還原調整過
+EVENT_COLUMNS = ("Dividends", "Stock Splits")
+
+logger = logging.getLogger(__name__)
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _ticker_lock(ticker):
+    with _locks_guard: return _locks.setdefault(ticker, threading.Lock())
+
+
+def safe_name(ticker):
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in ticker)
+
+
+def _path(ticker):
+    return os.path.join(DATA_DIR, f"{safe_name(ticker)}.parquet")
+
+
+def read(ticker):
+    path = _path(ticker)
+    if not os.path.exists(path): return None
+    try: return pd.read_parquet(path)
+    except (OSError, ValueError): return None   # 檔案損毀就當作沒存過，重新下載
+
+
+def write(ticker, df):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=DATA_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp)
+        os.replace(tmp, _path(ticker))   # 原子替換，避免其他 process 讀到寫一半的檔案
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def is_fresh(ticker, max_age=FRESH_SECONDS):
+    path = _path(ticker)
+    return os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age
+
+
+def merge_bars(stored, new):
+    """新 K 棒接在舊資料後面；同一天的 K 棒以新抓的為準 (修正未收盤的最後一根)。"""
+    if new is None or new.empty: return stored
+    if stored is None or stored.empty: return new.sort_index()
+    if new.index.tz is not None and stored.index.tz is not None and new.index.tz != stored.index.tz:
+        new = new.tz_convert(stored.index.tz)
+    merged = pd.concat([stored[stored.index < new.index[0]], new[stored.columns.intersection(new.columns)]])
+    return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+
+def close_checksum(df, end=None):
+    """Close 欄前 end 根的總和；除權息 / 分割還原後整段價格會變，衍生快取 (指標、多週期 K 線) 用它判斷舊結果是否仍有效。"""
+    return float(np.sum(df["Close"].to_numpy(dtype=float)[:end]))
+
+
+def trim_window(df, years=HISTORY_YEARS):
+    if df is None or df.empty: return df
+    return df[df.index >= df.index[-1] - pd.DateOffset(years=years)]
+
+
+def needs_refetch(stored, new):
+    """補抓的資料顯示舊資料已被還原調整 (除權息 / 分割) 時回傳 True。
+
+    new 從 stored 倒數第二根 (最後一根已收盤的 K 棒) 開始抓，比較這根的收盤價，
+    並檢查補抓區間內有沒有 stored 沒記錄過的除權息或分割。
+    """
+    if new is None or new.empty or len(stored) < 2: return False
+    if new.index.tz is not None and stored.index.tz is not None: new = new.tz_convert(stored.index.tz)
+    closed = stored.index[-2]
+    if closed in new.index:
+        old, fresh = float(stored.at[closed, "Close"]), float(new.at[closed, "Close"])
+        if abs(fresh - old) > ADJUST_TOLERANCE * abs(old): return True
+    for col in EVENT_COLUMNS:
+        if col not in new.columns: continue
+        events = new[col][new[col].fillna(0) != 0]
+        if events.empty: continue
+        known = stored[col].reindex(events.index) if col in stored.columns else pd.Series(float("nan"), index=events.index)
+        if (known != events).any(): return True
+    return False
+
+
+def _fetch_full(ticker, stored, fetch_full, years, full_years=None):
+    full_years = full_years or years
+    df = fetch_full(full_years)
+    if df.empty: return df if stored is None else trim_window(stored, years)
+    df.attrs["full_years"] = full_years
+    # 其他 process 可能已經存了更長的區間：不縮短，只把新抓的 K 棒併進去
+    current = read(ticker)
+    if current is not None and not current.empty and current.attrs.get("full_years", HISTORY_YEARS) > full_years:
+        merged = merge_bars(current, df)
+        merged.attrs["full_years"] = current.attrs["full_years"]
+        df = merged
+    write(ticker, df)
+    return trim_window(df, years)
+
+
+def load_history(ticker, fetch_full, fetch_since, max_age=FRESH_SECONDS, years=HISTORY_YEARS):
+    """回傳最近 years 年日線，只在必要時呼叫上游。
+
+    fetch_full(years) 下載完整區間；fetch_since(start) 下載 start (含) 之後的日線。
+    存檔的 attrs["full_years"] 記錄已經完整下載過幾年，回測要更長的歷史時才需要補抓一次。
+    同一檔股票的讀寫依序進行 (2 年與 10 年的請求不會互相覆蓋)，存檔的區間只會變長不會變短。
+    """
+    with _ticker_lock(ticker): return _load_history(ticker, fetch_full, fetch_since, max_age, years)
+
+
+def _load_history(ticker, fetch_full, fetch_since, max_age, years):
+    stored = read(ticker)
+    if stored is None or stored.empty or stored.attrs.get("full_years", HISTORY_YEARS) < years:
+        return _fetch_full(ticker, stored, fetch_full, years)
+
+    if is_fresh(ticker, max_age): return trim_window(stored, years)
+
+    try:
+        # 從最後一根已收盤的 K 棒開始抓，用來檢查舊資料是否已被還原調整
+        new = fetch_since(stored.index[-2] if len(stored) >= 2 else stored.index[-1])
+        if needs_refetch(stored, new):
+            logger.info("%s 價格已還原調整 (除權息 / 分割)，重新下載完整日線", ticker)
+            return _fetch_full(ticker, stored, fetch_full, years, max(years, stored.attrs.get("full_years", HISTORY_YEARS)))
+    except Exception as e:
+        # 上游失敗時先用磁碟上的舊資料，下次再補抓
+        logger.warning("%s 補抓日線失敗，使用本機資料: %s", ticker, e)
+        return trim_window(stored, years)
+    merged = merge_bars(stored, new)
+    merged.attrs["full_years"] = stored.attrs.get("full_years", HISTORY_YEARS)
+    write(ticker, merged)
+    return trim_window(merged, years)
@@ -0,0 +1,178 @@
+"""各階段耗時與快取命中率統計。
+
+- stage(name) 量測一段程式；關閉時只多一次判斷，幾乎沒有額外成本。
+- 開啟 (環境變數 STOCK_APP_PERF=1) 後，耗時累積在整個 process 共用的統計裡，
+  可輸出 Prometheus 文字格式或 JSON；設定 STOCK_APP_METRICS_PORT 會另開一個
+  HTTP 端點 (/metrics、/metrics.json) 給監控系統抓取。
+- 除錯面板用 start_run() / end_run() 收集單次 rerun 的明細，不需要全域開啟。
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("STOCK_APP_PERF", "0") == "1"
+METRICS_PORT = int(os.environ.get("STOCK_APP_METRICS_PORT", "0"))   # 0 = 不開 HTTP 端點
+SAMPLE_SIZE = 2048            # 每個階段保留最近幾筆樣本計算分位數
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}                  # 階段名稱 -> [次數, 總秒數, 最近樣本]
+_caches = {}                  # 快取名稱 -> [查詢次數, 未命中次數]
+_gauges = {}                  # 名稱 -> 回傳目前數值的函式 (輸出時才讀取)
+_server = None
+
+
+# --- 記錄 ---
+def _active():
+    return ENABLED or getattr(_local, "run", None) is not None
+
+
+def record(name, seconds):
+    run = getattr(_local, "run", None)
+    if run is not None: run.append((name, seconds))
+    if not ENABLED: return
+    with _lock:
+        entry = _stages.get(name)
+        if entry is None: entry = _stages[name] = [0, 0.0, deque(maxlen=SAMPLE_SIZE)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2].append(seconds)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+
+_OFF = nullcontext()
+
+
+def stage(name):
+    return _Timer(name) if _active() else _OFF
+
+
+def cache_lookup(cache, hit):
+    if not ENABLED: return
+    with _lock:
+        entry = _caches.setdefault(cache, [0, 0])
+        entry[0] += 1
+        if not hit: entry[1] += 1
+
+
+def register_gauge(name, fn):
+    _gauges[name] = fn
+
+
+def gauges():
+    return {name: fn() for name, fn in sorted(_gauges.items())}
+
+
+# --- 單次 rerun 明細 (除錯面板) ---
+def start_run():
+    _local.run = []
+
+
+def end_run():
+    run, _local.run = getattr(_local, "run", None), None
+    return run or []
+
+
+def propagate(fn):
+    """把目前執行緒的 rerun 記錄帶進背景執行緒 (例如 ThreadPoolExecutor 的抓取工作)。"""
+    run = getattr(_local, "run", None)
+    if run is None: return fn
+
+    def wrapper(*args, **kwargs):
+        _local.run = run
+        try: return fn(*args, **kwargs)
+        finally: _local.run = None
+    return wrapper
+
+
+# --- 匯總與輸出 ---
+def _quantiles(samples):
+    ordered = sorted(samples)
+    return {q: ordered[max(0, math.ceil(q * len(ordered)) - 1)] for q in QUANTILES}   # nearest-rank
+
+
+def snapshot():
+    """{"stages": {名稱: {count, sum, p50, p95, p99}}, "caches": {名稱: {lookups, misses, hit_rate}}, "gauges": {名稱: 數值}}"""
+    with _lock:
+        stages = {name: (count, total, list(samples)) for name, (count, total, samples) in _stages.items()}
+        caches = {name: tuple(v) for name, v in _caches.items()}
+    out = {"stages": {}, "caches": {}, "gauges": gauges()}
+    for name, (count, total, samples) in sorted(stages.items()):
+        qs = _quantiles(samples)
+        out["stages"][name] = {"count": count, "sum": total, **{f"p{int(q * 100)}": qs[q] for q in QUANTILES}}
+    for name, (lookups, misses) in sorted(caches.items()):
+        out["caches"][name] = {"lookups": lookups, "misses": misses, "hit_rate": 1 - misses / lookups if lookups else None}
+    return out
+
+
+def to_json():
+    return json.dumps(snapshot(), ensure_ascii=False, indent=2)
+
+
+def to_prometheus():
+    snap = snapshot()
+    lines = ["# HELP stock_app_stage_seconds Latency of dashboard stages.", "# TYPE stock_app_stage_seconds summary"]
+    for name, s in snap["stages"].items():
+        for q in QUANTILES:
+            lines.append(f'stock_app_stage_seconds{{stage="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+        lines.append(f'stock_app_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+        lines.append(f'stock_app_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+    lines += ["# HELP stock_app_cache_lookups_total Cache lookups.", "# TYPE stock_app_cache_lookups_total counter"]
+    lines += [f'stock_app_cache_lookups_total{{cache="{name}"}} {c["lookups"]}' for name, c in snap["caches"].items()]
+    lines += ["# HELP stock_app_cache_misses_total Cache misses.", "# TYPE stock_app_cache_misses_total counter"]
+    lines += [f'stock_app_cache_misses_total{{cache="{name}"}} {c["misses"]}' for name, c in snap["caches"].items()]
+    for name, value in snap["gauges"].items():
+        lines += [f"# TYPE stock_app_{name} gauge", f"stock_app_{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _caches.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics": body, ctype = to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json": body, ctype = to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=METRICS_PORT):
+    """背景啟動 metrics 端點；每個 process 只會啟動一次，port 為 0 時不啟動。"""
+    global _server
+    with _lock:
+        if _server is not None or not port: return _server
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="perf-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,265 @@
+"""行情資料來源 (provider)。
+
+所有上游請求都經過 current() 取得的 provider：
+- YahooProvider：線上 yfinance (預設)。
+- ReplayProvider：從本機錄好的檔案重播日線、盤中、info 與匯率，可模擬上游延遲與錯誤，
+  讓壓力測試與 benchmark 不必連網、每次結果都相同。
+- RecordingProvider：包住另一個 provider，把抓到的資料存成 ReplayProvider 的格式。
+
+環境變數：
+    STOCK_APP_PROVIDER=replay           使用重播資料 (預設 yahoo)
+    STOCK_APP_REPLAY_DIR=fixtures       錄製檔目錄
+    STOCK_APP_REPLAY_LATENCY=0.2        每次請求的模擬延遲 (秒)，也可以依種類設定 "history=0.5,info=0.1"
+    STOCK_APP_REPLAY_ERROR_RATE=0.05    模擬上游錯誤的機率，格式同上
+
+錄製：python providers.py record TSLA 2330.TW --dir fixtures --years 10
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pandas as pd
+import yfinance as yf
+
+import ohlcv_store
+
+KINDS = ("history", "intraday", "info", "fx")
+DEFAULT_REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class ProviderError(ConnectionError):
+    """上游請求失敗 (ReplayProvider 模擬的錯誤也是這個型別)。"""
+
+
+# --- 線上 (yfinance) ---
+# yfinance 的 .info 不接受 timeout 參數，改在這個執行緒池裡等待，逾時就放棄 (執行緒等 yfinance 自己逾時後歸還)
+_INFO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="yahoo-info")
+
+
+class YahooProvider:
+    name = "yahoo"
+
+    def daily(self, ticker, years=None, start=None, timeout=None):
+        """日線；給 years 抓最近 N 年，給 start 抓 start (含) 之後。"""
+        if start is not None:
+            return yf.Ticker(ticker).history(start=pd.Timestamp(start).strftime("%Y-%m-%d"), interval="1d", timeout=timeout)
+        return yf.Ticker(ticker).history(period=f"{years}y", timeout=timeout)
+
+    def intraday(self, ticker, timeout=None):
+        """當日 5 分 K，含盤前盤後。"""
+        return yf.Ticker(ticker).history(period="1d", interval="5m", prepost=True, timeout=timeout)
+
+    def intraday_since(self, ticker, start, timeout=None):
+        """start (含) 之後的 5 分 K，即時模式只補抓新的 K 棒。"""
+        return yf.Ticker(ticker).history(start=start, interval="5m", prepost=True, timeout=timeout)
+
+    def info(self, ticker, timeout=None):
+        future = _INFO_POOL.submit(lambda: yf.Ticker(ticker).info)
+        try: return future.result(timeout=timeout)
+        except FutureTimeoutError: raise TimeoutError(f"{ticker} info 逾時 ({timeout}s)") from None
+
+    def fx(self, pair, timeout=None):
+        """匯率最近一個交易日的日線。"""
+        return yf.Ticker(pair).history(period="1d", timeout=timeout)
+
+    def daily_panel(self, tickers, years, timeout=None):
+        """一次批量下載多檔日線，回傳 (收盤寬表, 成交量寬表)。"""
+        raw = yf.download(tickers, period=f"{years}y", auto_adjust=True, group_by="column",
+                          threads=True, progress=False, timeout=timeout)
+        if raw is None or raw.empty: return pd.DataFrame(), pd.DataFrame()
+        close, volume = raw["Close"], raw["Volume"]
+        if isinstance(close, pd.Series): close, volume = close.to_frame(tickers[0]), volume.to_frame(tickers[0])
+        return close, volume
+
+
+# --- 本機重播 ---
+def _fixture_dir(root, ticker):
+    return os.path.join(root, ohlcv_store.safe_name(ticker))
+
+
+def _parse_per_kind(text, default=0.0):
+    """"0.2" -> 每種都是 0.2；"history=0.5,info=0.1" -> 依種類設定，其餘為 default。"""
+    if not text: return dict.fromkeys(KINDS, default)
+    if "=" not in text: return dict.fromkeys(KINDS, float(text))
+    out = dict.fromkeys(KINDS, default)
+    for part in text.split(","):
+        kind, value = part.split("=")
+        out[kind.strip()] = float(value)
+    return out
+
+
+class ReplayProvider:
+    """讀取 RecordingProvider 錄下的檔案；讀過的檔案留在記憶體，之後的請求只剩模擬延遲。
+
+    latency / error_rate 可以是一個數字或 {種類: 數字}；jitter 為延遲上下浮動的比例。
+    同樣的 seed 會產生同樣的延遲與錯誤序列。
+    """
+    name = "replay"
+
+    def __init__(self, root=DEFAULT_REPLAY_DIR, latency=0.0, error_rate=0.0, jitter=0.2, seed=0):
+        self.root = root
+        self.latency = latency if isinstance(latency, dict) else dict.fromkeys(KINDS, latency)
+        self.error_rate = error_rate if isinstance(error_rate, dict) else dict.fromkeys(KINDS, error_rate)
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(root=os.environ.get("STOCK_APP_REPLAY_DIR", DEFAULT_REPLAY_DIR),
+                   latency=_parse_per_kind(os.environ.get("STOCK_APP_REPLAY_LATENCY")),
+                   error_rate=_parse_per_kind(os.environ.get("STOCK_APP_REPLAY_ERROR_RATE")))
+
+    def _simulate(self, kind, ticker, timeout=None):
+        with self._lock: jitter, roll = self._rng.uniform(-1, 1), self._rng.random()
+        delay = self.latency.get(kind, 0.0) * (1 + self.jitter * jitter)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"模擬上游逾時: {kind} {ticker}")
+        if delay > 0: time.sleep(delay)
+        if roll < self.error_rate.get(kind, 0.0): raise ProviderError(f"模擬上游錯誤: {kind} {ticker}")
+
+    def _read(self, ticker, filename):
+        path = os.path.join(_fixture_dir(self.root, ticker), filename)
+        with self._lock:
+            if path in self._files: return self._files[path]
+        if not os.path.exists(path): value = None
+        elif filename.endswith(".json"):
+            with open(path, encoding="utf-8") as f: value = json.load(f)
+        else: value = pd.read_parquet(path, memory_map=True)
+        with self._lock: self._files[path] = value
+        return value
+
+    def _frame(self, ticker, filename):
+        df = self._read(ticker, filename)
+        return pd.DataFrame() if df is None else df
+
+    @staticmethod
+    def _since(df, start):
+        start = pd.Timestamp(start)
+        if df.index.tz is not None and start.tz is None: start = start.tz_localize(df.index.tz)
+        return df[df.index >= start]
+
+    def daily(self, ticker, years=None, start=None, timeout=None):
+        self._simulate("history", ticker, timeout)
+        df = self._frame(ticker, "daily.parquet")
+        if df.empty: return df.copy()
+        if start is not None: return self._since(df, start)
+        return ohlcv_store.trim_window(df, years) if years else df.copy()
+
+    def intraday(self, ticker, timeout=None):
+        self._simulate("intraday", ticker, timeout)
+        return self._frame(ticker, "intraday.parquet").copy()
+
+    def intraday_since(self, ticker, start, timeout=None):
+        self._simulate("intraday", ticker, timeout)
+        df = self._frame(ticker, "intraday.parquet")
+        return df.copy() if df.empty else self._since(df, start)
+
+    def info(self, ticker, timeout=None):
+        self._simulate("info", ticker, timeout)
+        return dict(self._read(ticker, "info.json") or {})
+
+    def fx(self, pair, timeout=None):
+        self._simulate("fx", pair, timeout)
+        return self._frame(pair, "daily.parquet").iloc[-1:].copy()
+
+    def daily_panel(self, tickers, years, timeout=None):
+        self._simulate("history", ",".join(tickers), timeout)
+        closes, volumes = {}, {}
+        for t in tickers:
+            df = self._frame(t, "daily.parquet")
+            if df.empty: continue
+            df = ohlcv_store.trim_window(df, years)
+            closes[t], volumes[t] = df["Close"], df["Volume"]
+        if not closes: return pd.DataFrame(), pd.DataFrame()
+        return pd.concat(closes, axis=1), pd.concat(volumes, axis=1)
+
+
+# --- 錄製 ---
+class RecordingProvider:
+    """轉呼叫 inner，並把結果寫成 ReplayProvider 讀得懂的檔案。"""
+    name = "recording"
+
+    def __init__(self, inner, root=DEFAULT_REPLAY_DIR):
+        self.inner, self.root = inner, root
+
+    def _write(self, ticker, filename, value):
+        folder = _fixture_dir(self.root, ticker)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filename)
+        if filename.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f: json.dump(value, f, ensure_ascii=False, default=str)
+        elif not value.empty: value.to_parquet(path)
+
+    def daily(self, ticker, years=None, start=None, timeout=None):
+        df = self.inner.daily(ticker, years=years, start=start, timeout=timeout)
+        if start is None: self._write(ticker, "daily.parquet", df)   # 只存完整區間，補抓的片段不覆蓋
+        return df
+
+    def intraday(self, ticker, timeout=None):
+        df = self.inner.intraday(ticker, timeout=timeout)
+        self._write(ticker, "intraday.parquet", df)
+        return df
+
+    def intraday_since(self, ticker, start, timeout=None):
+        return self.inner.intraday_since(ticker, start, timeout=timeout)
+
+    def info(self, ticker, timeout=None):
+        info = self.inner.info(ticker, timeout=timeout)
+        self._write(ticker, "info.json", info)
+        return info
+
+    def fx(self, pair, timeout=None):
+        return self.inner.fx(pair, timeout=timeout)
+
+    def daily_panel(self, tickers, years, timeout=None):
+        return self.inner.daily_panel(tickers, years, timeout=timeout)
+
+
+def record(tickers, root=DEFAULT_REPLAY_DIR, years=ohlcv_store.HISTORY_YEARS, fx_pairs=("USDTWD=X",), inner=None):
+    """錄下每檔股票的日線 / 盤中 / info，以及匯率的日線。"""
+    rec = RecordingProvider(inner or YahooProvider(), root)
+    for t in list(tickers) + list(fx_pairs):
+        rec.daily(t, years=years)
+        if t in fx_pairs: continue
+        rec.intraday(t)
+        rec.info(t)
+
+
+# --- 目前使用的 provider (整個 process 共用) ---
+def _from_env():
+    kind = os.environ.get("STOCK_APP_PROVIDER", "yahoo")
+    if kind == "replay": return ReplayProvider.from_env()
+    if kind == "yahoo": return YahooProvider()
+    raise ValueError(f"未知的 STOCK_APP_PROVIDER: {kind}")
+
+
+_current = _from_env()
+
+
+def current():
+    return _current
+
+
+def set_provider(provider):
+    """切換資料來源 (benchmark / 測試用)；呼叫端需自行清掉 market_cache 的快取。"""
+    global _current
+    _current = provider
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="錄製 ReplayProvider 使用的行情檔")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rec_parser = sub.add_parser("record")
+    rec_parser.add_argument("tickers", nargs="+")
+    rec_parser.add_argument("--dir", default=DEFAULT_REPLAY_DIR)
+    rec_parser.add_argument("--years", type=int, default=ohlcv_store.HISTORY_YEARS)
+    args = parser.parse_args()
+    record(args.tickers, args.dir, args.years)
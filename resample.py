@@ -0,0 +1,118 @@
+"""多週期 K 線：由已抓到的日線 / 5 分 K 在本機合成，不再為每種週期多打一次上游。
+
+- 週 K、月 K 由日線合成；15 / 30 / 60 分 K 由 5 分 K 合成 (以開盤時間對齊，盤前 / 正規 / 盤後不合併)。
+- 分組與彙總都是向量運算 (reduceat)。
+- 結果依 (股票, 週期) 快取；底層多了新 K 棒或最後一根被更新時，只重算最後一組之後的部分。
+  前面各組以收盤價 checksum 比對，除權息 / 分割還原後的歷史會整段重算。
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import ohlcv_store
+import perf
+import sessions
+
+# 顯示名稱 -> 週期代碼 (與 yfinance 的 interval 同名)
+TIMEFRAMES = {"日": "1d", "週": "1wk", "月": "1mo", "15分": "15m", "30分": "30m", "60分": "60m"}
+INTRADAY_MINUTES = {"15m": 15, "30m": 30, "60m": 60}
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+CACHE_SIZE = 128
+CACHE_BYTES = 32 * 2 ** 20   # 合成 K 線合計上限 (不含 market_cache.MEMORY_BUDGET)
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # (ticker, timeframe) -> (bars, 最後一組在底層的起點位置, 底層長度, 底層第一根, 底層最後一根,
+                         #                        最後一組之前的收盤 checksum, 全部的收盤 checksum)
+_sizes = {}              # key -> bars 的 bytes
+_nbytes = 0
+
+
+def is_intraday(timeframe):
+    return timeframe in INTRADAY_MINUTES
+
+
+def group_keys(ticker, index, timeframe):
+    """每根底層 K 棒所屬的組別編號 (遞增)；時間以交易所當地時間計算。"""
+    ex = sessions.exchange_for(ticker)
+    local = index.tz_convert(ex.tz).tz_localize(None) if index.tz is not None else index
+    if timeframe == "1mo": return local.values.astype("datetime64[M]").astype(np.int64)
+    minutes = local.values.astype("datetime64[m]").astype(np.int64)
+    days = minutes // 1440
+    if timeframe == "1wk": return days - (days + 3) % 7          # 1970-01-01 是週四，往回對齊到週一
+    step = INTRADAY_MINUTES[timeframe]
+    anchor = days * 1440 + ex.open
+    bucket = anchor + (minutes - anchor) // step * step
+    return bucket * 8 + sessions.labels(ticker, index)            # 時段不同的 K 棒分開
+
+
+def aggregate(df, keys):
+    """依組別彙總 OHLCV，回傳 (合成後的 K 線, 每組在 df 的起點位置)；index 為每組第一根的時間。"""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    high, low = df["High"].to_numpy(), df["Low"].to_numpy()
+    volume = np.nan_to_num(df["Volume"].to_numpy())
+    out = pd.DataFrame({"Open": df["Open"].to_numpy()[starts], "High": np.fmax.reduceat(high, starts),
+                        "Low": np.fmin.reduceat(low, starts), "Close": df["Close"].to_numpy()[ends],
+                        "Volume": np.add.reduceat(volume, starts)}, index=df.index[starts])
+    return out, starts
+
+
+def _bar(df, i):
+    return df.index[i], float(df["Close"].iloc[i]), float(df["Volume"].iloc[i])
+
+
+def _entry(bars, pos, base):
+    return bars, pos, len(base), base.index[0], _bar(base, -1), ohlcv_store.close_checksum(base, pos), ohlcv_store.close_checksum(base)
+
+
+def resample(ticker, base, timeframe):
+    """由底層 K 線 (日線或 5 分 K) 合成 timeframe 週期的 K 線 (共用、唯讀)；"1d" 直接回傳底層。"""
+    if timeframe == "1d" or base.empty: return base
+    key = (ticker, timeframe)
+    with _lock: cached = _cache.get(key)
+
+    result = None
+    if cached is not None:
+        bars, pos, length, first, last, prefix_sum, all_sum = cached
+        if base.index[0] != first: pass
+        elif len(base) == length and _bar(base, -1) == last and ohlcv_store.close_checksum(base) == all_sum:
+            result = cached
+        elif len(base) >= length and base.index[pos] == bars.index[-1] and ohlcv_store.close_checksum(base, pos) == prefix_sum:
+            # 前面幾組不會再變，只從最後一組的起點往後重算
+            tail = base.iloc[pos:]
+            new, starts = aggregate(tail[OHLCV], group_keys(ticker, tail.index, timeframe))
+            result = _entry(pd.concat([bars.iloc[:-1], new]), pos + int(starts[-1]), base)
+
+    perf.cache_lookup("resample", result is not None)
+    if result is None:
+        with perf.stage(f"resample.{timeframe}"):
+            bars, starts = aggregate(base[OHLCV], group_keys(ticker, base.index, timeframe))
+        result = _entry(bars, int(starts[-1]), base)
+
+    with _lock: _store(key, result)
+    return result[0]
+
+
+def _store(key, result):
+    global _nbytes
+    _cache[key] = result
+    _cache.move_to_end(key)
+    size = int(result[0].memory_usage(index=True).sum())
+    _nbytes += size - _sizes.get(key, 0)
+    _sizes[key] = size
+    while len(_cache) > 1 and (len(_cache) > CACHE_SIZE or _nbytes > CACHE_BYTES):
+        evicted, _ = _cache.popitem(last=False)
+        _nbytes -= _sizes.pop(evicted)
+
+
+def clear_cache():
+    global _nbytes
+    with _lock:
+        _cache.clear()
+        _sizes.clear()
+        _nbytes = 0
+
+
+perf.register_gauge("resample_cache_bytes", lambda: _nbytes)
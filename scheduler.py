@@ -0,0 +1,141 @@
+"""上游請求排程器 (整個 process 共用)。
+
+所有 provider 呼叫都經過 call()：
+- token bucket 限制每秒請求數，避免尖峰時被 Yahoo 限流；
+- 排隊時互動請求 (使用者正在等的頁面) 優先於背景更新 (with background(): ...)；
+- 連線錯誤、逾時與限流時以指數退避 + 隨機抖動重試 (其他錯誤如代號錯誤、解析失敗直接丟出)；
+  遇到限流錯誤時整個 bucket 一起暫停。
+舊資料回退 (stale) 由 market_cache 處理。
+"""
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import perf
+
+INTERACTIVE, BACKGROUND = 0, 1
+
+RATE = float(os.environ.get("STOCK_APP_UPSTREAM_RATE", "4"))     # 每秒補充的 token 數
+BURST = int(os.environ.get("STOCK_APP_UPSTREAM_BURST", "8"))     # bucket 容量 (瞬間可連發的請求數)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5            # 第 n 次重試最多等 BACKOFF_BASE * 2**n 秒 (full jitter)
+BACKOFF_CAP = 8.0
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+@contextmanager
+def background():
+    """區塊內發出的上游請求以背景優先權排隊。"""
+    prev = getattr(_local, "priority", INTERACTIVE)
+    _local.priority = BACKGROUND
+    try: yield
+    finally: _local.priority = prev
+
+
+def _is_rate_limit(exc):
+    return "ratelimit" in type(exc).__name__.lower() or "too many requests" in str(exc).lower()
+
+
+def _status_code(exc):
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+def is_transient(exc):
+    """值得重試的錯誤：限流、連線錯誤、逾時與上游 5xx。"""
+    if _is_rate_limit(exc) or isinstance(exc, (ConnectionError, TimeoutError)): return True
+    # requests / curl_cffi 的網路錯誤都是 OSError 的子類別；檔案類錯誤與 4xx 重試也沒用
+    if isinstance(exc, (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError)): return False
+    status = _status_code(exc)
+    if status is not None: return status == 429 or status >= 500
+    return isinstance(exc, OSError)
+
+
+class Scheduler:
+    def __init__(self, rate=RATE, burst=BURST, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP, seed=None):
+        self.rate, self.burst = rate, burst
+        self.max_retries, self.backoff_base, self.backoff_cap = max_retries, backoff_base, backoff_cap
+        self._cond = threading.Condition()
+        self._waiting = []                  # heap of (優先權, 排隊序號)
+        self._seq = itertools.count()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._rng = random.Random(seed)
+        self.in_flight = 0
+        self.retries = 0
+        self.failures = 0
+
+    # --- token bucket ---
+    def _wait_time(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if now < self._paused_until: return self._paused_until - now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def _acquire(self, priority):
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    wait = self._wait_time() if self._waiting[0] == ticket else None
+                    if wait == 0.0:
+                        self._tokens -= 1
+                        heapq.heappop(self._waiting)
+                        self.in_flight += 1
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(wait)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+
+    def _release(self):
+        with self._cond: self.in_flight -= 1
+
+    def pause(self, seconds):
+        """上游限流時，所有請求一起暫停。"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def queue_depth(self):
+        with self._cond: return len(self._waiting)
+
+    # --- 呼叫 ---
+    def call(self, fn, *args, **kwargs):
+        priority = getattr(_local, "priority", INTERACTIVE)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority)
+            try: return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient(e):
+                    with self._cond: self.failures += 1
+                    raise
+                delay = self._rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if _is_rate_limit(e): self.pause(delay)
+                with self._cond: self.retries += 1
+                logger.warning("上游請求失敗 (%s)，%.2f 秒後第 %d 次重試", e, delay, attempt + 1)
+            finally: self._release()
+            time.sleep(delay)
+
+
+SCHEDULER = Scheduler()
+perf.register_gauge("upstream_queue_depth", SCHEDULER.queue_depth)
+perf.register_gauge("upstream_in_flight", lambda: SCHEDULER.in_flight)
+perf.register_gauge("upstream_retries", lambda: SCHEDULER.retries)
+perf.register_gauge("upstream_failures", lambda: SCHEDULER.failures)
+
+
+def call(fn, *args, **kwargs):
+    return SCHEDULER.call(fn, *args, **kwargs)
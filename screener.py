@@ -0,0 +1,83 @@
+"""批量掃描：一次抓整個 watchlist 的日線，對寬表 (日期 x 股票) 向量化計算儀表板上的訊號。"""
+import re
+
+import pandas as pd
+
+import indicators
+import market_cache
+import ohlcv_store
+import providers
+import scheduler
+import signals
+
+DEFAULT_WATCHLIST = "AAPL, MSFT, NVDA, TSLA, AMZN, GOOGL, META, AMD, NFLX, AVGO"
+PANEL_TTL = market_cache.HISTORY_TTL
+DOWNLOAD_TIMEOUT = 60
+
+
+def parse_watchlist(text):
+    """逗號、空白或換行分隔的代號清單，轉大寫並去除重複 (保留順序)。"""
+    return list(dict.fromkeys(t.upper() for t in re.split(r"[\s,;]+", text) if t))
+
+
+def _naive_dates(index):
+    # 不同交易所的時區不同，寬表統一以 (無時區的) 交易日對齊
+    return (index.tz_localize(None) if index.tz is not None else index).normalize()
+
+
+def _download(tickers):
+    close, volume = scheduler.call(providers.current().daily_panel, tickers, ohlcv_store.HISTORY_YEARS, timeout=DOWNLOAD_TIMEOUT)
+    if close.empty: return close, volume
+    return close.set_axis(_naive_dates(close.index)), volume.set_axis(_naive_dates(volume.index))
+
+
+def _load_panel(tickers):
+    # 本機資料庫裡夠新的直接用，其餘的一次批量下載
+    closes, volumes, missing = {}, {}, []
+    for t in tickers:
+        stored = ohlcv_store.read(t) if ohlcv_store.is_fresh(t, PANEL_TTL) else None
+        if stored is None or stored.empty:
+            missing.append(t)
+            continue
+        stored = ohlcv_store.trim_window(stored)
+        closes[t] = stored["Close"].set_axis(_naive_dates(stored.index))
+        volumes[t] = stored["Volume"].set_axis(_naive_dates(stored.index))
+
+    close, volume = pd.concat(closes, axis=1) if closes else pd.DataFrame(), pd.concat(volumes, axis=1) if volumes else pd.DataFrame()
+    if missing:
+        dl_close, dl_volume = _download(missing)
+        close, volume = pd.concat([close, dl_close], axis=1), pd.concat([volume, dl_volume], axis=1)
+    close = close.sort_index().reindex(columns=[t for t in tickers if t in close.columns]).dropna(axis=1, how="all")
+    # 面板跟單一股票的快取一樣以 float32 存放
+    return close.astype("float32"), volume.sort_index().reindex(columns=close.columns).astype("float32")
+
+
+def load_panel(tickers):
+    """(收盤寬表, 成交量寬表)，依 watchlist 快取，多個 session 掃同一份清單只下載一次。"""
+    return market_cache.CACHE.get_or_fetch(("panel", tuple(tickers)), PANEL_TTL, lambda: _load_panel(tickers))
+
+
+def scan(tickers, fast, slow):
+    """回傳 (訊號總表, 抓不到資料的代號)。"""
+    close, volume = load_panel(tickers)
+    missing = [t for t in tickers if t not in close.columns]
+    if close.empty: return pd.DataFrame(), missing
+
+    latest = indicators.latest_panel(close, volume, (fast, slow))
+    prev_close = close.ffill().iloc[-2] if len(close) > 1 else latest["Close"]
+    vol_ratio = signals.volume_ratio(latest["Volume"], latest["Vol_MA"])
+    table = pd.DataFrame({
+        "代號": latest.index,
+        "收盤": latest["Close"].to_numpy(),
+        "漲跌%": ((latest["Close"] / prev_close - 1) * 100).to_numpy(),
+        "趨勢": signals.trend_state(latest["Close"], latest[f"MA_{fast}"], latest[f"MA_{slow}"]),
+        f"MA{fast}": latest[f"MA_{fast}"].to_numpy(),
+        f"MA{slow}": latest[f"MA_{slow}"].to_numpy(),
+        "量比": vol_ratio,
+        "量能": signals.volume_state(vol_ratio),
+        "MACD 柱": latest["Hist"].to_numpy(),
+        "MACD": signals.macd_state(latest["Hist"]),
+        "RSI": latest["RSI"].to_numpy(),
+        "RSI 狀態": signals.rsi_state(latest["RSI"]),
+    })
+    return table, missing
@@ -0,0 +1,287 @@
+"""交易所交易時段行事曆：時區 (含日光節約)、盤前 / 正規 / 盤後時段、午休、假日與半日市。
+
+- exchange_for(ticker) 依代號後綴判斷交易所，其餘一律視為美股。
+- session_table() 預先算好每個交易日的時段邊界 (依年份快取)，時間軸與時段說明直接查表。
+- label_bars() 一次向量化標記每根盤中 K 棒屬於哪個時段；labels() 會快取結果，
+  同一份盤中資料在 H/L、走勢圖與即時彙總之間只算一次。
+
+農曆節日 (春節、端午、中秋等) 無法用規則推算，國曆日期列在 LUNAR_DATES，每年需補上新的一年；
+表外年份只套用固定日期的假日。
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, EasterMonday, GoodFriday, Holiday, MO, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay,
+                                    nearest_workday, next_monday, next_monday_or_tuesday, sunday_to_monday)
+
+CLOSED, PRE, REGULAR, BREAK, POST = 0, 1, 2, 3, 4
+LABEL_NAMES = {CLOSED: "休市", PRE: "盤前", REGULAR: "正規", BREAK: "午休", POST: "盤後"}
+DISPLAY_TZ = "Asia/Taipei"       # 時段說明以台灣時間顯示
+LABEL_CACHE_SIZE = 64
+LABEL_CACHE_BYTES = 8 * 2 ** 20   # 時段標記合計上限 (不含 market_cache.MEMORY_BUDGET)；每根 K 棒 1 byte
+
+
+def _m(hh, mm=0):
+    return hh * 60 + mm
+
+
+# 時間皆為交易所當地時間的「午夜起算分鐘數」；沒有盤前 / 盤後的交易所 pre = open、post = close
+# close_auction：收盤集合競價的成交時間就是收盤時間 (K 棒時間戳 = close)，這根 K 棒仍算正規時段
+Exchange = namedtuple("Exchange", "code tz pre open lunch close post half_close half_post close_auction", defaults=(False,))
+
+EXCHANGES = {
+    "US": Exchange("US", "America/New_York", _m(4), _m(9, 30), None, _m(16), _m(20), _m(13), _m(17)),
+    "TW": Exchange("TW", "Asia/Taipei", _m(9), _m(9), None, _m(13, 30), _m(13, 30), None, None, close_auction=True),
+    "HK": Exchange("HK", "Asia/Hong_Kong", _m(9), _m(9, 30), (_m(12), _m(13)), _m(16), _m(16, 10), _m(12), _m(12, 10)),
+    "JP": Exchange("JP", "Asia/Tokyo", _m(9), _m(9), (_m(11, 30), _m(12, 30)), _m(15, 30), _m(15, 30), None, None, close_auction=True),
+    "LSE": Exchange("LSE", "Europe/London", _m(8), _m(8), None, _m(16, 30), _m(16, 35), _m(12, 30), _m(12, 35)),
+    "XETRA": Exchange("XETRA", "Europe/Berlin", _m(9), _m(9), None, _m(17, 30), _m(17, 30), None, None),
+    "EURONEXT": Exchange("EURONEXT", "Europe/Paris", _m(9), _m(9), None, _m(17, 30), _m(17, 40), _m(14, 5), _m(14, 15)),
+}
+
+SUFFIXES = {".TW": "TW", ".TWO": "TW", ".HK": "HK", ".T": "JP", ".L": "LSE", ".DE": "XETRA", ".F": "XETRA",
+            ".PA": "EURONEXT", ".AS": "EURONEXT", ".BR": "EURONEXT", ".LS": "EURONEXT"}
+
+
+def exchange_for(ticker):
+    suffix = ticker[ticker.rfind("."):].upper() if "." in ticker else ""
+    return EXCHANGES[SUFFIXES.get(suffix, "US")]
+
+
+# --- 假日 ---
+# 農曆 (與清明) 節日的國曆日期
+LUNAR_DATES = {
+    2024: dict(new_year="2024-02-10", ching_ming="2024-04-04", buddha="2024-05-15", dragon_boat="2024-06-10", mid_autumn="2024-09-17", chung_yeung="2024-10-11"),
+    2025: dict(new_year="2025-01-29", ching_ming="2025-04-04", buddha="2025-05-05", dragon_boat="2025-05-31", mid_autumn="2025-10-06", chung_yeung="2025-10-29"),
+    2026: dict(new_year="2026-02-17", ching_ming="2026-04-05", buddha="2026-05-24", dragon_boat="2026-06-19", mid_autumn="2026-09-25", chung_yeung="2026-10-18"),
+    2027: dict(new_year="2027-02-06", ching_ming="2027-04-05", buddha="2027-05-13", dragon_boat="2027-06-09", mid_autumn="2027-09-15", chung_yeung="2027-10-08"),
+}
+
+
+class _NYSE(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1, observance=sunday_to_monday), USMartinLutherKingJr, USPresidentsDay, GoodFriday,
+             USMemorialDay, Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+             Holiday("Independence Day", month=7, day=4, observance=nearest_workday), USLaborDay, USThanksgivingDay,
+             Holiday("Christmas", month=12, day=25, observance=nearest_workday)]
+
+
+class _LSE(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1, observance=next_monday), GoodFriday, EasterMonday,
+             Holiday("Early May", month=5, day=1, offset=pd.DateOffset(weekday=MO(1))),
+             Holiday("Spring", month=5, day=31, offset=pd.DateOffset(weekday=MO(-1))),
+             Holiday("Summer", month=8, day=31, offset=pd.DateOffset(weekday=MO(-1))),
+             Holiday("Christmas", month=12, day=25, observance=next_monday),
+             Holiday("Boxing Day", month=12, day=26, observance=next_monday_or_tuesday)]
+
+
+class _XETRA(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1), GoodFriday, EasterMonday, Holiday("Labour Day", month=5, day=1),
+             Holiday("Christmas Eve", month=12, day=24), Holiday("Christmas", month=12, day=25),
+             Holiday("St. Stephen", month=12, day=26), Holiday("New Year's Eve", month=12, day=31)]
+
+
+class _Euronext(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1), GoodFriday, EasterMonday, Holiday("Labour Day", month=5, day=1),
+             Holiday("Christmas", month=12, day=25), Holiday("Boxing Day", month=12, day=26)]
+
+
+class _JPX(AbstractHolidayCalendar):
+    # 春分 / 秋分另外計算；國定假日遇週日順延到週一
+    rules = [Holiday("New Year", month=1, day=1), Holiday("Bank Holiday 2", month=1, day=2), Holiday("Bank Holiday 3", month=1, day=3),
+             Holiday("Coming of Age", month=1, day=1, offset=pd.DateOffset(weekday=MO(2))),
+             Holiday("Foundation Day", month=2, day=11, observance=sunday_to_monday),
+             Holiday("Emperor's Birthday", month=2, day=23, observance=sunday_to_monday),
+             Holiday("Showa Day", month=4, day=29, observance=sunday_to_monday),
+             Holiday("Constitution Day", month=5, day=3), Holiday("Greenery Day", month=5, day=4),
+             Holiday("Children's Day", month=5, day=5, observance=sunday_to_monday),
+             Holiday("Marine Day", month=7, day=1, offset=pd.DateOffset(weekday=MO(3))),
+             Holiday("Mountain Day", month=8, day=11, observance=sunday_to_monday),
+             Holiday("Respect for the Aged", month=9, day=1, offset=pd.DateOffset(weekday=MO(3))),
+             Holiday("Sports Day", month=10, day=1, offset=pd.DateOffset(weekday=MO(2))),
+             Holiday("Culture Day", month=11, day=3, observance=sunday_to_monday),
+             Holiday("Labour Thanksgiving", month=11, day=23, observance=sunday_to_monday),
+             Holiday("New Year's Eve", month=12, day=31)]
+
+
+class _TWSE(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1, observance=nearest_workday),
+             Holiday("Peace Memorial", month=2, day=28, observance=nearest_workday),
+             Holiday("Children's Day", month=4, day=4, observance=nearest_workday),
+             Holiday("Labour Day", month=5, day=1), Holiday("National Day", month=10, day=10, observance=nearest_workday)]
+
+
+class _HKEX(AbstractHolidayCalendar):
+    rules = [Holiday("New Year", month=1, day=1, observance=sunday_to_monday), GoodFriday, EasterMonday,
+             Holiday("Labour Day", month=5, day=1, observance=sunday_to_monday),
+             Holiday("HKSAR Day", month=7, day=1, observance=sunday_to_monday),
+             Holiday("National Day", month=10, day=1, observance=sunday_to_monday),
+             Holiday("Christmas", month=12, day=25, observance=sunday_to_monday),
+             Holiday("Boxing Day", month=12, day=26, observance=next_monday_or_tuesday)]
+
+
+_CALENDARS = {"US": _NYSE, "LSE": _LSE, "XETRA": _XETRA, "EURONEXT": _Euronext, "JP": _JPX, "TW": _TWSE, "HK": _HKEX}
+
+
+def _equinoxes(year):
+    # 1980–2099 適用的近似公式
+    spring = int(20.8431 + 0.242194 * (year - 1980) - (year - 1980) // 4)
+    autumn = int(23.2488 + 0.242194 * (year - 1980) - (year - 1980) // 4)
+    return [sunday_to_monday(pd.Timestamp(year, 3, spring)), sunday_to_monday(pd.Timestamp(year, 9, autumn))]
+
+
+def _lunar_closures(code, year):
+    lunar = LUNAR_DATES.get(year)
+    if lunar is None: return []
+    day = {k: pd.Timestamp(v) for k, v in lunar.items()}
+    shift = lambda d, n: d + pd.Timedelta(days=n)
+    if code == "TW":
+        # 除夕前一天到初三 (台股通常再往前多休兩個交易日，以證交所公告為準)
+        out = [shift(day["new_year"], n) for n in range(-2, 3)]
+        out += [nearest_workday(day["dragon_boat"]), nearest_workday(day["mid_autumn"]), nearest_workday(day["ching_ming"])]
+        return out
+    if code == "HK":
+        out = [shift(day["new_year"], n) for n in range(3)]
+        out += [sunday_to_monday(day[k]) for k in ("ching_ming", "buddha", "dragon_boat", "chung_yeung")]
+        out.append(sunday_to_monday(shift(day["mid_autumn"], 1)))   # 中秋翌日
+        return out
+    return []
+
+
+@lru_cache(maxsize=None)
+def holidays(code, year):
+    """該年的休市日 (平日)，datetime64[D] 陣列。"""
+    start, end = pd.Timestamp(year, 1, 1), pd.Timestamp(year, 12, 31)
+    days = list(_CALENDARS[code]().holidays(start, end))
+    if code == "JP": days += _equinoxes(year)
+    days += _lunar_closures(code, year)
+    days = pd.DatetimeIndex(days)
+    days = days[(days.year == year) & (days.dayofweek < 5)]
+    return np.unique(days.values.astype("datetime64[D]"))
+
+
+@lru_cache(maxsize=None)
+def half_days(code, year):
+    """該年的半日市 (提早收盤)，datetime64[D] 陣列。"""
+    ex = EXCHANGES[code]
+    if ex.half_close is None: return np.array([], dtype="datetime64[D]")
+    if code == "US":
+        thanksgiving = USThanksgivingDay.dates(date(year, 1, 1), date(year, 12, 31))[0]
+        days = [pd.Timestamp(year, 7, 3), thanksgiving + pd.Timedelta(days=1), pd.Timestamp(year, 12, 24)]
+    else:
+        days = [pd.Timestamp(year, 12, 24), pd.Timestamp(year, 12, 31)]
+        lunar = LUNAR_DATES.get(year)
+        if code == "HK" and lunar: days.append(pd.Timestamp(lunar["new_year"]) - pd.Timedelta(days=1))   # 除夕
+    days = pd.DatetimeIndex(days)
+    days = days[days.dayofweek < 5].values.astype("datetime64[D]")
+    return np.setdiff1d(days, holidays(code, year))
+
+
+def _lookup(fn, code, days):
+    # 把涵蓋年份的假日 / 半日市合併後，一次判斷整批日期
+    years = np.unique(days.astype("datetime64[Y]").astype(np.int64)) + 1970
+    found = np.concatenate([fn(code, int(y)) for y in years])
+    return np.isin(days, found)
+
+
+# --- 時段邊界 ---
+@lru_cache(maxsize=32)
+def _year_table(code, year):
+    ex = EXCHANGES[code]
+    days = pd.bdate_range(date(year, 1, 1), date(year, 12, 31)).values.astype("datetime64[D]")
+    days = days[~np.isin(days, holidays(code, year))]
+    half = np.isin(days, half_days(code, year))
+    close = np.where(half, ex.half_close if ex.half_close is not None else ex.close, ex.close)
+    post = np.where(half, ex.half_post if ex.half_post is not None else ex.post, ex.post)
+    # 半日市沒有午休
+    lunch_start = np.where(half | (ex.lunch is None), close, ex.lunch[0] if ex.lunch else 0)
+    lunch_end = np.where(half | (ex.lunch is None), close, ex.lunch[1] if ex.lunch else 0)
+    base = pd.DatetimeIndex(days)
+    cols = {"pre_open": np.full(len(days), ex.pre), "open": np.full(len(days), ex.open), "lunch_start": lunch_start,
+            "lunch_end": lunch_end, "close": close, "post_close": post}
+    # 以當地時間組合後再轉 tz，日光節約由 tz 資料處理
+    table = pd.DataFrame({k: (base + pd.to_timedelta(v, unit="min")).tz_localize(ex.tz) for k, v in cols.items()},
+                         index=base.rename("date"))
+    table["half_day"] = half
+    return table
+
+
+def session_table(ticker, start, end):
+    """start 到 end (含) 每個交易日的時段邊界 (交易所時區的 Timestamp)，依年份預先計算並快取。"""
+    code = exchange_for(ticker).code
+    start, end = pd.Timestamp(start).tz_localize(None).normalize(), pd.Timestamp(end).tz_localize(None).normalize()
+    table = pd.concat([_year_table(code, y) for y in range(start.year, end.year + 1)])
+    return table.loc[start:end]
+
+
+def session_for(ticker, day):
+    """day 當天 (交易所當地日期) 的時段邊界；休市日回傳 None。"""
+    table = session_table(ticker, day, day)
+    return None if table.empty else table.iloc[0]
+
+
+# --- 盤中 K 棒標記 ---
+def label_bars(index, ex):
+    """向量化標記每根 K 棒的時段 (CLOSED / PRE / REGULAR / BREAK / POST)，回傳 int8 陣列。
+
+    無時區的 index 視為交易所當地時間。
+    """
+    index = pd.DatetimeIndex(index)
+    if len(index) == 0: return np.array([], dtype=np.int8)
+    local = index.tz_convert(ex.tz).tz_localize(None) if index.tz is not None else index
+    stamps = local.values.astype("datetime64[m]")
+    days = stamps.astype("datetime64[D]")
+    minutes = (stamps - days).astype(np.int64)
+    half = _lookup(half_days, ex.code, days) if ex.half_close is not None else np.zeros(len(days), dtype=bool)
+    closed = _lookup(holidays, ex.code, days) | (local.dayofweek >= 5)
+    close = np.where(half, ex.half_close if ex.half_close is not None else ex.close, ex.close) + int(ex.close_auction)   # 分鐘是整數：+1 即 <= close
+    post = np.where(half, ex.half_post if ex.half_post is not None else ex.post, ex.post)
+    in_lunch = np.zeros(len(days), dtype=bool)
+    if ex.lunch is not None: in_lunch = ~half & (minutes >= ex.lunch[0] + int(ex.close_auction)) & (minutes < ex.lunch[1])
+    out = np.select(
+        [closed, minutes < ex.pre, minutes < ex.open, in_lunch, minutes < close, minutes < post],
+        [CLOSED, CLOSED, PRE, BREAK, REGULAR, POST], CLOSED)
+    return out.astype(np.int8)
+
+
+_lock = threading.Lock()
+_label_cache = OrderedDict()
+_label_bytes = 0
+
+
+def labels(ticker, index):
+    """label_bars() 的快取版本；以 (交易所, 長度, 首尾時間) 辨識同一份盤中資料。"""
+    ex = exchange_for(ticker)
+    if len(index) == 0: return np.array([], dtype=np.int8)
+    key = (ex.code, len(index), index[0], index[-1])
+    with _lock:
+        hit = _label_cache.get(key)
+        if hit is not None:
+            _label_cache.move_to_end(key)
+            return hit
+    global _label_bytes
+    out = label_bars(index, ex)
+    out.setflags(write=False)
+    with _lock:
+        old = _label_cache.pop(key, None)
+        if old is not None: _label_bytes -= old.nbytes
+        _label_cache[key] = out
+        _label_bytes += out.nbytes
+        while len(_label_cache) > 1 and (len(_label_cache) > LABEL_CACHE_SIZE or _label_bytes > LABEL_CACHE_BYTES):
+            _label_bytes -= _label_cache.popitem(last=False)[1].nbytes
+    return out
+
+
+def clear_label_cache():
+    global _label_bytes
+    with _lock:
+        _label_cache.clear()
+        _label_bytes = 0
+
+
+def regular_mask(ticker, index):
+    return labels(ticker, index) == REGULAR
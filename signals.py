@@ -0,0 +1,59 @@
+"""策略訊號判讀 (趨勢 / 量能 / MACD / RSI)。
+
+判讀規則只寫在這裡：單一股票的儀表板與批量掃描共用；
+輸入可以是純量也可以是 NumPy 陣列 (一次判讀整個 watchlist)。
+"""
+import numpy as np
+
+VOL_HOT, VOL_WARM = 2.0, 1.0
+RSI_HOT, RSI_COLD = 70, 30
+
+# 判讀結果 -> (卡片文字, 徽章樣式)
+TREND_DISPLAY = {
+    "多頭": ("🚀 火力全開！(多頭)", "bg-up"),
+    "空頭": ("🐻 熊出沒注意 (空頭)", "bg-down"),
+    "盤整": ("💤 睡覺行情 (盤整)", "bg-gray"),
+}
+VOLUME_DISPLAY = {
+    "爆量": ("🔥 資金派對 (爆量)", "bg-down"),
+    "回溫": ("💧 人氣回溫", "bg-blue"),
+    "冷清": ("❄️ 冷冷清清", "bg-gray"),
+}
+MACD_DISPLAY = {
+    "多方": ("🐂 牛軍集結", "bg-up"),
+    "空方": ("📉 空軍壓境", "bg-down"),
+}
+RSI_DISPLAY = {
+    "過熱": ("🔥 太燙了！(過熱)", "bg-down"),
+    "超賣": ("🧊 跌過頭囉 (超賣)", "bg-up"),
+    "中性": ("⚖️ 多空拔河", "bg-gray"),
+}
+
+
+def _out(x):
+    return x.item() if isinstance(x, np.ndarray) and x.ndim == 0 else x
+
+
+def trend_state(close, fast, slow):
+    close, fast, slow = np.asarray(close), np.asarray(fast), np.asarray(slow)
+    return _out(np.select([(close > fast) & (fast > slow), (close < fast) & (fast < slow)], ["多頭", "空頭"], "盤整"))
+
+
+def volume_ratio(volume, vol_ma):
+    volume, vol_ma = np.asarray(volume, dtype=float), np.asarray(vol_ma, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _out(np.where(vol_ma > 0, volume / vol_ma, 0.0))
+
+
+def volume_state(ratio):
+    ratio = np.asarray(ratio)
+    return _out(np.select([ratio > VOL_HOT, ratio > VOL_WARM], ["爆量", "回溫"], "冷清"))
+
+
+def macd_state(hist):
+    return _out(np.where(np.asarray(hist) > 0, "多方", "空方"))
+
+
+def rsi_state(rsi):
+    rsi = np.asarray(rsi)
+    return _out(np.select([rsi > RSI_HOT, rsi < RSI_COLD], ["過熱", "超賣"], "中性"))
@@ -0,0 +1,56 @@
+"""AI 報告：沒有設定模型時直接給規則判讀 (不算失敗)；模型失敗或額度用完才是 FALLBACK。"""
+import time
+
+import pytest
+
+import ai_report
+import core
+
+STATES = {"trend": "多頭", "ma_fast": 10.0, "ma_slow": 9.0, "volume": "回溫", "volume_ratio": 1.0,
+          "macd": "多方", "macd_value": 0.5, "hist": 0.1, "rsi": "中性", "rsi_value": 55.0}
+
+
+def wait_ready(svc, *args):
+    for _ in range(200):
+        status, text = svc.get(*args)
+        if status != ai_report.PENDING: return status, text
+        time.sleep(0.01)
+    raise AssertionError("報告一直沒有完成")
+
+
+def test_no_model_returns_rules_immediately():
+    svc = ai_report.ReportService(None)
+    assert svc.get("TSLA", "2024-01-02", STATES, 5, 10) == (ai_report.RULES, core.summary_text("TSLA", STATES))
+
+
+def test_init_failure_is_fallback():
+    svc = ai_report.ReportService(None)
+    svc.init_failed = True
+    assert svc.get("TSLA", "2024-01-02", STATES, 5, 10)[0] == ai_report.FALLBACK
+
+
+def test_model_without_key_defaults_to_none(monkeypatch):
+    for name in ("STOCK_APP_AI_MODEL", "GEMINI_API_KEY", "GOOGLE_API_KEY"): monkeypatch.delenv(name, raising=False)
+    assert ai_report.model_from_env() is None
+    monkeypatch.setenv("STOCK_APP_AI_MODEL", "stub")
+    assert isinstance(ai_report.model_from_env(), ai_report.StubModel)
+
+
+def test_stub_model_is_ready_and_shared():
+    svc = ai_report.ReportService(ai_report.StubModel(delay=0))
+    args = ("TSLA", "2024-01-02", STATES, 5, 10)
+    status, text = wait_ready(svc, *args)
+    assert status == ai_report.READY and text.startswith("[stub]")
+    assert svc.get(*args) == (status, text) and svc.generated == 1
+
+
+def test_budget_exhausted_is_fallback():
+    svc = ai_report.ReportService(ai_report.StubModel(delay=0), budget=0)
+    assert svc.get("TSLA", "2024-01-02", STATES, 5, 10)[0] == ai_report.FALLBACK
+
+
+def test_model_error_is_fallback():
+    class Broken:
+        def generate(self, prompt, states): raise RuntimeError("boom")
+    svc = ai_report.ReportService(Broken())
+    assert wait_ready(svc, "TSLA", "2024-01-02", STATES, 5, 10)[0] == ai_report.FALLBACK
@@ -0,0 +1,89 @@
+"""向量化參數網格與逐組、逐根 K 棒的純量回測一致。"""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from ta.momentum import RSIIndicator
+from ta.trend import MACD
+
+import backtest
+import indicators
+import signals
+
+FAST, SLOW = [3, 5, 10], [5, 10, 20, 30]
+
+
+def make_daily(n=400, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    volume = rng.integers(100_000, 5_000_000, n).astype(float)
+    return pd.DataFrame({"Close": close, "Volume": volume}, index=pd.bdate_range("2018-01-01", periods=n))
+
+
+def scalar_backtest(df, fast, slow, use_rsi=False, use_macd=False, allow_short=False, cost=backtest.DEFAULT_COST):
+    """單一參數組、逐根 K 棒的參考實作。"""
+    close = df["Close"].tolist()
+    ma_fast = df["Close"].rolling(fast).mean().tolist()
+    ma_slow = df["Close"].rolling(slow).mean().tolist()
+    rsi = RSIIndicator(df["Close"], indicators.RSI_WINDOW).rsi().tolist()
+    hist = MACD(df["Close"]).macd_diff().tolist()
+
+    equity, peak, drawdown, prev_pos = 1.0, 1.0, 0.0, 0
+    curve, pos_list = [], []
+    for i, c in enumerate(close):
+        long_ = c > ma_fast[i] > ma_slow[i]
+        short = c < ma_fast[i] < ma_slow[i]
+        if use_rsi:
+            long_ = long_ and not rsi[i] > signals.RSI_HOT
+            short = short and not rsi[i] < signals.RSI_COLD
+        if use_macd:
+            long_ = long_ and hist[i] > 0
+            short = short and hist[i] < 0
+        pos = 1 if long_ else (-1 if allow_short and short else 0)
+        ret = c / close[i - 1] - 1 if i else 0.0
+        equity *= 1 + max(prev_pos * ret - abs(pos - prev_pos) * cost, -0.999999)
+        peak = max(peak, equity)
+        drawdown = min(drawdown, equity / peak - 1)
+        curve.append(equity)
+        pos_list.append(pos)
+        prev_pos = pos
+
+    # 逐筆交易：進場那根收盤到出場那根收盤 (最後一筆未平倉則算到最後一根)
+    trades = wins = 0
+    entry = None
+    for i, pos in enumerate(pos_list + [0]):
+        prev = pos_list[i - 1] if i else 0
+        if pos == prev: continue
+        if prev != 0:
+            trades += 1
+            wins += curve[min(i, len(curve) - 1)] > curve[entry]
+        entry = i if pos != 0 else None
+
+    n = len(close)
+    return {"total_return": curve[-1] - 1, "cagr": curve[-1] ** (backtest.TRADING_DAYS / n) - 1, "max_drawdown": drawdown,
+            "hit_rate": wins / trades if trades else math.nan, "trades": trades,
+            "exposure": sum(abs(p) for p in pos_list) / n}
+
+
+@pytest.mark.parametrize("use_rsi, use_macd, allow_short", [(False, False, False), (True, True, False), (False, False, True), (True, True, True)])
+@pytest.mark.parametrize("parallel", [False, True])
+def test_sweep_matches_scalar_loop(use_rsi, use_macd, allow_short, parallel, monkeypatch):
+    monkeypatch.setattr(backtest, "CHUNK_PAIRS", 5)   # 拆成多塊，連切塊的拼接一起驗證
+    df = make_daily()
+    grids = backtest.sweep(df, FAST, SLOW, use_rsi, use_macd, allow_short, parallel=parallel)
+    for f in FAST:
+        for s in SLOW:
+            if f >= s:
+                assert all(np.isnan(grids[k].loc[f, s]) for k in grids)
+                continue
+            expected = scalar_backtest(df, f, s, use_rsi, use_macd, allow_short)
+            for k, v in expected.items():
+                np.testing.assert_allclose(grids[k].loc[f, s], v, rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=f"{k} MA{f}/MA{s}")
+
+
+def test_buy_and_hold_matches_close_ratio():
+    df = make_daily()
+    result = backtest.buy_and_hold(df)
+    assert result["total_return"] == pytest.approx(df["Close"].iloc[-1] / df["Close"].iloc[0] - 1)
+    assert result["trades"] == 1 and result["exposure"] == 1
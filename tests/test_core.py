@@ -0,0 +1,87 @@
+"""無 UI 分析核心：由錄製檔 (replay) 產生快照、JSON 轉換、批量輸出單筆失敗不中斷。"""
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import core
+import indicators
+import market_cache
+import ohlcv_store
+import providers
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+import synthetic  # noqa: E402
+
+TICKERS = ("TSLA", "2330.TW")
+
+
+@pytest.fixture(scope="module")
+def replay_root(tmp_path_factory):
+    return synthetic.ensure_fixtures(str(tmp_path_factory.mktemp("replay")), TICKERS, years=2)
+
+
+@pytest.fixture
+def replay(replay_root, tmp_path, monkeypatch):
+    previous = providers.current()
+    monkeypatch.setattr(ohlcv_store, "DATA_DIR", str(tmp_path))
+    providers.set_provider(providers.ReplayProvider(replay_root))
+    market_cache.CACHE.clear()
+    indicators.clear_cache()
+    yield providers.current()
+    providers.set_provider(previous)
+    market_cache.CACHE.clear()
+    indicators.clear_cache()
+
+
+def test_snapshot_from_replay(replay):
+    snap = core.load_snapshot("TSLA")
+    info = replay.info("TSLA")
+    daily = replay.daily("TSLA")
+    assert snap["ticker"] == "TSLA" and snap["name"] == info["longName"]
+    assert snap["as_of"] == daily.index[-1]
+    assert (snap["strategy"]["fast"], snap["strategy"]["slow"]) == core.auto_strategy(info)[:2]
+    assert snap["price"]["regular"] == info["currentPrice"] and snap["price"]["previous_close"] == info["previousClose"]
+    assert snap["price"]["change_pct"] == pytest.approx((info["currentPrice"] / info["previousClose"] - 1) * 100)
+
+    df = daily.join(pd.DataFrame(indicators.compute(daily["Close"], daily["Volume"])[0], index=daily.index))
+    states = core.signal_states(df, snap["strategy"]["fast"], snap["strategy"]["slow"])
+    assert {k: snap["signals"][k] for k in ("trend", "volume", "macd", "rsi")} == {k: states[k] for k in ("trend", "volume", "macd", "rsi")}
+    assert [row["window"] for row in snap["ma"]] == list(indicators.MA_WINDOWS)
+    assert snap["day_range"]["low"] <= snap["day_range"]["high"]
+    assert "TSLA" in snap["summary"]
+
+
+def test_snapshot_with_explicit_strategy(replay):
+    snap = core.load_snapshot("2330.TW", fast=20, slow=60)
+    assert snap["strategy"] == {"fast": 20, "slow": 60, "desc": "自訂策略"}
+    assert snap["signals"]["ma_fast"] == pytest.approx(snap["ma"][indicators.MA_WINDOWS.index(20)]["value"], rel=1e-4)
+
+
+def test_to_jsonable():
+    value = {"nan": float("nan"), "np_nan": np.float32("nan"), "int": np.int64(3), "flag": np.bool_(True),
+             "when": pd.Timestamp("2026-10-16 09:30", tz="America/New_York"), "rows": ({"x": np.float64(1.5)}, [None])}
+    out = core.to_jsonable(value)
+    assert out == {"nan": None, "np_nan": None, "int": 3, "flag": True, "when": "2026-10-16T09:30:00-04:00",
+                   "rows": [{"x": 1.5}, [None]]}
+    assert type(out["int"]) is int and type(out["flag"]) is bool
+    json.dumps(out, allow_nan=False)
+
+
+def test_snapshot_is_json_serializable(replay):
+    ok, line = core._snapshot_line("TSLA", None, None)
+    assert ok
+    data = json.loads(line)
+    assert data["ticker"] == "TSLA" and isinstance(data["as_of"], str)
+    assert not any(isinstance(v, float) and math.isnan(v) for v in data["price"].values())
+
+
+def test_snapshot_line_reports_unknown_ticker(replay):
+    ok, line = core._snapshot_line("NOPE", None, None)
+    assert not ok
+    data = json.loads(line)
+    assert data["ticker"] == "NOPE" and data["error"].startswith("ValueError")
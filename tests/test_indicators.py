@@ -0,0 +1,147 @@
+"""indicators 與 ta 套件的數值一致性，以及增量更新與整段重算的一致性。"""
+import numpy as np
+import pandas as pd
+import pytest
+from ta.momentum import RSIIndicator
+from ta.trend import MACD, SMAIndicator
+
+import indicators
+
+RTOL = 1e-9
+
+
+def make_daily(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    volume = rng.integers(100_000, 5_000_000, n).astype(float)
+    return pd.DataFrame({"Close": close, "Volume": volume}, index=pd.bdate_range("2015-01-01", periods=n))
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    indicators.clear_cache()
+    yield
+    indicators.clear_cache()
+
+
+def assert_same(actual, expected, rtol=RTOL):
+    np.testing.assert_allclose(np.asarray(actual, dtype=float), np.asarray(expected, dtype=float), rtol=rtol, equal_nan=True)
+
+
+@pytest.mark.parametrize("n", [30, 250, 2500])
+def test_compute_matches_ta(n):
+    df = make_daily(n)
+    cols, _ = indicators.compute(df["Close"], df["Volume"])
+
+    for w in indicators.MA_WINDOWS:
+        assert_same(cols[f"MA_{w}"], SMAIndicator(df["Close"], window=w).sma_indicator())
+    assert_same(cols["RSI"], RSIIndicator(df["Close"], window=indicators.RSI_WINDOW).rsi())
+    macd = MACD(df["Close"], window_slow=indicators.MACD_SLOW, window_fast=indicators.MACD_FAST, window_sign=indicators.MACD_SIGN)
+    assert_same(cols["MACD"], macd.macd())
+    assert_same(cols["Signal"], macd.macd_signal())
+    assert_same(cols["Hist"], macd.macd_diff().fillna(0.0))   # 儀表板的柱狀體開頭以 0 代替 NaN
+    assert_same(cols["Vol_MA"], SMAIndicator(df["Volume"], window=indicators.VOL_MA_WINDOW).sma_indicator())
+
+
+def test_sma_matches_ta():
+    df = make_daily(300, seed=1)
+    assert_same(indicators.sma(df["Close"], 7), SMAIndicator(df["Close"], window=7).sma_indicator())
+
+
+def full_recompute(df):
+    indicators.clear_cache()
+    return indicators.compute_indicators("TEST", df)
+
+
+def test_append_matches_full_recompute():
+    df = make_daily(400)
+    indicators.compute_indicators("TEST", df.iloc[:-3])
+    for end in (-2, -1, None):   # 連續新增幾根 K 棒
+        incremental = indicators.compute_indicators("TEST", df.iloc[:end])
+    expected = full_recompute(df)
+    assert incremental.index.equals(expected.index)
+    assert_same(incremental, expected, rtol=1e-6)   # 快取以 float32 存放
+
+
+def test_replace_last_matches_full_recompute():
+    df = make_daily(400)
+    indicators.compute_indicators("TEST", df)
+    revised = df.copy()
+    revised.iloc[-1] = [revised["Close"].iloc[-1] * 1.03, revised["Volume"].iloc[-1] * 2]
+    incremental = indicators.compute_indicators("TEST", revised)
+    expected = full_recompute(revised)
+    assert_same(incremental, expected, rtol=1e-6)
+
+
+def test_append_keeps_earlier_frames():
+    df = make_daily(400)
+    before = indicators.compute_indicators("TEST", df.iloc[:-1])
+    snapshot = before.copy()
+    indicators.compute_indicators("TEST", df)
+    pd.testing.assert_frame_equal(before, snapshot)
+
+
+def test_replace_last_keeps_earlier_frames():
+    df = make_daily(400)
+    before = indicators.compute_indicators("TEST", df)
+    snapshot = before.copy()
+    revised = df.copy()
+    revised.iloc[-1, revised.columns.get_loc("Close")] *= 1.05
+    after = indicators.compute_indicators("TEST", revised)
+    pd.testing.assert_frame_equal(before, snapshot)
+    assert after["RSI"].iloc[-1] != before["RSI"].iloc[-1]
+
+
+def test_append_beyond_spare_capacity():
+    df = make_daily(300)
+    start = 100
+    indicators.compute_indicators("TEST", df.iloc[:start])
+    first_data = next(iter(indicators._cache.values()))[3]
+    assert len(first_data) < len(df)
+    for end in range(start + 1, len(df) + 1):   # 超過預留列數，底層陣列需要搬家
+        incremental = indicators.compute_indicators("TEST", df.iloc[:end])
+    assert next(iter(indicators._cache.values()))[3] is not first_data
+    assert_same(incremental, full_recompute(df), rtol=1e-6)
+
+
+def split_adjusted(df, ratio=10):
+    """模擬分割後重抓的歷史：最後一根之前全部除以 ratio，最後一根不變。"""
+    adjusted = df.copy()
+    adjusted.iloc[:-1, adjusted.columns.get_loc("Close")] /= ratio
+    return adjusted
+
+
+def test_adjusted_history_with_same_last_bar_recomputes():
+    df = make_daily(400)
+    indicators.compute_indicators("TEST", df)
+    adjusted = split_adjusted(df)
+    result = indicators.compute_indicators("TEST", adjusted)
+    assert_same(result, full_recompute(adjusted), rtol=1e-6)
+
+
+def test_adjusted_history_with_new_bar_recomputes():
+    df = make_daily(401)
+    indicators.compute_indicators("TEST", df.iloc[:-1])
+    adjusted = split_adjusted(df)
+    result = indicators.compute_indicators("TEST", adjusted)
+    assert_same(result, full_recompute(adjusted), rtol=1e-6)
+
+
+def test_adjusted_history_with_revised_last_bar_recomputes():
+    df = make_daily(400)
+    indicators.compute_indicators("TEST", df)
+    adjusted = split_adjusted(df)
+    adjusted.iloc[-1, adjusted.columns.get_loc("Close")] *= 1.01
+    result = indicators.compute_indicators("TEST", adjusted)
+    assert_same(result, full_recompute(adjusted), rtol=1e-6)
+
+
+def test_cache_evicts_by_bytes(monkeypatch):
+    df = make_daily(300)
+    indicators.compute_indicators("A", df)
+    size = indicators._nbytes
+    monkeypatch.setattr(indicators, "CACHE_BYTES", size * 2)
+    indicators.compute_indicators("B", df)
+    indicators.compute_indicators("C", df)
+    assert [key[0] for key in indicators._cache] == ["B", "C"]
+    assert indicators._nbytes == size * 2
@@ -0,0 +1,181 @@
+"""共用快取 TTLCache：命中與過期、single-flight、上游失敗時的舊資料頂替、依 bytes 的 LRU 淘汰。"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import market_cache
+
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def monotonic(self): return self.now
+
+
+class CountingFetch:
+    """每次呼叫回傳 values 的下一個值 (Exception 實例則丟出)，並記錄呼叫次數。"""
+
+    def __init__(self, *values):
+        self.values, self.calls = list(values), 0
+
+    def __call__(self):
+        value = self.values[min(self.calls, len(self.values) - 1)]
+        self.calls += 1
+        if isinstance(value, BaseException): raise value
+        return value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(market_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    return market_cache.TTLCache(budget=10 * 2**20)
+
+
+FRAME = pd.DataFrame({"Close": [1.0, 2.0]})
+EMPTY = pd.DataFrame()
+
+
+def test_empty_response_serves_stale_value(cache, clock):
+    fetch = CountingFetch(FRAME, EMPTY, FRAME)
+    get = lambda: cache.get_or_fetch(("fx", "X"), 1800, fetch, valid=market_cache._not_empty)
+    assert get() is FRAME
+    clock.now += 1801
+    assert get() is FRAME                         # 空表視為失敗，改用舊資料
+    assert cache.stale_served == 1
+    clock.now += market_cache.STALE_RETRY - 1
+    assert get() is FRAME and fetch.calls == 2    # STALE_RETRY 內不再打上游
+    clock.now += 2
+    assert get() is FRAME and fetch.calls == 3
+
+
+def test_empty_response_without_stale_value_retries_soon(cache, clock):
+    fetch = CountingFetch(EMPTY, FRAME)
+    get = lambda: cache.get_or_fetch(("fx", "X"), 1800, fetch, valid=market_cache._not_empty)
+    assert get().empty
+    clock.now += market_cache.STALE_RETRY + 1     # 不會把空表留滿整個 TTL
+    assert get() is FRAME
+    assert fetch.calls == 2
+
+
+def test_hit_until_ttl_expires(cache, clock):
+    fetch = CountingFetch(FRAME, FRAME.copy())
+    get = lambda: cache.get_or_fetch(("history", "X"), 60, fetch)
+    assert get() is FRAME and get() is FRAME
+    clock.now += 61
+    assert get() is not FRAME
+    assert fetch.calls == 2 and (cache.hits, cache.misses) == (1, 2)
+
+
+def test_concurrent_requests_share_one_fetch(cache, monkeypatch):
+    lookups, started, release = [], threading.Event(), threading.Event()
+    monkeypatch.setattr(market_cache.perf, "cache_lookup", lambda kind, hit: lookups.append(hit))
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return FRAME
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch(("history", "X"), 60, fetch))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]: t.start()
+    while len(lookups) < len(threads): time.sleep(0.001)   # 其他請求都在等同一個 fetch
+    release.set()
+    for t in threads: t.join(5)
+    assert len(results) == 5 and all(r is FRAME for r in results)
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_concurrent_requests_share_the_error(cache):
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        raise ConnectionError("down")
+
+    errors = []
+    def get():
+        try: cache.get_or_fetch(("history", "X"), 60, fetch)
+        except ConnectionError as e: errors.append(e)
+
+    leader, follower = threading.Thread(target=get), threading.Thread(target=get)
+    leader.start()
+    started.wait(5)
+    follower.start()
+    release.set()
+    leader.join(5); follower.join(5)
+    assert len(errors) == 2 and cache.misses == 1
+
+
+def test_failure_without_stale_value_raises(cache):
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch(("history", "X"), 60, CountingFetch(ConnectionError("down")))
+    assert cache.peek(("history", "X")) is None
+
+
+def test_failure_serves_stale_value_then_retries(cache, clock):
+    fetch = CountingFetch(FRAME, ConnectionError("down"), ConnectionError("down"))
+    get = lambda: cache.get_or_fetch(("history", "X"), 60, fetch)
+    get()
+    clock.now += 61
+    assert get() is FRAME and cache.stale_served == 1
+    assert get() is FRAME and fetch.calls == 2    # STALE_RETRY 內直接用舊資料
+    clock.now += market_cache.STALE_RETRY + 1
+    assert get() is FRAME and fetch.calls == 3 and cache.stale_served == 2
+
+
+def test_stale_value_dropped_after_stale_keep(cache, clock):
+    cache.get_or_fetch(("history", "X"), 60, CountingFetch(FRAME))
+    clock.now += 60 + market_cache.STALE_KEEP
+    cache.get_or_fetch(("history", "Y"), 60, CountingFetch(FRAME))   # 寫入時清掉過久的舊資料
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch(("history", "X"), 60, CountingFetch(ConnectionError("down")))
+
+
+def test_invalidate_refetches_but_keeps_stale_value(cache, clock):
+    key = ("intraday", "X")
+    cache.get_or_fetch(key, 60, CountingFetch(FRAME))
+    cache.invalidate(key)
+    assert cache.get_fresh(key) == (False, None)
+    assert cache.peek(key) is FRAME
+    fetch = CountingFetch(ConnectionError("down"))
+    assert cache.get_or_fetch(key, 60, fetch) is FRAME and fetch.calls == 1
+
+
+def frame(n):
+    return pd.DataFrame({"Close": np.zeros(n)})
+
+
+def test_lru_eviction_by_bytes(clock):
+    size = market_cache._sizeof(frame(1000))
+    cache = market_cache.TTLCache(budget=int(size * 2.5))
+    for name in "AB": cache.get_or_fetch(("history", name), 60, lambda: frame(1000))
+    cache.get_or_fetch(("history", "A"), 60, CountingFetch())   # 命中：A 變成最近使用
+    cache.get_or_fetch(("history", "C"), 60, lambda: frame(1000))
+    assert cache.peek(("history", "B")) is None
+    assert cache.peek(("history", "A")) is not None and cache.peek(("history", "C")) is not None
+    assert cache.nbytes == 2 * size and cache.evictions == 1
+
+
+def test_entry_larger_than_budget_is_kept_alone(clock):
+    cache = market_cache.TTLCache(budget=market_cache._sizeof(frame(10)))
+    cache.get_or_fetch(("history", "A"), 60, lambda: frame(10))
+    cache.get_or_fetch(("history", "B"), 60, lambda: frame(1000))
+    assert cache.peek(("history", "A")) is None and cache.peek(("history", "B")) is not None
+
+
+def test_replacing_entry_updates_bytes(cache, clock):
+    cache.get_or_fetch(("history", "A"), 60, lambda: frame(1000))
+    clock.now += 61
+    cache.get_or_fetch(("history", "A"), 60, lambda: frame(10))
+    assert cache.nbytes == market_cache._sizeof(frame(10))
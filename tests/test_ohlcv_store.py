@@ -0,0 +1,119 @@
+"""本機日線資料庫：正常補上新 K 棒，除權息 / 分割後改成整段重抓，並行的讀寫不會縮短存檔區間。"""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import ohlcv_store
+
+
+def make_bars(start, n, price=100.0, dividends=None):
+    index = pd.bdate_range(start, periods=n, tz="America/New_York")
+    close = [price + i for i in range(n)]
+    df = pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close,
+                       "Volume": [1000.0] * n, "Dividends": 0.0, "Stock Splits": 0.0}, index=index)
+    for day, amount in (dividends or {}).items(): df.loc[pd.Timestamp(day, tz="America/New_York"), "Dividends"] = amount
+    return df
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_store, "DATA_DIR", str(tmp_path))
+    full = make_bars("2024-01-01", 30)
+    full.attrs["full_years"] = ohlcv_store.HISTORY_YEARS
+    ohlcv_store.write("TEST", full)
+    return full
+
+
+class Upstream:
+    def __init__(self, full, since):
+        self.full, self.since, self.calls = full, since, []
+
+    def fetch_full(self, years):
+        self.calls.append(("full", years))
+        return self.full
+
+    def fetch_since(self, start):
+        self.calls.append(("since", start))
+        return self.since[self.since.index >= start]
+
+
+def load(upstream):
+    return ohlcv_store.load_history("TEST", upstream.fetch_full, upstream.fetch_since, max_age=0)
+
+
+def test_appends_new_bars(store):
+    upstream = Upstream(None, make_bars("2024-01-01", 32))
+    df = load(upstream)
+    assert upstream.calls == [("since", store.index[-2])]
+    assert len(df) == 32
+    assert len(ohlcv_store.read("TEST")) == 32
+
+
+def test_refetches_when_closed_bar_was_adjusted(store):
+    adjusted = make_bars("2024-01-01", 32, price=98.0)   # 除息後整段價格往下還原
+    upstream = Upstream(adjusted, adjusted)
+    df = load(upstream)
+    assert [c[0] for c in upstream.calls] == ["since", "full"]
+    pd.testing.assert_series_equal(df["Close"], adjusted["Close"])
+
+
+def test_refetches_on_new_dividend(store):
+    since = make_bars("2024-01-01", 32, dividends={"2024-02-12": 0.5})
+    upstream = Upstream(since, since)
+    load(upstream)
+    assert [c[0] for c in upstream.calls] == ["since", "full"]
+
+
+def test_known_dividend_does_not_refetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_store, "DATA_DIR", str(tmp_path))
+    stored = make_bars("2024-01-01", 30, dividends={"2024-02-08": 0.5})
+    ohlcv_store.write("TEST", stored)
+    upstream = Upstream(None, make_bars("2024-01-01", 31, dividends={"2024-02-08": 0.5}))
+    load(upstream)
+    assert [c[0] for c in upstream.calls] == ["since"]
+
+
+def test_concurrent_short_and_long_loads_keep_long_span(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_store, "DATA_DIR", str(tmp_path))
+    long_bars, short_bars = make_bars("2015-01-01", 2600), make_bars("2015-01-01", 2600).iloc[-500:]
+    short_started = threading.Event()
+    calls = []
+
+    def slow_short(years):
+        calls.append(years)
+        short_started.set()
+        time.sleep(0.2)
+        return short_bars
+
+    def fast_long(years):
+        calls.append(years)
+        return long_bars
+
+    short = threading.Thread(target=ohlcv_store.load_history, args=("TEST", slow_short, None), kwargs={"years": 2})
+    short.start()
+    short_started.wait()
+    ohlcv_store.load_history("TEST", fast_long, None, years=10)
+    short.join()
+    stored = ohlcv_store.read("TEST")
+    assert stored.attrs["full_years"] == 10 and len(stored) == len(long_bars)
+    assert calls == [2, 10]
+    upstream = Upstream(None, long_bars)
+    ohlcv_store.load_history("TEST", upstream.fetch_full, upstream.fetch_since, max_age=3600, years=2)
+    assert upstream.calls == []   # 10 年的存檔已涵蓋 2 年，不再下載
+
+
+def test_full_fetch_never_shrinks_longer_stored_span(tmp_path, monkeypatch):
+    monkeypatch.setattr(ohlcv_store, "DATA_DIR", str(tmp_path))
+    long_bars = make_bars("2015-01-01", 2600)
+    long_bars.attrs["full_years"] = 10
+
+    def short_fetch(years):
+        ohlcv_store.write("TEST", long_bars)   # 下載期間另一個 process 存了 10 年
+        return long_bars.iloc[-500:].copy()
+
+    df = ohlcv_store.load_history("TEST", short_fetch, None, years=2)
+    stored = ohlcv_store.read("TEST")
+    assert stored.attrs["full_years"] == 10 and len(stored) == len(long_bars)
+    assert len(df) == len(ohlcv_store.trim_window(long_bars, 2))
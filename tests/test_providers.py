@@ -0,0 +1,40 @@
+"""provider 的逾時：每種上游請求都要能在 timeout 內放棄。"""
+import threading
+import time
+
+import pytest
+
+import providers
+
+
+def test_yahoo_info_times_out(monkeypatch):
+    release = threading.Event()
+
+    class HangingTicker:
+        def __init__(self, ticker): pass
+
+        @property
+        def info(self):
+            release.wait(5)
+            return {}
+
+    monkeypatch.setattr(providers.yf, "Ticker", HangingTicker)
+    start = time.monotonic()
+    try:
+        with pytest.raises(TimeoutError): providers.YahooProvider().info("TSLA", timeout=0.1)
+    finally: release.set()
+    assert time.monotonic() - start < 2
+
+
+def test_yahoo_info_returns_value(monkeypatch):
+    monkeypatch.setattr(providers.yf, "Ticker", lambda ticker: type("T", (), {"info": {"longName": ticker}})())
+    assert providers.YahooProvider().info("TSLA", timeout=1) == {"longName": "TSLA"}
+
+
+@pytest.mark.parametrize("call", [lambda p: p.info("TSLA", timeout=0.05), lambda p: p.daily("TSLA", years=2, timeout=0.05),
+                                  lambda p: p.intraday("TSLA", timeout=0.05), lambda p: p.fx("USDTWD=X", timeout=0.05)])
+def test_replay_latency_beyond_timeout_raises(tmp_path, call):
+    provider = providers.ReplayProvider(root=str(tmp_path), latency=1.0, jitter=0)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError): call(provider)
+    assert time.monotonic() - start < 0.5
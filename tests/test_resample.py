@@ -0,0 +1,82 @@
+"""多週期 K 線：增量合成與整段合成一致，除權息 / 分割還原後的歷史整段重算。"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import resample
+
+
+def make_daily(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    spread = close * rng.uniform(0, 0.02, n)
+    index = pd.bdate_range("2020-01-01", periods=n, tz="America/New_York")
+    return pd.DataFrame({"Open": close + rng.normal(0, 1, n), "High": close + spread, "Low": close - spread,
+                         "Close": close, "Volume": rng.integers(1_000, 10_000, n).astype(float)}, index=index)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    resample.clear_cache()
+    yield
+    resample.clear_cache()
+
+
+def full_resample(df, timeframe):
+    resample.clear_cache()
+    return resample.resample("TEST", df, timeframe)
+
+
+@pytest.mark.parametrize("timeframe, rule", [("1wk", "W-FRI"), ("1mo", "MS")])
+def test_matches_pandas_resample(timeframe, rule):
+    df = make_daily(300)
+    bars = resample.resample("TEST", df, timeframe)
+    expected = df.tz_localize(None).resample(rule).agg(
+        {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}).dropna()
+    np.testing.assert_allclose(bars.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+def test_incremental_matches_full(timeframe):
+    df = make_daily(300)
+    resample.resample("TEST", df.iloc[:250], timeframe)
+    for end in range(251, len(df) + 1):   # 一根一根補上，跨過週 / 月的邊界
+        incremental = resample.resample("TEST", df.iloc[:end], timeframe)
+    pd.testing.assert_frame_equal(incremental, full_resample(df, timeframe))
+
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+def test_revised_last_bar_matches_full(timeframe):
+    df = make_daily(300)
+    resample.resample("TEST", df, timeframe)
+    revised = df.copy()
+    revised.iloc[-1, revised.columns.get_loc("Close")] *= 1.05
+    pd.testing.assert_frame_equal(resample.resample("TEST", revised, timeframe), full_resample(revised, timeframe))
+
+
+def split_adjusted(df, ratio=10):
+    adjusted = df.copy()
+    adjusted.iloc[:-1, :4] /= ratio   # 最後一根之前的價格全部還原，最後一根不變
+    return adjusted
+
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+@pytest.mark.parametrize("new_bars", [0, 1])
+def test_adjusted_history_recomputes(timeframe, new_bars):
+    df = make_daily(300)
+    resample.resample("TEST", df.iloc[:len(df) - new_bars], timeframe)
+    adjusted = split_adjusted(df)
+    bars = resample.resample("TEST", adjusted, timeframe)
+    pd.testing.assert_frame_equal(bars, full_resample(adjusted, timeframe))
+    assert bars["Close"].iloc[0] == pytest.approx(full_resample(df, timeframe)["Close"].iloc[0] / 10)
+
+
+def test_cache_evicts_by_bytes(monkeypatch):
+    df = make_daily(300)
+    resample.resample("A", df, "1wk")
+    size = resample._nbytes
+    monkeypatch.setattr(resample, "CACHE_BYTES", size * 2)
+    resample.resample("B", df, "1wk")
+    resample.resample("C", df, "1wk")
+    assert [key[0] for key in resample._cache] == ["B", "C"]
+    assert resample._nbytes == size * 2
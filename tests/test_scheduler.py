@@ -0,0 +1,52 @@
+"""排程器只重試暫時性的上游錯誤。"""
+import pytest
+
+import scheduler
+
+
+class HTTPError(OSError):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.response = type("Response", (), {"status_code": status})()
+
+
+class YFRateLimitError(Exception):
+    pass
+
+
+def failing(errors):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors): raise errors[len(calls) - 1]
+        return "ok"
+    return fn, calls
+
+
+@pytest.fixture
+def sched():
+    return scheduler.Scheduler(rate=1000, burst=100, backoff_base=0.001, backoff_cap=0.001, seed=0)
+
+
+@pytest.mark.parametrize("error", [ConnectionError("reset"), TimeoutError("slow"), HTTPError(503), HTTPError(429), YFRateLimitError("Too Many Requests")])
+def test_retries_transient_errors(sched, error):
+    fn, calls = failing([error, error])
+    assert sched.call(fn) == "ok"
+    assert len(calls) == 3
+    assert sched.retries == 2
+
+
+@pytest.mark.parametrize("error", [ValueError("bad ticker"), KeyError("Close"), HTTPError(404), FileNotFoundError("fixture")])
+def test_raises_other_errors_immediately(sched, error):
+    fn, calls = failing([error])
+    with pytest.raises(type(error)): sched.call(fn)
+    assert len(calls) == 1
+    assert sched.retries == 0
+    assert sched.failures == 1
+
+
+def test_gives_up_after_max_retries(sched):
+    fn, calls = failing([ConnectionError("down")] * 10)
+    with pytest.raises(ConnectionError): sched.call(fn)
+    assert len(calls) == sched.max_retries + 1
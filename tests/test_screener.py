@@ -0,0 +1,58 @@
+"""批量掃描的每個欄位與單檔儀表板 (core.signal_states) 的判讀一致。"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import core
+import indicators
+import screener
+
+FAST, SLOW = 10, 20
+
+
+def make_panel(n=300, seed=2):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2023-01-02", periods=n)
+    tickers = ["AAA", "BBB", "CCC", "DDD"]
+    close = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n, len(tickers))), axis=0)), index=index, columns=tickers)
+    volume = pd.DataFrame(rng.integers(100_000, 5_000_000, (n, len(tickers))).astype(float), index=index, columns=tickers)
+    close.iloc[:120, 2] = np.nan                     # 較晚上市
+    volume.iloc[:120, 2] = np.nan
+    close.iloc[-1, 3] = close.iloc[-2, 3] * 1.06     # 爆量長紅
+    volume.iloc[-1, 3] = volume.iloc[-21:-1, 3].mean() * 3
+    return close.astype("float32"), volume.astype("float32")
+
+
+@pytest.fixture
+def panel(monkeypatch):
+    close, volume = make_panel()
+    monkeypatch.setattr(screener, "load_panel", lambda tickers: (close, volume))
+    indicators.clear_cache()
+    yield close, volume
+    indicators.clear_cache()
+
+
+def single_ticker(close, volume, ticker):
+    df = pd.DataFrame({"Close": close[ticker], "Volume": volume[ticker]}).dropna().astype(float)
+    return df.join(indicators.compute_indicators(ticker, df, (FAST, SLOW)))
+
+
+def test_scan_matches_signal_states(panel):
+    close, volume = panel
+    table, missing = screener.scan(list(close.columns) + ["ZZZ"], FAST, SLOW)
+    assert missing == ["ZZZ"]
+    assert table["代號"].tolist() == list(close.columns)
+    for _, row in table.iterrows():
+        states = core.signal_states(single_ticker(close, volume, row["代號"]), FAST, SLOW)
+        assert (row["趨勢"], row["量能"], row["MACD"], row["RSI 狀態"]) == (states["trend"], states["volume"], states["macd"], states["rsi"])
+        np.testing.assert_allclose([row[f"MA{FAST}"], row[f"MA{SLOW}"], row["量比"], row["MACD 柱"], row["RSI"]],
+                                   [states["ma_fast"], states["ma_slow"], states["volume_ratio"], states["hist"], states["rsi_value"]],
+                                   rtol=1e-4, err_msg=row["代號"])
+
+
+def test_scan_price_change(panel):
+    close, _ = panel
+    table, _ = screener.scan(list(close.columns), FAST, SLOW)
+    close = close.astype(float)
+    np.testing.assert_allclose(table["收盤"], close.iloc[-1].to_numpy())
+    np.testing.assert_allclose(table["漲跌%"], ((close.iloc[-1] / close.iloc[-2] - 1) * 100).to_numpy(), rtol=1e-9)
@@ -0,0 +1,60 @@
+"""交易時段標記：收盤集合競價、日光節約切換、半日市、午休與假日。"""
+import pandas as pd
+import pytest
+
+import sessions
+from sessions import BREAK, CLOSED, POST, PRE, REGULAR
+
+
+def label(ticker, *stamps, tz=None):
+    index = pd.DatetimeIndex([pd.Timestamp(s) for s in stamps])
+    index = index.tz_localize(tz or sessions.exchange_for(ticker).tz)
+    return sessions.label_bars(index, sessions.exchange_for(ticker)).tolist()
+
+
+def test_tw_closing_auction_bar_is_regular():
+    assert label("2330.TW", "2024-05-06 08:55", "2024-05-06 09:00", "2024-05-06 13:25", "2024-05-06 13:30", "2024-05-06 13:35") == \
+        [CLOSED, REGULAR, REGULAR, REGULAR, CLOSED]
+
+
+def test_tw_regular_mask_includes_close():
+    index = pd.date_range("2024-05-06 09:00", "2024-05-06 13:30", freq="5min", tz="Asia/Taipei")
+    assert sessions.regular_mask("2330.TW", index).all()
+
+
+def test_jp_auctions_at_close_and_lunch_are_regular():
+    assert label("7203.T", "2024-05-07 11:30", "2024-05-07 11:35", "2024-05-07 12:30", "2024-05-07 15:30", "2024-05-07 15:35") == \
+        [REGULAR, BREAK, REGULAR, REGULAR, CLOSED]
+
+
+def test_us_close_bar_is_post_market():
+    assert label("TSLA", "2024-05-06 03:55", "2024-05-06 04:00", "2024-05-06 09:25", "2024-05-06 09:30", "2024-05-06 15:55",
+                 "2024-05-06 16:00", "2024-05-06 19:55", "2024-05-06 20:00") == \
+        [CLOSED, PRE, PRE, REGULAR, REGULAR, POST, POST, CLOSED]
+
+
+@pytest.mark.parametrize("day, open_utc", [("2024-03-08", "14:30"), ("2024-03-11", "13:30"),   # 夏令時間開始
+                                           ("2024-11-01", "13:30"), ("2024-11-04", "14:30")])  # 夏令時間結束
+def test_us_open_follows_dst(day, open_utc):
+    before = (pd.Timestamp(f"{day} {open_utc}") - pd.Timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M")
+    assert label("TSLA", before, f"{day} {open_utc}", tz="UTC") == [PRE, REGULAR]
+
+
+def test_us_half_day():
+    assert label("TSLA", "2024-11-29 12:55", "2024-11-29 13:00", "2024-11-29 16:55", "2024-11-29 17:00") == \
+        [REGULAR, POST, POST, CLOSED]
+
+
+def test_us_holiday_and_weekend_are_closed():
+    assert label("TSLA", "2024-07-04 10:00", "2024-05-04 10:00") == [CLOSED, CLOSED]
+
+
+def test_hk_lunch_break():
+    assert label("0700.HK", "2024-05-06 11:55", "2024-05-06 12:00", "2024-05-06 13:00", "2024-05-06 16:00") == \
+        [REGULAR, BREAK, REGULAR, POST]
+
+
+def test_session_table_dst_boundaries():
+    table = sessions.session_table("TSLA", "2024-03-08", "2024-03-11")
+    opens = table["open"].dt.tz_convert("UTC").dt.strftime("%H:%M").tolist()
+    assert opens == ["14:30", "13:30"]